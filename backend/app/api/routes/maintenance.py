@@ -7,6 +7,7 @@ from app.services.maintenance.archive import (
     archive_login_events,
     archive_transactions,
     refresh_daily_transaction_metrics,
+    refresh_sample_tables,
 )
 
 router = APIRouter(prefix="/api/v1/maintenance")
@@ -18,6 +19,11 @@ def refresh_metrics(payload: MaintenanceRefreshRequest, db: Session = Depends(ge
     return APIResponse(success=True, data={"updated": count})
 
 
+@router.post("/refresh-samples", response_model=APIResponse)
+def refresh_samples(db: Session = Depends(get_db)) -> APIResponse:
+    return APIResponse(success=True, data={"sampled": refresh_sample_tables(db)})
+
+
 @router.post("/archive", response_model=APIResponse)
 def archive(payload: MaintenanceArchiveRequest, db: Session = Depends(get_db)) -> APIResponse:
     tx_count = archive_transactions(db, payload.before_date)
@@ -1,16 +1,74 @@
-from fastapi import APIRouter, Depends
-from sqlalchemy.orm import Session
-from app.db.session import get_db
+from fastapi import APIRouter, Depends, Request
+from fastapi.responses import StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.core.config import get_settings
+from app.core.serialization import fast_response
+from app.db.session import get_async_db_analytics
 from app.schemas.common import APIError, APIResponse
-from app.schemas.query import QueryRequest
-from app.services.nl2sql.engine import run_query_pipeline
+from app.schemas.query import QueryBatchRequest, QueryRequest
+from app.services.nl2sql.breaker import get_llm_breaker
+from app.services.nl2sql.cache import get_result_cache
+from app.services.nl2sql.engine import arun_query_batch, arun_query_pipeline, astream_query_pipeline
+from app.services.nl2sql.governor import QueryBudget, QueryRejected, cancel_on_disconnect
 
 router = APIRouter()
 
 
 @router.post("/api/v1/query", response_model=APIResponse)
-def run_query(payload: QueryRequest, db: Session = Depends(get_db)) -> APIResponse:
-    result = run_query_pipeline(db, payload.query, payload.domain)
+async def run_query(request: Request, payload: QueryRequest, db: AsyncSession = Depends(get_async_db_analytics)):
+    if payload.format == "ndjson":
+        result, stream = await astream_query_pipeline(db, payload.query, payload.domain, QueryBudget.from_settings())
+        if stream is not None:
+            return StreamingResponse(stream, media_type="application/x-ndjson")
+    else:
+        budget = QueryBudget.from_settings()
+        columnar = payload.format == "columnar"
+        try:
+            result = await cancel_on_disconnect(
+                arun_query_pipeline(db, payload.query, payload.domain, budget, payload.approximate, columnar),
+                budget,
+                request.is_disconnected,
+            )
+        except QueryRejected as exc:
+            return APIResponse(success=False, error=APIError(code=exc.code, message=exc.message, details=exc.details))
+        if columnar:
+            return fast_response(_result_response(result))
+    return _result_response(result)
+
+
+@router.post("/api/v1/query/batch", response_model=APIResponse)
+async def run_query_batch(payload: QueryBatchRequest) -> APIResponse:
+    max_items = get_settings().query_batch_max_items
+    if len(payload.queries) > max_items:
+        return APIResponse(
+            success=False,
+            error=APIError(code="BATCH_TOO_LARGE", message=f"A batch may contain at most {max_items} queries."),
+        )
+    results, stats = await arun_query_batch([(item.query, item.domain) for item in payload.queries])
+    return APIResponse(
+        success=True,
+        data={"results": [_result_response(result).model_dump() for result in results], "stats": stats},
+    )
+
+
+def _result_response(result) -> APIResponse:
     if result.get("error"):
-        return APIResponse(success=False, error=APIError(code="INVALID_SQL", message=result["error"]))
+        return APIResponse(
+            success=False,
+            error=APIError(
+                code=result.get("error_code", "INVALID_SQL"),
+                message=result["error"],
+                details=result.get("error_details"),
+            ),
+        )
     return APIResponse(success=True, data={"result": result})
+
+
+@router.get("/api/v1/query/llm-breaker", response_model=APIResponse)
+def llm_breaker_status() -> APIResponse:
+    return APIResponse(success=True, data={"breaker": get_llm_breaker().snapshot()})
+
+
+@router.get("/api/v1/query/cache", response_model=APIResponse)
+def query_cache_status() -> APIResponse:
+    return APIResponse(success=True, data={"cache": get_result_cache().stats()})
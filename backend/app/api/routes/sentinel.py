@@ -1,42 +1,87 @@
-import json
-from fastapi import APIRouter, Depends
+from typing import Literal, Optional
+from fastapi import APIRouter, Depends, Header
 from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
 from app.db.session import get_db
+from app.core.serialization import fast_response
 from app.schemas.common import APIError, APIResponse
-from app.services.sentinel.engine import run_scan, run_scan_stream, list_history, get_history
+from app.services.sentinel.broadcast import get_scan_broadcaster
+from app.services.sentinel.engine import convert_findings, run_scan
+from app.services.sentinel.history import list_history, load_scan
+from app.services.sentinel.missions import get_mission_compiler
+from app.services.sentinel.scheduler import get_sentinel_scheduler
 
 router = APIRouter()
 
 
 @router.get("/api/v1/sentinel/scan", response_model=APIResponse)
-def sentinel_scan(domain: str = "general", db: Session = Depends(get_db)) -> APIResponse:
-    result = run_scan(db, domain)
+def sentinel_scan(
+    domain: str = "general",
+    format: Literal["json", "columnar"] = "json",
+    incremental: bool = False,
+    db: Session = Depends(get_db),
+):
+    result = run_scan(db, domain, columnar=format == "columnar", incremental=incremental)
+    if format == "columnar":
+        return fast_response(APIResponse(success=True, data=result))
     return APIResponse(success=True, data=result)
 
 
 @router.get("/api/v1/sentinel/scan/stream")
-def sentinel_scan_stream(domain: str = "general", db: Session = Depends(get_db)) -> StreamingResponse:
+def sentinel_scan_stream(
+    domain: str = "general",
+    format: Literal["json", "columnar"] = "json",
+    incremental: bool = False,
+    last_event_id: Optional[str] = Header(default=None, alias="Last-Event-ID"),
+) -> StreamingResponse:
+    broadcaster = get_scan_broadcaster()
+    # Reconnects pick up after the last event they saw; everyone else shares the scan already running
+    resumed = broadcaster.resume(last_event_id)
+    if resumed is not None:
+        broadcast, after = resumed
+    else:
+        broadcast, after = broadcaster.join(domain, columnar=format == "columnar", incremental=incremental), -1
+
     def event_stream():
-        for event, payload in run_scan_stream(db, domain):
-            yield f"event: {event}\ndata: {json.dumps(payload)}\n\n"
+        yield b"retry: 3000\n\n"
+        yield from broadcast.follow(after)
+
+    return StreamingResponse(event_stream(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
 
-    return StreamingResponse(event_stream(), media_type="text/event-stream")
+@router.get("/api/v1/sentinel/missions/compiled", response_model=APIResponse)
+def sentinel_compiled_missions() -> APIResponse:
+    return APIResponse(success=True, data={"missions": get_mission_compiler().stats()})
 
 
 @router.get("/api/v1/sentinel/history", response_model=APIResponse)
-def sentinel_history(db: Session = Depends(get_db)) -> APIResponse:
-    history = list_history(db)
+def sentinel_history(
+    limit: Optional[int] = None, before: Optional[int] = None, db: Session = Depends(get_db)
+) -> APIResponse:
+    history, next_cursor = list_history(db, limit, before)
     data = [
         {"scan_id": h.scan_id, "domain": h.domain, "status": h.status, "risk_score": h.risk_score, "created_at": str(h.created_at)}
         for h in history
     ]
-    return APIResponse(success=True, data={"history": data})
+    return APIResponse(success=True, data={"history": data, "next_cursor": next_cursor})
 
 
 @router.get("/api/v1/sentinel/history/{scan_id}", response_model=APIResponse)
-def sentinel_history_detail(scan_id: str, db: Session = Depends(get_db)) -> APIResponse:
-    record = get_history(db, scan_id)
-    if record is None:
+def sentinel_history_detail(
+    scan_id: str, format: Literal["json", "columnar"] = "json", db: Session = Depends(get_db)
+):
+    scan = load_scan(db, scan_id)
+    if scan is None:
         return APIResponse(success=False, error=APIError(code="NOT_FOUND", message="Scan not found"))
-    return APIResponse(success=True, data=json.loads(record.result_json))
+    result = convert_findings(scan, columnar=format == "columnar")
+    if format == "columnar":
+        return fast_response(APIResponse(success=True, data=result))
+    return APIResponse(success=True, data=result)
+
+
+@router.get("/api/v1/sentinel/scheduler", response_model=APIResponse)
+def sentinel_scheduler_status() -> APIResponse:
+    scheduler = get_sentinel_scheduler()
+    if scheduler is None:
+        return APIResponse(success=True, data={"enabled": False, "domains": {}})
+    return APIResponse(success=True, data={"enabled": True, "domains": scheduler.snapshot()})
@@ -18,6 +18,35 @@ class Settings(BaseSettings):
         default="sqlite:///./data/deriveinsights_dashboard.db",
         validation_alias="DASHBOARDS_DATABASE_URL",
     )
+    analytics_database_url: str | None = Field(default=None, validation_alias="ANALYTICS_DATABASE_URL")
+    analytics_pool_size: int | None = Field(default=None, validation_alias="ANALYTICS_POOL_SIZE")
+    analytics_sqlite_mmap_bytes: int = Field(default=256 * 1024 * 1024, validation_alias="ANALYTICS_SQLITE_MMAP_BYTES")
+    analytics_sqlite_cache_kib: int = Field(default=65536, validation_alias="ANALYTICS_SQLITE_CACHE_KIB")
+    sentinel_mission_concurrency: int = Field(default=4, validation_alias="SENTINEL_MISSION_CONCURRENCY")
+    sentinel_fuse_missions: bool = Field(default=True, validation_alias="SENTINEL_FUSE_MISSIONS")
+    sentinel_sample_rows: int = Field(default=10, validation_alias="SENTINEL_SAMPLE_ROWS")
+    sentinel_mission_llm_ttl_seconds: float = Field(default=60.0, validation_alias="SENTINEL_MISSION_LLM_TTL_SECONDS")
+    sentinel_rebaseline_minutes: int = Field(default=60, validation_alias="SENTINEL_REBASELINE_MINUTES")
+    sentinel_history_rows: int = Field(default=25, validation_alias="SENTINEL_HISTORY_ROWS")
+    sentinel_history_page_size: int = Field(default=50, validation_alias="SENTINEL_HISTORY_PAGE_SIZE")
+    sentinel_stream_heartbeat_seconds: float = Field(default=15.0, validation_alias="SENTINEL_STREAM_HEARTBEAT_SECONDS")
+    sentinel_stream_retention_seconds: float = Field(default=300.0, validation_alias="SENTINEL_STREAM_RETENTION_SECONDS")
+    sentinel_stream_max_backlog: int = Field(default=256, validation_alias="SENTINEL_STREAM_MAX_BACKLOG")
+    sentinel_correlation_window_minutes: int = Field(default=30, validation_alias="SENTINEL_CORRELATION_WINDOW_MINUTES")
+    sentinel_correlation_lookback_hours: int = Field(default=168, validation_alias="SENTINEL_CORRELATION_LOOKBACK_HOURS")
+    sentinel_correlation_batch_size: int = Field(default=500, validation_alias="SENTINEL_CORRELATION_BATCH_SIZE")
+    sentinel_scheduler_enabled: bool = Field(default=False, validation_alias="SENTINEL_SCHEDULER_ENABLED")
+    sentinel_scheduler_domains: str = Field(
+        default="security,risk,operations,compliance", validation_alias="SENTINEL_SCHEDULER_DOMAINS"
+    )
+    sentinel_scheduler_concurrency: int = Field(default=2, validation_alias="SENTINEL_SCHEDULER_CONCURRENCY")
+    sentinel_scheduler_debounce_seconds: float = Field(default=2.0, validation_alias="SENTINEL_SCHEDULER_DEBOUNCE_SECONDS")
+    sentinel_scheduler_min_interval_seconds: float = Field(
+        default=10.0, validation_alias="SENTINEL_SCHEDULER_MIN_INTERVAL_SECONDS"
+    )
+    sentinel_scheduler_max_interval_seconds: float = Field(
+        default=900.0, validation_alias="SENTINEL_SCHEDULER_MAX_INTERVAL_SECONDS"
+    )
     cors_origins: str = Field(default="http://localhost:5173", validation_alias="CORS_ORIGINS")
     maintenance_enabled: bool = Field(default=True, validation_alias="MAINTENANCE_ENABLED")
     maintenance_interval_minutes: int = Field(default=15, validation_alias="MAINTENANCE_INTERVAL_MINUTES")
@@ -25,10 +54,41 @@ class Settings(BaseSettings):
     ingestion_interval_minutes: int = Field(default=10, validation_alias="INGESTION_INTERVAL_MINUTES")
 
     nl2sql_mode: str = Field(default="llm", validation_alias="NL2SQL_MODE")
+    nl2sql_hedge_deadline_ms: int = Field(default=1500, validation_alias="NL2SQL_HEDGE_DEADLINE_MS")
+    query_cache_enabled: bool = Field(default=True, validation_alias="QUERY_CACHE_ENABLED")
+    query_cache_max_bytes: int = Field(default=64 * 1024 * 1024, validation_alias="QUERY_CACHE_MAX_BYTES")
+    query_cache_ttl_seconds: float = Field(default=300.0, validation_alias="QUERY_CACHE_TTL_SECONDS")
+    query_stream_batch_size: int = Field(default=500, validation_alias="QUERY_STREAM_BATCH_SIZE")
+    query_timeout_ms: int = Field(default=15000, validation_alias="QUERY_TIMEOUT_MS")
+    query_max_rows: int = Field(default=10000, validation_alias="QUERY_MAX_ROWS")
+    query_max_bytes: int = Field(default=16 * 1024 * 1024, validation_alias="QUERY_MAX_BYTES")
+    query_batch_max_items: int = Field(default=50, validation_alias="QUERY_BATCH_MAX_ITEMS")
+    query_batch_concurrency: int = Field(default=8, validation_alias="QUERY_BATCH_CONCURRENCY")
+    query_rollups_enabled: bool = Field(default=True, validation_alias="QUERY_ROLLUPS_ENABLED")
+    query_sample_fraction: float = Field(default=0.01, validation_alias="QUERY_SAMPLE_FRACTION")
+    query_sample_min_stratum_rows: int = Field(default=30, validation_alias="QUERY_SAMPLE_MIN_STRATUM_ROWS")
+    query_approximate_confidence: float = Field(default=0.95, validation_alias="QUERY_APPROXIMATE_CONFIDENCE")
+    insights_time_budget_ms: float = Field(default=5.0, validation_alias="INSIGHTS_TIME_BUDGET_MS")
+    insights_sample_rows: int = Field(default=2000, validation_alias="INSIGHTS_SAMPLE_ROWS")
+    insights_top_k: int = Field(default=5, validation_alias="INSIGHTS_TOP_K")
+    insights_outlier_z: float = Field(default=3.0, validation_alias="INSIGHTS_OUTLIER_Z")
+    query_plan_policy: str = Field(default="warn", validation_alias="QUERY_PLAN_POLICY")
+    query_plan_large_table_rows: int = Field(default=100000, validation_alias="QUERY_PLAN_LARGE_TABLE_ROWS")
+    query_plan_rewrite_limit: int = Field(default=1000, validation_alias="QUERY_PLAN_REWRITE_LIMIT")
     llm_provider: str = Field(default="gemini", validation_alias="LLM_PROVIDER")
     llm_model: str = Field(default="gemini-2.0-flash", validation_alias="LLM_MODEL")
     openai_api_key: str | None = Field(default=None, validation_alias="OPENAI_API_KEY")
     gemini_api_key: str | None = Field(default=None, validation_alias="GEMINI_API_KEY")
+    llm_fake_fixtures_path: str | None = Field(default=None, validation_alias="LLM_FAKE_FIXTURES_PATH")
+    llm_fake_latency_ms: float = Field(default=0.0, validation_alias="LLM_FAKE_LATENCY_MS")
+    llm_fake_failure_rate: float = Field(default=0.0, validation_alias="LLM_FAKE_FAILURE_RATE")
+    llm_fake_seed: int = Field(default=0, validation_alias="LLM_FAKE_SEED")
+    llm_timeout_seconds: float = Field(default=8.0, validation_alias="LLM_TIMEOUT_SECONDS")
+    llm_breaker_failure_threshold: int = Field(default=3, validation_alias="LLM_BREAKER_FAILURE_THRESHOLD")
+    llm_breaker_cooldown_seconds: float = Field(default=30.0, validation_alias="LLM_BREAKER_COOLDOWN_SECONDS")
+    llm_schema_token_budget: int = Field(default=400, validation_alias="LLM_SCHEMA_TOKEN_BUDGET")
+    llm_schema_max_tables: int = Field(default=4, validation_alias="LLM_SCHEMA_MAX_TABLES")
+    llm_schema_include_operational: bool = Field(default=False, validation_alias="LLM_SCHEMA_INCLUDE_OPERATIONAL")
 
     @property
     def cors_origin_list(self) -> List[str]:
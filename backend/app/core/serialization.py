@@ -0,0 +1,33 @@
+import json
+from typing import Any
+from fastapi.responses import Response
+from app.schemas.common import APIResponse
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def dumps(payload: Any) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(payload, default=str, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(payload, default=str, separators=(",", ":")).encode("utf-8")
+
+
+class FastJSONResponse(Response):
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+
+def fast_response(response: APIResponse) -> FastJSONResponse:
+    # The payload is already plain data, so it skips model_dump and goes straight to the encoder
+    return FastJSONResponse(
+        {
+            "success": response.success,
+            "data": response.data,
+            "error": response.error.model_dump() if response.error else None,
+        }
+    )
@@ -9,10 +9,10 @@ from app.db.session import (
 from app.models.base import Base
 from app.models.demo import User, Transaction, LoginEvent
 from app.models.alerts import Metric, Event, AlertHistory, AnomalyHistory
-from app.models.sentinel import ScanHistory
+from app.models.sentinel import ScanFinding, ScanHistory, SentinelEntityCount, SentinelMissionState
 from app.models.dashboard import Dashboard
 from app.models.ingestion import DataCenter, IngestionRun, SchemaRegistry, DataCenterSource
-from app.models.analytics import DailyTransactionMetric
+from app.models.analytics import DailyTransactionMetric, LoginEventSample, TransactionSample
 from app.models.archive import TransactionArchive, LoginEventArchive
 
 
@@ -36,7 +36,12 @@ def init_db(database_url: str) -> None:
         Base.metadata.tables["transactions_archive"],
         Base.metadata.tables["login_events_archive"],
         Base.metadata.tables["daily_transaction_metrics"],
+        Base.metadata.tables["transactions_sample"],
+        Base.metadata.tables["login_events_sample"],
         Base.metadata.tables["scan_history"],
+        Base.metadata.tables["scan_findings"],
+        Base.metadata.tables["sentinel_mission_state"],
+        Base.metadata.tables["sentinel_entity_counts"],
         Base.metadata.tables["data_centers"],
         Base.metadata.tables["ingestion_runs"],
         Base.metadata.tables["schema_registry"],
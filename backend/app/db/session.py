@@ -1,7 +1,11 @@
+import importlib.util
 import os
 from sqlalchemy import create_engine, event
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 from app.core.config import get_settings
+from app.db import versions  # noqa: F401  (registers commit hooks that bump table versions)
 
 settings = get_settings()
 
@@ -16,6 +20,35 @@ def _ensure_sqlite_dir(database_url: str) -> None:
             os.makedirs(db_dir, exist_ok=True)
 
 
+def _register_sqlite_pragmas(engine) -> None:
+    @event.listens_for(engine, "connect")
+    def _set_sqlite_pragmas(dbapi_connection, connection_record):  # type: ignore[no-redef]
+        cursor = dbapi_connection.cursor()
+        try:
+            cursor.execute("PRAGMA foreign_keys=ON;")
+            cursor.execute("PRAGMA journal_mode=WAL;")
+            cursor.execute("PRAGMA synchronous=NORMAL;")
+            cursor.execute("PRAGMA temp_store=MEMORY;")
+            cursor.execute("PRAGMA cache_size=-20000;")
+        finally:
+            cursor.close()
+
+
+def _register_sqlite_read_only_pragmas(engine) -> None:
+    @event.listens_for(engine, "connect")
+    def _set_read_only_pragmas(dbapi_connection, connection_record):  # type: ignore[no-redef]
+        cursor = dbapi_connection.cursor()
+        try:
+            # WAL readers never block the writer; query_only guards against accidental writes
+            cursor.execute("PRAGMA journal_mode=WAL;")
+            cursor.execute("PRAGMA query_only=ON;")
+            cursor.execute("PRAGMA temp_store=MEMORY;")
+            cursor.execute(f"PRAGMA mmap_size={int(settings.analytics_sqlite_mmap_bytes)};")
+            cursor.execute(f"PRAGMA cache_size=-{int(settings.analytics_sqlite_cache_kib)};")
+        finally:
+            cursor.close()
+
+
 def _make_engine(database_url: str):
     connect_args = {}
     if database_url.startswith("sqlite"):
@@ -23,27 +56,75 @@ def _make_engine(database_url: str):
         _ensure_sqlite_dir(database_url)
     engine = create_engine(database_url, connect_args=connect_args, future=True)
     if database_url.startswith("sqlite"):
-        @event.listens_for(engine, "connect")
-        def _set_sqlite_pragmas(dbapi_connection, connection_record):  # type: ignore[no-redef]
-            cursor = dbapi_connection.cursor()
-            try:
-                cursor.execute("PRAGMA foreign_keys=ON;")
-                cursor.execute("PRAGMA journal_mode=WAL;")
-                cursor.execute("PRAGMA synchronous=NORMAL;")
-                cursor.execute("PRAGMA temp_store=MEMORY;")
-                cursor.execute("PRAGMA cache_size=-20000;")
-            finally:
-                cursor.close()
+        _register_sqlite_pragmas(engine)
+    return engine
+
+
+_ASYNC_DRIVERS = {"postgresql": "asyncpg", "mysql": "aiomysql"}
+_SYNC_DRIVERS = {"psycopg2", "pymysql", "mysqldb"}
+
+
+def _async_database_url(database_url: str) -> str:
+    if database_url.startswith("sqlite:"):
+        return database_url.replace("sqlite:", "sqlite+aiosqlite:", 1)
+    scheme, _, rest = database_url.partition(":")
+    dialect, _, driver = scheme.partition("+")
+    if dialect not in _ASYNC_DRIVERS or (driver and driver not in _SYNC_DRIVERS):
+        return database_url
+    async_driver = _ASYNC_DRIVERS[dialect]
+    # The async driver is optional, so a missing one is reported at startup instead of on the first query
+    if importlib.util.find_spec(async_driver) is None:
+        raise RuntimeError(
+            f"The analytics engine needs the '{async_driver}' package for {dialect} databases; "
+            f"install it with 'pip install {async_driver}' or set ANALYTICS_DATABASE_URL to a supported database."
+        )
+    return f"{dialect}+{async_driver}:{rest}"
+
+
+def _make_analytics_sync_engine():
+    database_url = settings.analytics_database_url or settings.database_url
+    pool_size = settings.analytics_pool_size or os.cpu_count() or 4
+    connect_args = {}
+    if database_url.startswith("sqlite"):
+        connect_args = {"check_same_thread": False}
+        _ensure_sqlite_dir(database_url)
+    engine = create_engine(
+        database_url, connect_args=connect_args, pool_size=pool_size, max_overflow=pool_size, future=True
+    )
+    if database_url.startswith("sqlite"):
+        _register_sqlite_read_only_pragmas(engine)
+    return engine
+
+
+def _make_analytics_engine():
+    database_url = settings.analytics_database_url or settings.database_url
+    pool_size = settings.analytics_pool_size or os.cpu_count() or 4
+    if database_url.startswith("sqlite"):
+        _ensure_sqlite_dir(database_url)
+    # aiosqlite defaults to NullPool; pooled readers keep their page cache and mmap between queries
+    engine = create_async_engine(
+        _async_database_url(database_url),
+        poolclass=AsyncAdaptedQueuePool,
+        pool_size=pool_size,
+        max_overflow=pool_size,
+        future=True,
+    )
+    if database_url.startswith("sqlite"):
+        _register_sqlite_read_only_pragmas(engine.sync_engine)
     return engine
 
 
 engine_primary = _make_engine(settings.database_url)
 engine_alerts = _make_engine(settings.alerts_database_url)
 engine_dashboards = _make_engine(settings.dashboards_database_url)
+engine_analytics = _make_analytics_sync_engine()
+engine_analytics_async = _make_analytics_engine()
 
 SessionLocalPrimary = sessionmaker(bind=engine_primary, autoflush=False, autocommit=False, future=True)
 SessionLocalAlerts = sessionmaker(bind=engine_alerts, autoflush=False, autocommit=False, future=True)
 SessionLocalDashboards = sessionmaker(bind=engine_dashboards, autoflush=False, autocommit=False, future=True)
+SessionLocalAnalytics = sessionmaker(bind=engine_analytics, autoflush=False, autocommit=False, future=True)
+AsyncSessionLocalAnalytics = async_sessionmaker(bind=engine_analytics_async, autoflush=False, expire_on_commit=False)
 
 
 def get_db_primary():
@@ -54,6 +135,11 @@ def get_db_primary():
         db.close()
 
 
+async def get_async_db_analytics():
+    async with AsyncSessionLocalAnalytics() as db:
+        yield db
+
+
 def get_db_alerts():
     db = SessionLocalAlerts()
     try:
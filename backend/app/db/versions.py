@@ -0,0 +1,98 @@
+import re
+import threading
+from typing import Callable, Dict, FrozenSet, Iterable, List, Tuple
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.pool import Pool
+
+# Versions live in this process only. Writes from other workers or processes are not seen,
+# so cached results there are bounded by QUERY_CACHE_TTL_SECONDS instead.
+_lock = threading.Lock()
+_versions: Dict[str, int] = {}
+_derived_from: Dict[str, Tuple[Tuple[str, int], ...]] = {}
+_subscribers: List[Callable[[FrozenSet[str]], None]] = []
+
+
+def subscribe_table_changes(callback: Callable[[FrozenSet[str]], None]) -> None:
+    with _lock:
+        _subscribers.append(callback)
+
+
+def unsubscribe_table_changes(callback: Callable[[FrozenSet[str]], None]) -> None:
+    with _lock:
+        if callback in _subscribers:
+            _subscribers.remove(callback)
+
+
+def bump_table_versions(tables: Iterable[str]) -> None:
+    changed = frozenset(tables)
+    with _lock:
+        for table in changed:
+            _versions[table] = _versions.get(table, 0) + 1
+        subscribers = list(_subscribers)
+    # Callbacks run on the committing thread, outside the lock, and must only hand the change off
+    for callback in subscribers:
+        callback(changed)
+
+
+def get_table_versions(tables: Iterable[str]) -> Tuple[Tuple[str, int], ...]:
+    with _lock:
+        return tuple((table, _versions.get(table, 0)) for table in sorted(set(tables)))
+
+
+def mark_derived_fresh(table: str, source_versions: Tuple[Tuple[str, int], ...]) -> None:
+    # Source versions must be read before the derived table is rebuilt so a concurrent write leaves it stale
+    with _lock:
+        _derived_from[table] = source_versions
+
+
+def is_derived_fresh(table: str, source_tables: Iterable[str]) -> bool:
+    current = get_table_versions(source_tables)
+    with _lock:
+        return _derived_from.get(table) == current
+
+
+# Matches the target of INSERT/REPLACE/UPDATE/DELETE, whether compiled from ORM, Core or text()
+_DML = re.compile(
+    r"^\s*(?:INSERT(?:\s+OR\s+\w+)?\s+INTO|REPLACE\s+INTO|UPDATE(?:\s+OR\s+\w+)?|DELETE\s+FROM)\s+"
+    r"(?:[`\"\[]?\w+[`\"\]]?\.)?[`\"\[]?(\w+)",
+    re.IGNORECASE,
+)
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _collect_written_tables(conn, cursor, statement, parameters, context, executemany) -> None:
+    match = _DML.match(statement)
+    if match:
+        conn.info.setdefault("pending_version_tables", set()).add(match.group(1).lower())
+
+
+@event.listens_for(Engine, "commit")
+def _stage_committed_tables(conn) -> None:
+    # This fires before the database commits; bumping now would let a reader cache the old rows
+    # under the new version, so the bump waits for checkin or the connection's next transaction
+    pending = conn.info.pop("pending_version_tables", None)
+    if pending:
+        conn.info.setdefault("committed_version_tables", set()).update(pending)
+
+
+@event.listens_for(Engine, "rollback")
+def _discard_pending_tables(conn) -> None:
+    conn.info.pop("pending_version_tables", None)
+
+
+def _bump_committed(info: Dict) -> None:
+    committed = info.pop("committed_version_tables", None)
+    if committed:
+        bump_table_versions(committed)
+
+
+@event.listens_for(Engine, "begin")
+def _bump_on_begin(conn) -> None:
+    _bump_committed(conn.info)
+
+
+@event.listens_for(Pool, "checkin")
+def _bump_on_checkin(dbapi_connection, connection_record) -> None:
+    if connection_record is not None:
+        _bump_committed(connection_record.info)
@@ -4,8 +4,10 @@ from app.api.router import router
 from app.core.config import get_settings
 from app.core.logging import configure_logging
 from app.db.init_db import init_db
+from app.db.session import engine_analytics, engine_analytics_async
 from app.services.maintenance.scheduler import start_scheduler, stop_scheduler
 from app.services.ingestion.scheduler import start_ingestion_scheduler, stop_ingestion_scheduler
+from app.services.sentinel.scheduler import start_sentinel_scheduler, stop_sentinel_scheduler
 
 settings = get_settings()
 
@@ -35,9 +37,13 @@ def startup() -> None:
     init_db(settings.database_url)
     start_scheduler()
     start_ingestion_scheduler()
+    start_sentinel_scheduler()
 
 
 @app.on_event("shutdown")
-def shutdown() -> None:
+async def shutdown() -> None:
     stop_scheduler()
     stop_ingestion_scheduler()
+    stop_sentinel_scheduler()
+    engine_analytics.dispose()
+    await engine_analytics_async.dispose()
@@ -15,3 +15,42 @@ class DailyTransactionMetric(Base):
     transaction_count: Mapped[int] = mapped_column(Integer, default=0)
     flagged_count: Mapped[int] = mapped_column(Integer, default=0)
     created_at: Mapped[str] = mapped_column(DateTime(timezone=True), server_default=func.now())
+
+
+class TransactionSample(Base):
+    __tablename__ = "transactions_sample"
+    __table_args__ = (
+        Index("ix_transactions_sample_stratum", "stratum"),
+    )
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=False)
+    stratum: Mapped[str] = mapped_column(String(10))
+    stratum_rows: Mapped[int] = mapped_column(Integer)
+    user_id: Mapped[int] = mapped_column(Integer)
+    amount: Mapped[float] = mapped_column(Float)
+    currency: Mapped[str] = mapped_column(String(10))
+    status: Mapped[str] = mapped_column(String(30))
+    created_at: Mapped[str] = mapped_column(DateTime(timezone=True))
+
+
+class LoginEventSample(Base):
+    __tablename__ = "login_events_sample"
+    __table_args__ = (
+        Index("ix_login_events_sample_stratum", "stratum"),
+    )
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=False)
+    stratum: Mapped[str] = mapped_column(String(10))
+    stratum_rows: Mapped[int] = mapped_column(Integer)
+    user_id: Mapped[int] = mapped_column(Integer)
+    ip_address: Mapped[str] = mapped_column(String(45))
+    success: Mapped[int] = mapped_column(Integer)
+    created_at: Mapped[str] = mapped_column(DateTime(timezone=True))
+
+
+# Source table -> stratified sample kept by maintenance; strata are calendar days of created_at
+SAMPLED_TABLES = {
+    "transactions": TransactionSample,
+    "login_events": LoginEventSample,
+}
+SAMPLE_STRATUM_COLUMNS = ("stratum", "stratum_rows")
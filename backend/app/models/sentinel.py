@@ -1,4 +1,4 @@
-from sqlalchemy import DateTime, Integer, String, Text, func, Index
+from sqlalchemy import DateTime, Integer, LargeBinary, String, Text, func, Index
 from sqlalchemy.orm import Mapped, mapped_column
 from app.models.base import Base
 
@@ -17,3 +17,49 @@ class ScanHistory(Base):
     risk_score: Mapped[int] = mapped_column(Integer, default=0)
     result_json: Mapped[str] = mapped_column(Text, default="{}")
     created_at: Mapped[str] = mapped_column(DateTime(timezone=True), server_default=func.now())
+
+
+class ScanFinding(Base):
+    __tablename__ = "scan_findings"
+    __table_args__ = (
+        Index("ix_scan_findings_scan_id", "scan_id"),
+        Index("ix_scan_findings_domain_mission", "domain", "mission_id", "encoding", "id"),
+    )
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    scan_id: Mapped[str] = mapped_column(String(64))
+    domain: Mapped[str] = mapped_column(String(50))
+    position: Mapped[int] = mapped_column(Integer, default=0)
+    mission_id: Mapped[str] = mapped_column(String(100))
+    status: Mapped[str] = mapped_column(String(30), default="completed")
+    risk: Mapped[int] = mapped_column(Integer, default=0)
+    row_count: Mapped[int] = mapped_column(Integer, default=0)
+    encoding: Mapped[str] = mapped_column(String(10), default="full")
+    base_id: Mapped[int | None] = mapped_column(Integer, nullable=True)
+    payload: Mapped[bytes] = mapped_column(LargeBinary)
+    created_at: Mapped[str] = mapped_column(DateTime(timezone=True), server_default=func.now())
+
+
+class SentinelMissionState(Base):
+    __tablename__ = "sentinel_mission_state"
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    mission_id: Mapped[str] = mapped_column(String(100), unique=True)
+    query: Mapped[str] = mapped_column(Text, default="")
+    watermark_id: Mapped[int] = mapped_column(Integer, default=0)
+    match_count: Mapped[int] = mapped_column(Integer, default=0)
+    baseline_at: Mapped[str | None] = mapped_column(DateTime(timezone=True), nullable=True)
+    updated_at: Mapped[str] = mapped_column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+
+class SentinelEntityCount(Base):
+    __tablename__ = "sentinel_entity_counts"
+    __table_args__ = (
+        Index("ix_sentinel_entity_counts_mission_entity", "mission_id", "entity", unique=True),
+        Index("ix_sentinel_entity_counts_mission_count", "mission_id", "count"),
+    )
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    mission_id: Mapped[str] = mapped_column(String(100))
+    entity: Mapped[str] = mapped_column(String(100))
+    count: Mapped[int] = mapped_column(Integer, default=0)
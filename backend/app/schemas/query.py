@@ -1,10 +1,21 @@
-from typing import Any, Dict, List, Optional
+from typing import Any, Dict, List, Literal, Optional
 from pydantic import BaseModel, Field
 
 
 class QueryRequest(BaseModel):
     query: str = Field(..., min_length=1)
     domain: Optional[str] = None
+    format: Literal["json", "ndjson", "columnar"] = "json"
+    approximate: bool = False
+
+
+class QueryBatchItem(BaseModel):
+    query: str = Field(..., min_length=1)
+    domain: Optional[str] = None
+
+
+class QueryBatchRequest(BaseModel):
+    queries: List[QueryBatchItem] = Field(..., min_length=1)
 
 
 class QueryResult(BaseModel):
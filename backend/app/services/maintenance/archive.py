@@ -1,6 +1,9 @@
-from typing import Optional
+from typing import Dict, Optional
 from sqlalchemy import text
 from sqlalchemy.orm import Session
+from app.core.config import get_settings
+from app.db.versions import bump_table_versions, get_table_versions, mark_derived_fresh
+from app.models.analytics import SAMPLE_STRATUM_COLUMNS, SAMPLED_TABLES
 
 
 def archive_transactions(db: Session, before_date: str) -> int:
@@ -21,6 +24,7 @@ def archive_transactions(db: Session, before_date: str) -> int:
     db.execute(insert_sql, {"before_date": before_date})
     result = db.execute(delete_sql, {"before_date": before_date})
     db.commit()
+    bump_table_versions(["transactions", "transactions_archive"])
     return result.rowcount or 0
 
 
@@ -42,6 +46,7 @@ def archive_login_events(db: Session, before_date: str) -> int:
     db.execute(insert_sql, {"before_date": before_date})
     result = db.execute(delete_sql, {"before_date": before_date})
     db.commit()
+    bump_table_versions(["login_events", "login_events_archive"])
     return result.rowcount or 0
 
 
@@ -69,6 +74,64 @@ def refresh_daily_transaction_metrics(db: Session, start_date: Optional[str] = N
             flagged_count = excluded.flagged_count
         """
     )
+    source_versions = get_table_versions(["transactions"])
     result = db.execute(sql, params)
+    if not params:
+        # Days before the oldest raw row keep their archived history; later days with no rows are gone
+        db.execute(
+            text(
+                """
+                DELETE FROM daily_transaction_metrics
+                WHERE date >= (SELECT MIN(substr(created_at, 1, 10)) FROM transactions)
+                  AND date NOT IN (SELECT DISTINCT substr(created_at, 1, 10) FROM transactions)
+                """
+            )
+        )
     db.commit()
+    bump_table_versions(["daily_transaction_metrics"])
+    if not params:
+        mark_derived_fresh("daily_transaction_metrics", source_versions)
     return result.rowcount or 0
+
+
+def refresh_sample_tables(
+    db: Session, fraction: Optional[float] = None, min_stratum_rows: Optional[int] = None
+) -> Dict[str, int]:
+    settings = get_settings()
+    params = {
+        "fraction": settings.query_sample_fraction if fraction is None else fraction,
+        "min_rows": settings.query_sample_min_stratum_rows if min_stratum_rows is None else min_stratum_rows,
+    }
+    counts: Dict[str, int] = {}
+    for source, model in SAMPLED_TABLES.items():
+        sample = model.__tablename__
+        columns = ", ".join(
+            column.name for column in model.__table__.columns if column.name not in SAMPLE_STRATUM_COLUMNS
+        )
+        # Each day is sampled on its own so quiet days keep enough rows to bound their error
+        sql = text(
+            f"""
+            INSERT INTO {sample} (stratum, stratum_rows, {columns})
+            SELECT stratum, stratum_rows, {columns}
+            FROM (
+                SELECT
+                    {columns},
+                    substr(created_at, 1, 10) AS stratum,
+                    COUNT(*) OVER (PARTITION BY substr(created_at, 1, 10)) AS stratum_rows,
+                    ROW_NUMBER() OVER (PARTITION BY substr(created_at, 1, 10) ORDER BY random()) AS pick
+                FROM {source}
+            ) AS ranked
+            WHERE pick <= CASE
+                WHEN stratum_rows * :fraction > :min_rows THEN stratum_rows * :fraction
+                ELSE :min_rows
+            END
+            """
+        )
+        source_versions = get_table_versions([source])
+        db.execute(text(f"DELETE FROM {sample}"))
+        result = db.execute(sql, params)
+        db.commit()
+        bump_table_versions([sample])
+        mark_derived_fresh(sample, source_versions)
+        counts[sample] = result.rowcount or 0
+    return counts
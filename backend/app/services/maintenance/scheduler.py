@@ -3,7 +3,7 @@ import logging
 from typing import Optional
 from app.core.config import get_settings
 from app.db.session import SessionLocalPrimary
-from app.services.maintenance.archive import refresh_daily_transaction_metrics
+from app.services.maintenance.archive import refresh_daily_transaction_metrics, refresh_sample_tables
 
 logger = logging.getLogger(__name__)
 
@@ -15,7 +15,9 @@ async def _run_scheduler(interval_minutes: int) -> None:
         try:
             with SessionLocalPrimary() as session:
                 refresh_daily_transaction_metrics(session)
+                refresh_sample_tables(session)
             logger.info("maintenance.refresh_daily_transaction_metrics completed")
+            logger.info("maintenance.refresh_sample_tables completed")
         except Exception as exc:
             logger.exception("maintenance scheduler error: %s", exc)
         await asyncio.sleep(interval_minutes * 60)
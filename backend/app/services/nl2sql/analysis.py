@@ -0,0 +1,130 @@
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+import sqlglot
+from sqlglot import exp
+
+_CACHE_SIZE = 2048
+_BANNED = (exp.Insert, exp.Update, exp.Delete, exp.Drop, exp.AlterTable, exp.TruncateTable)
+# Later matches win, mirroring how the result insights pick the aggregate to report
+_INTENTS = ((exp.Count, "count"), (exp.Sum, "sum"), (exp.Avg, "avg"))
+
+
+class SQLAnalysis:
+    def __init__(self, sql: str, statements: Optional[List[Optional[exp.Expression]]]) -> None:
+        self.sql = sql
+        self.parsed = statements is not None
+        self.statement_count = len(statements) if statements is not None else 0
+        # The AST is shared between callers and must not be mutated; copy before rewriting
+        self.expression = statements[0] if statements else None
+        self.read_only = self._is_read_only()
+        self.tables: Tuple[str, ...] = ()
+        self.normalized_sql: Optional[str] = None
+        self.intent = "list"
+        self.group_by: Optional[str] = None
+        if self.expression is not None:
+            self.tables = tuple(sorted({table.name for table in self.expression.find_all(exp.Table)}))
+            self.normalized_sql = self.expression.sql()
+            self.intent = self._intent()
+            self.group_by = self._group_by()
+
+    @property
+    def single_statement(self) -> bool:
+        return self.parsed and self.statement_count == 1
+
+    @property
+    def has_limit(self) -> bool:
+        return self.expression is not None and bool(self.expression.args.get("limit"))
+
+    @property
+    def is_listing(self) -> bool:
+        # Only a plain row listing stops reading early at a LIMIT; aggregates, groups and windows still see every row
+        if not isinstance(self.expression, exp.Select):
+            return False
+        return self.expression.find(exp.AggFunc, exp.Group, exp.Distinct, exp.Window) is None
+
+    def error(self) -> Optional[str]:
+        if not self.single_statement:
+            return "Only a single SQL statement is allowed."
+        if not self.read_only:
+            return "SQL must be read-only (SELECT statements only)."
+        return None
+
+    def meta(self) -> Dict[str, Any]:
+        return {"intent": self.intent, "group_by": self.group_by}
+
+    def with_limit(self, limit: int) -> Optional[str]:
+        if self.expression is None:
+            return None
+        if not isinstance(self.expression, exp.Select) or self.has_limit:
+            return self.normalized_sql
+        expression = self.expression.limit(limit, copy=True)
+        sql = expression.sql()
+        # The rewritten statement is validated next; seed the cache so that is not another parse
+        _remember(SQLAnalysis(sql, [expression]))
+        return sql
+
+    def _is_read_only(self) -> bool:
+        if not isinstance(self.expression, exp.Select):
+            return False
+        return not self.expression.find(*_BANNED)
+
+    def _intent(self) -> str:
+        intent = "list"
+        for node_type, name in _INTENTS:
+            if self.expression.find(node_type):
+                intent = name
+        return intent
+
+    def _group_by(self) -> Optional[str]:
+        group = self.expression.args.get("group")
+        if not group or not group.expressions:
+            return None
+        first = group.expressions[0]
+        return first.name if isinstance(first, exp.Column) else first.sql()
+
+
+_lock = threading.Lock()
+_cache: "OrderedDict[str, SQLAnalysis]" = OrderedDict()
+
+
+def _remember(analysis: SQLAnalysis) -> SQLAnalysis:
+    with _lock:
+        _cache[analysis.sql] = analysis
+        _cache.move_to_end(analysis.sql)
+        while len(_cache) > _CACHE_SIZE:
+            _cache.popitem(last=False)
+    return analysis
+
+
+def analyze_sql(sql: str) -> SQLAnalysis:
+    with _lock:
+        cached = _cache.get(sql)
+        if cached is not None:
+            _cache.move_to_end(sql)
+            return cached
+    try:
+        statements = sqlglot.parse(sql)
+    except sqlglot.errors.ParseError:
+        statements = None
+    if statements is not None:
+        statements = [statement for statement in statements if statement is not None]
+    return _remember(SQLAnalysis(sql, statements))
+
+
+def clear_analysis_cache() -> None:
+    with _lock:
+        _cache.clear()
+
+
+def check_sql(sql: Optional[str], default_limit: int = 100) -> Tuple[Optional[str], Optional[str]]:
+    if not sql:
+        return sql, None
+    analysis = analyze_sql(sql)
+    error = analysis.error()
+    if error:
+        repaired = analysis.with_limit(default_limit)
+        if repaired:
+            sql = repaired
+            error = analyze_sql(sql).error()
+    return sql, error
@@ -0,0 +1,132 @@
+import logging
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from functools import lru_cache
+from typing import Any, Callable, Dict, TypeVar
+from app.core.config import get_settings
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="nl2sql-llm")
+
+
+class CircuitBreaker:
+    def __init__(self, name: str, failure_threshold: int, cooldown_seconds: float) -> None:
+        self.name = name
+        self.failure_threshold = max(1, failure_threshold)
+        self.cooldown_seconds = cooldown_seconds
+        self._lock = threading.Lock()
+        self._state = "closed"
+        self._consecutive_failures = 0
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self._trips = 0
+        self._calls = 0
+        self._failures = 0
+        self._timeouts = 0
+        self._short_circuits = 0
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._current_state()
+
+    def _current_state(self) -> str:
+        if self._state == "open" and time.monotonic() - self._opened_at >= self.cooldown_seconds:
+            self._state = "half_open"
+            self._probe_in_flight = False
+        return self._state
+
+    def allow(self) -> bool:
+        with self._lock:
+            state = self._current_state()
+            if state == "closed":
+                self._calls += 1
+                return True
+            if state == "half_open" and not self._probe_in_flight:
+                self._probe_in_flight = True
+                self._calls += 1
+                return True
+            self._short_circuits += 1
+            return False
+
+    def record_success(self) -> None:
+        with self._lock:
+            if self._state != "closed":
+                logger.info("circuit %s closed after successful probe", self.name)
+            self._state = "closed"
+            self._consecutive_failures = 0
+            self._probe_in_flight = False
+
+    def record_failure(self, timed_out: bool = False) -> None:
+        with self._lock:
+            self._failures += 1
+            if timed_out:
+                self._timeouts += 1
+            self._consecutive_failures += 1
+            if self._state == "half_open" or self._consecutive_failures >= self.failure_threshold:
+                if self._state != "open":
+                    self._trips += 1
+                    logger.warning(
+                        "circuit %s opened after %s consecutive failures",
+                        self.name,
+                        self._consecutive_failures,
+                    )
+                self._state = "open"
+                self._opened_at = time.monotonic()
+            self._probe_in_flight = False
+
+    def reset(self) -> None:
+        with self._lock:
+            self._state = "closed"
+            self._consecutive_failures = 0
+            self._opened_at = 0.0
+            self._probe_in_flight = False
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            state = self._current_state()
+            retry_in = 0.0
+            if state == "open":
+                retry_in = max(0.0, self.cooldown_seconds - (time.monotonic() - self._opened_at))
+            return {
+                "name": self.name,
+                "state": state,
+                "consecutive_failures": self._consecutive_failures,
+                "failure_threshold": self.failure_threshold,
+                "cooldown_seconds": self.cooldown_seconds,
+                "retry_in_seconds": round(retry_in, 3),
+                "trips": self._trips,
+                "calls": self._calls,
+                "failures": self._failures,
+                "timeouts": self._timeouts,
+                "short_circuits": self._short_circuits,
+            }
+
+
+def submit_call(fn: Callable[[], T]) -> "Future[T]":
+    return _executor.submit(fn)
+
+
+def call_with_deadline(fn: Callable[[], T], timeout_seconds: float) -> T:
+    # The provider call keeps running in the pool after a timeout; the caller
+    # just stops waiting for it.
+    future = submit_call(fn)
+    try:
+        return future.result(timeout=timeout_seconds)
+    except FutureTimeoutError as exc:
+        future.cancel()
+        raise TimeoutError(f"LLM call exceeded {timeout_seconds}s budget") from exc
+
+
+@lru_cache
+def get_llm_breaker() -> CircuitBreaker:
+    settings = get_settings()
+    return CircuitBreaker(
+        "llm",
+        failure_threshold=settings.llm_breaker_failure_threshold,
+        cooldown_seconds=settings.llm_breaker_cooldown_seconds,
+    )
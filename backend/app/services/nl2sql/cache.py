@@ -0,0 +1,109 @@
+import sys
+import threading
+import time
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Any, Dict, Hashable, List, Optional, Sequence, Tuple
+from app.core.config import get_settings
+from app.db.versions import get_table_versions
+from app.services.nl2sql.analysis import analyze_sql
+from app.services.nl2sql.columnar import ColumnarRows
+
+
+def _detached(rows: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    # Values are scalars, so copying the containers is enough to keep callers off the cached copy
+    if isinstance(rows, ColumnarRows):
+        return rows.copy()
+    return [dict(row) for row in rows]
+
+
+class ResultCache:
+    def __init__(self, max_bytes: int, ttl_seconds: Optional[float] = None) -> None:
+        self.max_bytes = max_bytes
+        self.max_entry_bytes = max(1, max_bytes // 4)
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[Hashable, Tuple[List[Dict[str, Any]], int, float]]" = OrderedDict()
+        self._bytes = 0
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+
+    def get(self, key: Hashable) -> Optional[List[Dict[str, Any]]]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and self.ttl_seconds and time.monotonic() - entry[2] > self.ttl_seconds:
+                del self._entries[key]
+                self._bytes -= entry[1]
+                entry = None
+            if entry is None:
+                self._misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self._hits += 1
+            rows = entry[0]
+        return _detached(rows)
+
+    def put(self, key: Hashable, rows: List[Dict[str, Any]]) -> None:
+        size = estimate_rows_bytes(rows)
+        if size > self.max_entry_bytes:
+            return
+        rows = _detached(rows)
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._bytes -= previous[1]
+            self._entries[key] = (rows, size, time.monotonic())
+            self._bytes += size
+            while self._bytes > self.max_bytes and self._entries:
+                _key, (_rows, evicted, _stored) = self._entries.popitem(last=False)
+                self._bytes -= evicted
+                self._evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self._hits,
+                "misses": self._misses,
+                "evictions": self._evictions,
+            }
+
+
+def estimate_row_bytes(row: Dict[str, Any]) -> int:
+    total = sys.getsizeof(row)
+    for value in row.values():
+        total += sys.getsizeof(value)
+    return total
+
+
+def estimate_record_bytes(record: Sequence[Any]) -> int:
+    return sys.getsizeof(record) + sum(sys.getsizeof(value) for value in record)
+
+
+def estimate_rows_bytes(rows: List[Dict[str, Any]]) -> int:
+    if isinstance(rows, ColumnarRows):
+        return rows.estimate_bytes()
+    return sys.getsizeof(rows) + sum(estimate_row_bytes(row) for row in rows)
+
+
+def result_cache_key(database_url: str, sql: str, params: Optional[Dict[str, Any]] = None) -> Optional[Hashable]:
+    analysis = analyze_sql(sql)
+    if analysis.normalized_sql is None:
+        return None
+    bound = tuple(sorted((params or {}).items()))
+    # Versions are read before execution so a concurrent commit can only make the entry unreachable
+    return database_url, analysis.normalized_sql, bound, get_table_versions(analysis.tables)
+
+
+@lru_cache
+def get_result_cache() -> ResultCache:
+    settings = get_settings()
+    return ResultCache(settings.query_cache_max_bytes, settings.query_cache_ttl_seconds)
@@ -0,0 +1,80 @@
+import sys
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Any, Dict, Iterable, List, Optional, Sequence
+
+# Checked in order, so bool is matched before int and datetime before date
+_TYPES = (
+    (bool, "boolean"),
+    (int, "integer"),
+    (float, "number"),
+    (Decimal, "number"),
+    (str, "string"),
+    (datetime, "datetime"),
+    (date, "date"),
+    (bytes, "bytes"),
+)
+
+
+def _type_name(values: Sequence[Any]) -> str:
+    for value in values:
+        if value is None:
+            continue
+        for python_type, name in _TYPES:
+            if isinstance(value, python_type):
+                return name
+        return "unknown"
+    return "null"
+
+
+class ColumnarRows:
+    def __init__(self, columns: Iterable[str], values: Optional[List[List[Any]]] = None) -> None:
+        self.columns = list(columns)
+        self.values = values if values is not None else [[] for _ in self.columns]
+
+    @classmethod
+    def from_rows(cls, rows: List[Dict[str, Any]]) -> "ColumnarRows":
+        columns = list(rows[0]) if rows else []
+        return cls(columns, [[row.get(column) for row in rows] for column in columns])
+
+    def extend(self, batch: Sequence[Sequence[Any]]) -> None:
+        for column, values in zip(self.values, zip(*batch)):
+            column.extend(values)
+
+    def copy(self) -> "ColumnarRows":
+        return ColumnarRows(self.columns, [list(values) for values in self.values])
+
+    def estimate_bytes(self) -> int:
+        total = sys.getsizeof(self.values)
+        for values in self.values:
+            total += sys.getsizeof(values) + sum(sys.getsizeof(value) for value in values)
+        return total
+
+    def __len__(self) -> int:
+        return len(self.values[0]) if self.values else 0
+
+    def __getitem__(self, index: int) -> Dict[str, Any]:
+        return {column: values[index] for column, values in zip(self.columns, self.values)}
+
+    def to_payload(self) -> Dict[str, Any]:
+        return {
+            "columns": self.columns,
+            "types": [_type_name(values) for values in self.values],
+            "data": self.values,
+            "row_count": len(self),
+        }
+
+
+def rows_to_payload(rows: List[Dict[str, Any]]) -> Dict[str, Any]:
+    return ColumnarRows.from_rows(rows).to_payload()
+
+
+def payload_to_rows(payload: Dict[str, Any]) -> List[Dict[str, Any]]:
+    columns = payload["columns"]
+    return [dict(zip(columns, values)) for values in zip(*payload["data"])]
+
+
+def rows_field(rows: Any) -> Dict[str, Any]:
+    if isinstance(rows, ColumnarRows):
+        return {"columnar": rows.to_payload()}
+    return {"rows": rows}
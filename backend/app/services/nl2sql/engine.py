@@ -1,95 +1,385 @@
-from typing import Any, Dict, List, Optional
-import re
-from sqlalchemy import text
+from typing import Any, AsyncIterator, Dict, Hashable, List, Optional, Tuple, Union
+import asyncio
+import logging
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 from app.core.config import get_settings
+from app.db.session import AsyncSessionLocalAnalytics
+from app.services.nl2sql.cache import get_result_cache, result_cache_key
+from app.services.nl2sql.columnar import ColumnarRows, rows_field
+from app.services.nl2sql.governor import QueryBudget, QueryRejected, afetch_governed, fetch_governed
+from app.services.nl2sql.planner import review_plan
+from app.services.nl2sql.rollups import route_to_rollup
+from app.services.nl2sql.sampling import SampleQuery, plan_sample_query
 from app.services.nl2sql.schema import get_schema_profile
-from app.services.nl2sql.validator import validate_sql
-from app.services.nl2sql.repair import repair_sql
-from app.services.nl2sql.graph import run_graph
+from app.services.nl2sql.analysis import analyze_sql, check_sql
+from app.services.nl2sql.graph import arun_graph, run_graph
+from app.services.nl2sql.insights import compute_statistics, describe_statistics
 from app.services.nl2sql.rules import generate_sql
+from app.services.nl2sql.streaming import astream_ndjson
+from app.services.nl2sql.timing import stage
 
+logger = logging.getLogger(__name__)
 
-def run_query_pipeline(db: Session, query: str, domain: Optional[str]) -> Dict[str, Any]:
-    settings = get_settings()
-    mode = settings.nl2sql_mode.lower()
 
-    if mode in {"rules", "llm"}:
-        state = run_graph(db, query, domain, mode)
-        sql = state.get("sql")
-        questions = state.get("questions", [])
-        error = state.get("error")
-    else:
+GRAPH_MODES = {"rules", "llm", "hedged"}
+
+
+def run_query_pipeline(
+    db: Session,
+    query: str,
+    domain: Optional[str],
+    budget: Optional[QueryBudget] = None,
+    approximate: bool = False,
+    columnar: bool = False,
+) -> Dict[str, Any]:
+    generated = generate_statement(db, query, domain)
+    return run_generated(db, generated, query, domain, budget, approximate, columnar)
+
+
+def generate_statement(db: Session, query: str, domain: Optional[str]) -> Dict[str, Any]:
+    mode = get_settings().nl2sql_mode.lower()
+    if mode in GRAPH_MODES:
+        return _from_graph_state(run_graph(db, query, domain, mode))
+    with stage("schema"):
         schema = get_schema_profile(db)
-        sql, questions, _meta = generate_sql(query, domain, schema)
-        error = validate_sql(sql) if sql else None
-        if error:
-            repaired = repair_sql(sql) if sql else None
-            if repaired:
-                sql = repaired
-                error = validate_sql(sql)
-
-    if not sql:
+    return _generate_inline(schema, query, domain)
+
+
+def run_generated(
+    db: Session,
+    generated: Dict[str, Any],
+    query: str,
+    domain: Optional[str],
+    budget: Optional[QueryBudget] = None,
+    approximate: bool = False,
+    columnar: bool = False,
+) -> Dict[str, Any]:
+    unexecutable = _unexecutable_result(generated)
+    if unexecutable is not None:
+        return unexecutable
+
+    try:
+        with stage("plan"):
+            generated = _with_stage(generated, "rollup", route_to_rollup(db, generated["sql"], generated["params"]))
+            sample = _sample_query(generated, approximate)
+            if sample is None:
+                generated = _with_stage(generated, "plan", review_plan(db, generated["sql"], generated["params"]))
+        with stage("execute"):
+            if sample is not None:
+                rows = execute_sql(db, sample.sql, budget, generated["params"])
+            else:
+                rows = execute_sql(db, generated["sql"], budget, generated["params"], columnar)
+    except QueryRejected as exc:
+        db.rollback()
+        return _rejected_result(generated, exc)
+    if sample is not None:
+        return _approximate_result(generated, sample, rows, query, domain, columnar)
+    return executed_result(generated, rows)
+
+
+async def arun_query_pipeline(
+    db: AsyncSession,
+    query: str,
+    domain: Optional[str],
+    budget: Optional[QueryBudget] = None,
+    approximate: bool = False,
+    columnar: bool = False,
+) -> Dict[str, Any]:
+    generated = await _agenerate(db, query, domain)
+    unexecutable = _unexecutable_result(generated)
+    if unexecutable is not None:
+        return unexecutable
+
+    try:
+        generated, sample = await _aprepare(db, generated, approximate)
+        with stage("execute"):
+            if sample is not None:
+                rows = await aexecute_sql(db, sample.sql, budget, generated["params"])
+            else:
+                rows = await aexecute_sql(db, generated["sql"], budget, generated["params"], columnar)
+    except QueryRejected as exc:
+        await db.rollback()
+        return _rejected_result(generated, exc)
+    if sample is not None:
+        return _approximate_result(generated, sample, rows, query, domain, columnar)
+    return executed_result(generated, rows)
+
+
+async def astream_query_pipeline(
+    db: AsyncSession, query: str, domain: Optional[str], budget: Optional[QueryBudget] = None
+) -> Tuple[Optional[Dict[str, Any]], Optional[AsyncIterator[bytes]]]:
+    generated = await _agenerate(db, query, domain)
+    unexecutable = _unexecutable_result(generated)
+    if unexecutable is not None:
+        return unexecutable, None
+    try:
+        generated, _sample = await _aprepare(db, generated)
+    except QueryRejected as exc:
+        return _rejected_result(generated, exc), None
+    batch_size = get_settings().query_stream_batch_size
+    stream = astream_ndjson(generated["sql"], generated["params"], generated["generation"], batch_size, budget)
+    return None, stream
+
+
+async def arun_query_batch(
+    questions: List[Tuple[str, Optional[str]]]
+) -> Tuple[List[Dict[str, Any]], Dict[str, int]]:
+    limit = asyncio.Semaphore(get_settings().query_batch_concurrency)
+
+    async def _generate_one(question: Tuple[str, Optional[str]]) -> Dict[str, Any]:
+        async with limit, AsyncSessionLocalAnalytics() as db:
+            return await _agenerate(db, *question)
+
+    async def _execute_one(generated: Dict[str, Any]) -> Tuple[Dict[str, Any], Any]:
+        async with limit, AsyncSessionLocalAnalytics() as db:
+            try:
+                generated, _sample = await _aprepare(db, generated)
+                rows = await aexecute_sql(db, generated["sql"], QueryBudget.from_settings(), generated["params"])
+            except QueryRejected as exc:
+                return generated, exc
+            return generated, rows
+
+    unique_questions = list(dict.fromkeys(questions))
+    generated_by_question = dict(
+        zip(unique_questions, await asyncio.gather(*map(_generate_one, unique_questions), return_exceptions=True))
+    )
+
+    statements: Dict[Hashable, Dict[str, Any]] = {}
+    for generated in generated_by_question.values():
+        if not isinstance(generated, BaseException) and _unexecutable_result(generated) is None:
+            statements.setdefault(_statement_key(generated), generated)
+    executed = dict(
+        zip(statements, await asyncio.gather(*map(_execute_one, statements.values()), return_exceptions=True))
+    )
+
+    results_by_question: Dict[Tuple[str, Optional[str]], Dict[str, Any]] = {}
+    for question, generated in generated_by_question.items():
+        if isinstance(generated, BaseException):
+            results_by_question[question] = _failed_result(generated)
+            continue
+        unexecutable = _unexecutable_result(generated)
+        if unexecutable is not None:
+            results_by_question[question] = unexecutable
+            continue
+        outcome = executed[_statement_key(generated)]
+        if isinstance(outcome, BaseException):
+            results_by_question[question] = _failed_result(outcome)
+            continue
+        prepared, rows = outcome
+        # Statements are shared across questions, but generator details belong to each question
+        generated = {**prepared, "generation": {**prepared["generation"], **generated["generation"]}}
+        if isinstance(rows, QueryRejected):
+            results_by_question[question] = _rejected_result(generated, rows)
+        else:
+            results_by_question[question] = executed_result(generated, rows)
+
+    stats = {
+        "questions": len(questions),
+        "unique_questions": len(unique_questions),
+        "unique_statements": len(statements),
+    }
+    return [results_by_question[question] for question in questions], stats
+
+
+def _statement_key(generated: Dict[str, Any]) -> Hashable:
+    return generated["sql"], tuple(sorted(generated["params"].items()))
+
+
+async def _agenerate(db: AsyncSession, query: str, domain: Optional[str]) -> Dict[str, Any]:
+    mode = get_settings().nl2sql_mode.lower()
+    if mode in GRAPH_MODES:
+        return _from_graph_state(await arun_graph(db, query, domain, mode))
+    return _generate_inline(await db.run_sync(get_schema_profile), query, domain)
+
+
+def _from_graph_state(state: Dict[str, Any]) -> Dict[str, Any]:
+    generation: Dict[str, Any] = {"generator": state.get("generator", "rules")}
+    if state.get("hedge"):
+        generation["hedge"] = state["hedge"]
+        logger.info(
+            "nl2sql.hedge winner=%s reason=%s rules_ms=%s llm_ms=%s",
+            state["hedge"].get("winner"),
+            state["hedge"].get("reason"),
+            state["hedge"].get("rules_ms"),
+            state["hedge"].get("llm_ms"),
+        )
+    return {
+        "sql": state.get("sql"),
+        "params": state.get("params") or {},
+        "questions": state.get("questions", []),
+        "error": state.get("error"),
+        "generation": generation,
+    }
+
+
+def _generate_inline(schema: Dict[str, List[str]], query: str, domain: Optional[str]) -> Dict[str, Any]:
+    with stage("generate"):
+        sql, questions, meta = generate_sql(query, domain, schema)
+    with stage("validate"):
+        sql, error = check_sql(sql)
+    return {
+        "sql": sql,
+        "params": meta["params"],
+        "questions": questions,
+        "error": error,
+        "generation": {"generator": "rules"},
+    }
+
+
+def _with_stage(generated: Dict[str, Any], name: str, reviewed: Tuple[str, Optional[Dict[str, Any]]]) -> Dict[str, Any]:
+    sql, info = reviewed
+    if info is None:
+        return generated
+    return {**generated, "sql": sql, "generation": {**generated["generation"], name: info}}
+
+
+async def _aprepare(
+    db: AsyncSession, generated: Dict[str, Any], approximate: bool = False
+) -> Tuple[Dict[str, Any], Optional[SampleQuery]]:
+    with stage("plan"):
+        rollup = await db.run_sync(route_to_rollup, generated["sql"], generated["params"])
+        generated = _with_stage(generated, "rollup", rollup)
+        sample = _sample_query(generated, approximate)
+        if sample is not None:
+            return generated, sample
+        plan = await db.run_sync(review_plan, generated["sql"], generated["params"])
+        return _with_stage(generated, "plan", plan), None
+
+
+def _sample_query(generated: Dict[str, Any], approximate: bool) -> Optional[SampleQuery]:
+    # A rollup already answers exactly at a fraction of the cost, so it is never traded for an estimate
+    if not approximate or "rollup" in generated["generation"]:
+        return None
+    return plan_sample_query(generated["sql"], generated["params"])
+
+
+def _unexecutable_result(generated: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    if not generated["sql"]:
         return {
             "sql": None,
             "rows": [],
             "visualization": {"type": "table"},
             "insights": [],
             "clarification_needed": True,
-            "clarification_questions": questions,
+            "clarification_questions": generated["questions"],
+            **generated["generation"],
         }
 
-    if error:
+    if generated["error"]:
         return {
-            "sql": sql,
+            "sql": generated["sql"],
+            "params": generated["params"],
             "rows": [],
             "visualization": {"type": "table"},
             "insights": [],
             "clarification_needed": False,
             "clarification_questions": [],
-            "error": error,
+            "error": generated["error"],
+            **generated["generation"],
         }
+    return None
+
+
+def _failed_result(exc: BaseException) -> Dict[str, Any]:
+    logger.error("nl2sql batch item failed: %s", exc, exc_info=exc)
+    return {
+        "sql": None,
+        "rows": [],
+        "visualization": {"type": "table"},
+        "insights": [],
+        "clarification_needed": False,
+        "clarification_questions": [],
+        "error": "Query failed unexpectedly.",
+        "error_code": "QUERY_FAILED",
+    }
 
-    rows = execute_sql(db, sql)
-    meta = _build_meta_from_sql(sql)
-    visualization = _suggest_visualization(meta)
-    insights = _generate_insights(meta, rows)
 
+def _rejected_result(generated: Dict[str, Any], exc: QueryRejected) -> Dict[str, Any]:
     return {
+        "sql": generated["sql"],
+        "params": generated["params"],
+        "rows": [],
+        "visualization": {"type": "table"},
+        "insights": [],
+        "clarification_needed": False,
+        "clarification_questions": [],
+        "error": exc.message,
+        "error_code": exc.code,
+        "error_details": exc.details,
+        **generated["generation"],
+    }
+
+
+def executed_result(generated: Dict[str, Any], rows: Union[List[Dict[str, Any]], ColumnarRows]) -> Dict[str, Any]:
+    sql = generated["sql"]
+    # A rollup rewrite reshapes the aggregates, so intent comes from the statement that was asked for
+    meta = _build_meta_from_sql(generated["generation"].get("rollup", {}).get("original_sql", sql))
+    with stage("insights"):
+        statistics = compute_statistics(rows)
+        visualization = _suggest_visualization(meta, statistics)
+        insights = _generate_insights(meta, rows)
+        if statistics is not None:
+            insights += describe_statistics(statistics)
+
+    result = {
         "sql": sql,
-        "rows": rows,
+        "params": generated["params"],
+        **rows_field(rows),
         "visualization": visualization,
         "insights": insights,
         "clarification_needed": False,
         "clarification_questions": [],
+        **generated["generation"],
     }
+    if statistics is not None:
+        result["statistics"] = statistics
+    return result
+
+
+def _approximate_result(
+    generated: Dict[str, Any],
+    sample: SampleQuery,
+    strata: List[Dict[str, Any]],
+    query: str,
+    domain: Optional[str],
+    columnar: bool = False,
+) -> Dict[str, Any]:
+    rows, info = sample.estimate(strata, get_settings().query_approximate_confidence)
+    info["exact_follow_up"] = {"query": query, "domain": domain, "approximate": False}
+    generated = {**generated, "generation": {**generated["generation"], "approximate": info}}
+    result = executed_result(generated, ColumnarRows.from_rows(rows) if columnar else rows)
+    for alias, estimate in info["estimates"].items():
+        if estimate["value"] is not None:
+            result["insights"].append(
+                f"{alias} is approximate: {estimate['low']} to {estimate['high']} "
+                f"at {info['confidence']:.0%} confidence."
+            )
+    return result
 
 
 def _build_meta_from_sql(sql: str) -> Dict[str, Any]:
-    text_lower = sql.lower()
-    meta: Dict[str, Any] = {"intent": "list", "group_by": None}
-    if "count(" in text_lower:
-        meta["intent"] = "count"
-    if "sum(" in text_lower:
-        meta["intent"] = "sum"
-    if "avg(" in text_lower:
-        meta["intent"] = "avg"
-    match = re.search(r"group by\s+(\w+)", text_lower)
-    if match:
-        meta["group_by"] = match.group(1)
-    return meta
-
-
-def _suggest_visualization(meta: Dict[str, Any]) -> Dict[str, Any]:
+    return analyze_sql(sql).meta()
+
+
+def _suggest_visualization(meta: Dict[str, Any], statistics: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
     intent = meta.get("intent")
     if meta.get("group_by"):
         return {"type": "bar", "x": meta.get("group_by"), "y": "count"}
     if intent in {"count", "sum", "avg"}:
         return {"type": "metric", "value": intent}
+    if statistics is None:
+        return {"type": "table"}
+    trend = statistics["trend"]
+    if trend is not None:
+        return {"type": "line", "x": trend["x"], "y": trend["y"], "series": trend["series"]}
+    for name, stats in statistics["columns"].items():
+        if stats["kind"] == "measure":
+            return {"type": "histogram", "x": name, "bins": stats["histogram"]}
     return {"type": "table"}
 
 
-def _generate_insights(meta: Dict[str, Any], rows: List[Dict[str, Any]]) -> List[str]:
+def _generate_insights(meta: Dict[str, Any], rows: Union[List[Dict[str, Any]], ColumnarRows]) -> List[str]:
     intent = meta.get("intent")
     if intent == "count" and rows:
         return [f"Count result: {rows[0].get('count')}"]
@@ -99,7 +389,49 @@ def _generate_insights(meta: Dict[str, Any], rows: List[Dict[str, Any]]) -> List
     return [f"Returned {len(rows)} rows."]
 
 
-def execute_sql(db: Session, sql: str) -> List[Dict[str, Any]]:
-    result = db.execute(text(sql))
-    rows = [dict(r._mapping) for r in result]
+def _cache_key(db, sql: str, params: Optional[Dict[str, Any]], columnar: bool = False):
+    if not get_settings().query_cache_enabled:
+        return None
+    key = result_cache_key(str(db.bind.url), sql, params)
+    if key is None or not columnar:
+        return key
+    return (*key, "columnar")
+
+
+def execute_sql(
+    db: Session,
+    sql: str,
+    budget: Optional[QueryBudget] = None,
+    params: Optional[Dict[str, Any]] = None,
+    columnar: bool = False,
+) -> Union[List[Dict[str, Any]], ColumnarRows]:
+    key = _cache_key(db, sql, params, columnar)
+    if key is not None:
+        cached = get_result_cache().get(key)
+        if cached is not None:
+            return cached
+
+    rows = fetch_governed(db.connection(), sql, budget or QueryBudget.from_settings(), params, columnar)
+    if key is not None:
+        get_result_cache().put(key, rows)
+    return rows
+
+
+async def aexecute_sql(
+    db: AsyncSession,
+    sql: str,
+    budget: Optional[QueryBudget] = None,
+    params: Optional[Dict[str, Any]] = None,
+    columnar: bool = False,
+) -> Union[List[Dict[str, Any]], ColumnarRows]:
+    key = _cache_key(db, sql, params, columnar)
+    if key is not None:
+        cached = get_result_cache().get(key)
+        if cached is not None:
+            return cached
+
+    conn = await db.connection()
+    rows = await afetch_governed(conn, sql, budget or QueryBudget.from_settings(), params, columnar)
+    if key is not None:
+        get_result_cache().put(key, rows)
     return rows
@@ -0,0 +1,76 @@
+import asyncio
+import json
+import random
+import re
+import threading
+import time
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict, Optional
+
+DEFAULT_FIXTURES = Path(__file__).parent / "fixtures" / "fake_llm.json"
+_QUESTION = re.compile(r"^User question: (.*)$", re.MULTILINE)
+
+
+class FakeLLMError(RuntimeError):
+    pass
+
+
+class FakeResponse:
+    def __init__(self, content: str) -> None:
+        self.content = content
+
+
+class FakeLLM:
+    def __init__(
+        self,
+        answers: Dict[str, str],
+        default: str,
+        latency_ms: float = 0.0,
+        failure_rate: float = 0.0,
+        seed: int = 0,
+    ) -> None:
+        self.answers = {_normalize(question): answer for question, answer in answers.items()}
+        self.default = default
+        self.latency_ms = latency_ms
+        self.failure_rate = failure_rate
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_file(cls, path: Path, latency_ms: float = 0.0, failure_rate: float = 0.0, seed: int = 0) -> "FakeLLM":
+        fixtures = json.loads(path.read_text(encoding="utf-8"))
+        return cls(fixtures.get("answers", {}), fixtures.get("default", ""), latency_ms, failure_rate, seed)
+
+    def invoke(self, prompt: str) -> FakeResponse:
+        failed = self._should_fail()
+        if self.latency_ms:
+            time.sleep(self.latency_ms / 1000)
+        return self._respond(prompt, failed)
+
+    async def ainvoke(self, prompt: str) -> FakeResponse:
+        failed = self._should_fail()
+        if self.latency_ms:
+            await asyncio.sleep(self.latency_ms / 1000)
+        return self._respond(prompt, failed)
+
+    def _should_fail(self) -> bool:
+        # Drawn up front under a lock so a given seed fails the same calls regardless of timing
+        with self._lock:
+            return self._random.random() < self.failure_rate
+
+    def _respond(self, prompt: str, failed: bool) -> FakeResponse:
+        if failed:
+            raise FakeLLMError("Simulated LLM failure")
+        match = _QUESTION.search(prompt)
+        question = _normalize(match.group(1)) if match else ""
+        return FakeResponse(self.answers.get(question, self.default))
+
+
+def _normalize(question: str) -> str:
+    return " ".join(question.lower().strip().rstrip("?.!").split())
+
+
+@lru_cache(maxsize=8)
+def get_fake_llm(path: Optional[str], latency_ms: float, failure_rate: float, seed: int) -> FakeLLM:
+    return FakeLLM.from_file(Path(path) if path else DEFAULT_FIXTURES, latency_ms, failure_rate, seed)
@@ -0,0 +1,267 @@
+import asyncio
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager
+from typing import Any, Awaitable, Callable, Dict, List, Optional, TypeVar, Union
+from sqlalchemy import text
+from sqlalchemy.exc import DBAPIError
+from app.core.config import get_settings
+from app.services.nl2sql.cache import estimate_record_bytes, estimate_row_bytes
+from app.services.nl2sql.columnar import ColumnarRows
+
+T = TypeVar("T")
+
+# SQLite calls the progress handler every N virtual machine instructions
+_SQLITE_PROGRESS_STEPS = 1000
+_FETCH_BATCH = 500
+
+
+class QueryRejected(Exception):
+    def __init__(self, code: str, message: str, details: Optional[Dict[str, Any]] = None) -> None:
+        super().__init__(message)
+        self.code = code
+        self.message = message
+        self.details = details or {}
+
+
+class QueryBudget:
+    def __init__(self, timeout_ms: int, max_rows: int, max_bytes: int) -> None:
+        self.timeout_ms = timeout_ms
+        self.max_rows = max_rows
+        self.max_bytes = max_bytes
+        self.deadline: Optional[float] = None
+        self._cancelled = threading.Event()
+
+    @classmethod
+    def from_settings(cls) -> "QueryBudget":
+        settings = get_settings()
+        return cls(settings.query_timeout_ms, settings.query_max_rows, settings.query_max_bytes)
+
+    def start(self) -> None:
+        # The clock starts at execution so SQL generation does not eat into the budget
+        if self.deadline is None:
+            self.deadline = time.monotonic() + self.timeout_ms / 1000
+
+    @property
+    def started(self) -> bool:
+        return self.deadline is not None
+
+    def cancel(self) -> None:
+        self._cancelled.set()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancelled.is_set()
+
+    def should_stop(self) -> bool:
+        if self._cancelled.is_set():
+            return True
+        return self.deadline is not None and time.monotonic() >= self.deadline
+
+    def remaining_ms(self) -> int:
+        self.start()
+        return max(1, int((self.deadline - time.monotonic()) * 1000))
+
+    def stop_error(self) -> QueryRejected:
+        if self.cancelled:
+            return QueryRejected("QUERY_CANCELLED", "Query was cancelled before it completed.")
+        return QueryRejected(
+            "QUERY_TIMEOUT",
+            f"Query exceeded the {self.timeout_ms} ms time budget.",
+            {"timeout_ms": self.timeout_ms},
+        )
+
+    def progress_handler(self) -> int:
+        # A non-zero return makes SQLite abort the running statement with "interrupted"
+        return 1 if self.should_stop() else 0
+
+
+def check_limits(budget: QueryBudget, row_count: int, byte_count: int) -> None:
+    if row_count > budget.max_rows:
+        raise QueryRejected(
+            "ROW_LIMIT_EXCEEDED",
+            f"Query returned more than {budget.max_rows} rows; add a LIMIT or narrow the filters.",
+            {"max_rows": budget.max_rows},
+        )
+    if byte_count > budget.max_bytes:
+        raise QueryRejected(
+            "RESULT_TOO_LARGE",
+            f"Query result exceeded {budget.max_bytes} bytes; select fewer columns or rows.",
+            {"max_bytes": budget.max_bytes, "rows_fetched": row_count},
+        )
+
+
+class RowCollector:
+    def __init__(self, budget: QueryBudget) -> None:
+        self.budget = budget
+        self.rows: List[Dict[str, Any]] = []
+        self.bytes = 0
+
+    def add(self, batch) -> None:
+        for record in batch:
+            row = dict(record._mapping)
+            self.rows.append(row)
+            self.bytes += estimate_row_bytes(row)
+            self._check_limits()
+        self._check_budget()
+
+    def _check_limits(self) -> None:
+        check_limits(self.budget, len(self.rows), self.bytes)
+
+    def _check_budget(self) -> None:
+        if self.budget.should_stop():
+            raise self.budget.stop_error()
+
+
+class ColumnCollector(RowCollector):
+    def __init__(self, budget: QueryBudget, columns) -> None:
+        super().__init__(budget)
+        self.rows = ColumnarRows(columns)
+
+    def add(self, batch) -> None:
+        # Cursor tuples go straight into the column lists; no per-row dict is ever built
+        self.rows.extend(batch)
+        self.bytes += sum(estimate_record_bytes(record) for record in batch)
+        self._check_limits()
+        self._check_budget()
+
+
+def _dialect(conn) -> str:
+    return conn.dialect.name
+
+
+def _translate(exc: DBAPIError, budget: QueryBudget) -> Exception:
+    message = str(exc.orig).lower() if exc.orig is not None else str(exc).lower()
+    if budget.should_stop() or "interrupted" in message or "statement timeout" in message:
+        return budget.stop_error()
+    return exc
+
+
+def _server_timeout_sql(dialect: str, budget: QueryBudget) -> Optional[str]:
+    if dialect == "postgresql":
+        return f"SET LOCAL statement_timeout = {budget.remaining_ms()}"
+    if dialect == "mysql":
+        return f"SET SESSION MAX_EXECUTION_TIME = {budget.remaining_ms()}"
+    return None
+
+
+def _reset_timeout_sql(dialect: str) -> Optional[str]:
+    # SET LOCAL ends with the transaction, but a MySQL session setting outlives the query on the pooled connection
+    if dialect == "mysql":
+        return "SET SESSION MAX_EXECUTION_TIME = DEFAULT"
+    return None
+
+
+@contextmanager
+def governed(conn, budget: QueryBudget):
+    budget.start()
+    dialect = _dialect(conn)
+    reset_sql = _reset_timeout_sql(dialect)
+    driver_connection = conn.connection.driver_connection
+    if dialect == "sqlite":
+        driver_connection.set_progress_handler(budget.progress_handler, _SQLITE_PROGRESS_STEPS)
+    else:
+        timeout_sql = _server_timeout_sql(dialect, budget)
+        if timeout_sql:
+            conn.execute(text(timeout_sql))
+    try:
+        yield
+    except DBAPIError as exc:
+        raise _translate(exc, budget) from exc
+    finally:
+        if dialect == "sqlite":
+            driver_connection.set_progress_handler(None, 0)
+        elif reset_sql:
+            conn.execute(text(reset_sql))
+
+
+@asynccontextmanager
+async def agoverned(conn, budget: QueryBudget):
+    budget.start()
+    dialect = _dialect(conn)
+    reset_sql = _reset_timeout_sql(dialect)
+    raw = await conn.get_raw_connection()
+    driver_connection = raw.driver_connection
+    if dialect == "sqlite":
+        await driver_connection.set_progress_handler(budget.progress_handler, _SQLITE_PROGRESS_STEPS)
+    else:
+        timeout_sql = _server_timeout_sql(dialect, budget)
+        if timeout_sql:
+            await conn.execute(text(timeout_sql))
+    try:
+        yield
+    except DBAPIError as exc:
+        raise _translate(exc, budget) from exc
+    finally:
+        if dialect == "sqlite":
+            await driver_connection.set_progress_handler(None, 0)
+        elif reset_sql:
+            await conn.execute(text(reset_sql))
+
+
+def _collector(budget: QueryBudget, result, columnar: bool) -> RowCollector:
+    return ColumnCollector(budget, result.keys()) if columnar else RowCollector(budget)
+
+
+def fetch_governed(
+    conn, sql: str, budget: QueryBudget, params: Optional[Dict[str, Any]] = None, columnar: bool = False
+) -> Union[List[Dict[str, Any]], ColumnarRows]:
+    with governed(conn, budget):
+        result = conn.execute(text(sql), params or {})
+        collector = _collector(budget, result, columnar)
+        try:
+            while True:
+                batch = result.fetchmany(_FETCH_BATCH)
+                if not batch:
+                    break
+                collector.add(batch)
+        finally:
+            result.close()
+    return collector.rows
+
+
+async def afetch_governed(
+    conn, sql: str, budget: QueryBudget, params: Optional[Dict[str, Any]] = None, columnar: bool = False
+) -> Union[List[Dict[str, Any]], ColumnarRows]:
+    async with agoverned(conn, budget):
+        result = await conn.stream(text(sql), params or {})
+        collector = _collector(budget, result, columnar)
+        try:
+            while True:
+                batch = await result.fetchmany(_FETCH_BATCH)
+                if not batch:
+                    break
+                collector.add(batch)
+        finally:
+            await result.close()
+    return collector.rows
+
+
+async def cancel_on_disconnect(
+    work: Awaitable[T],
+    budget: QueryBudget,
+    is_disconnected: Callable[[], Awaitable[bool]],
+    poll_seconds: float = 0.25,
+) -> T:
+    task = asyncio.ensure_future(work)
+
+    async def _watch() -> None:
+        while not task.done():
+            if await is_disconnected():
+                budget.cancel()
+                if not budget.started:
+                    # Still generating SQL; once execution starts the progress handler
+                    # interrupts the statement and the connection stays usable
+                    task.cancel()
+                return
+            await asyncio.sleep(poll_seconds)
+
+    watcher = asyncio.ensure_future(_watch())
+    try:
+        return await task
+    except asyncio.CancelledError:
+        if budget.cancelled:
+            raise budget.stop_error()
+        raise
+    finally:
+        watcher.cancel()
@@ -1,10 +1,16 @@
-from typing import Dict, List, Optional, TypedDict
+import asyncio
+import threading
+import time
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from typing import Any, Callable, Dict, List, Optional, TypedDict
 from langgraph.graph import StateGraph, END
+from app.core.config import get_settings
 from app.services.nl2sql.schema import get_schema_profile
 from app.services.nl2sql.rules import generate_sql as generate_sql_rules
-from app.services.nl2sql.validator import validate_sql
-from app.services.nl2sql.repair import repair_sql
+from app.services.nl2sql.analysis import check_sql
 from app.services.nl2sql.llm import build_prompt, get_llm_client, parse_llm_output
+from app.services.nl2sql.breaker import call_with_deadline, get_llm_breaker, submit_call
+from app.services.nl2sql.timing import timed
 
 
 class NL2SQLState(TypedDict, total=False):
@@ -12,72 +18,283 @@ class NL2SQLState(TypedDict, total=False):
     domain: Optional[str]
     schema: Dict[str, List[str]]
     sql: Optional[str]
+    params: Dict[str, Any]
     questions: List[str]
     error: Optional[str]
     mode: str
+    llm_fallback: Optional[str]
+    generator: str
+    hedge: Dict[str, Any]
 
 
-def build_graph(db) -> StateGraph:
-    def _load_schema(state: NL2SQLState) -> NL2SQLState:
-        state["schema"] = get_schema_profile(db)
-        return state
+def _response_text(response) -> str:
+    return response.content.strip() if hasattr(response, "content") else str(response).strip()
+
+
+def _generate_sql(state: NL2SQLState) -> NL2SQLState:
+    sql, questions, meta = generate_sql_rules(state["query"], state.get("domain"), state["schema"])
+    state["sql"] = sql
+    state["params"] = meta["params"]
+    state["questions"] = questions
+    state["generator"] = "rules"
+    return state
 
-    def _generate_sql(state: NL2SQLState) -> NL2SQLState:
-        sql, questions, _meta = generate_sql_rules(state["query"], state.get("domain"), state["schema"])
-        state["sql"] = sql
-        state["questions"] = questions
-        return state
 
-    def _generate_sql_llm(state: NL2SQLState) -> NL2SQLState:
-        llm = get_llm_client()
-        if llm is None:
-            return _generate_sql(state)
-
-        try:
-            prompt = build_prompt(state["query"], state.get("domain"), state["schema"])
-            response = llm.invoke(prompt)
-            content = response.content.strip() if hasattr(response, "content") else str(response).strip()
-            sql, questions = parse_llm_output(content)
-            state["sql"] = sql
-            state["questions"] = questions
-            return state
-        except Exception:
-            # Fallback to rules when LLM quota/auth fails
-            return _generate_sql(state)
-
-    def _validate_sql(state: NL2SQLState) -> NL2SQLState:
-        sql = state.get("sql")
-        if not sql:
-            return state
-        error = validate_sql(sql)
-        if error:
-            repaired = repair_sql(sql)
-            if repaired:
-                sql = repaired
-                state["sql"] = sql
-                error = validate_sql(sql)
-        state["error"] = error
+def _validate_sql(state: NL2SQLState) -> NL2SQLState:
+    sql, error = check_sql(state.get("sql"))
+    if not sql:
         return state
+    state["sql"] = sql
+    state["error"] = error
+    return state
+
+
+def _route_mode(state: NL2SQLState) -> str:
+    mode = state.get("mode")
+    return mode if mode in {"llm", "hedged"} else "rules"
+
+
+def _open_llm(state: NL2SQLState):
+    llm = get_llm_client()
+    if llm is None:
+        return None
+    if not get_llm_breaker().allow():
+        # Provider is known to be unhealthy; answer from rules without waiting on it
+        state["llm_fallback"] = "circuit_open"
+        return None
+    return llm
+
+
+def _llm_failed(state: NL2SQLState, reason: str) -> NL2SQLState:
+    # Fallback to rules when LLM quota/auth fails or the call runs past its budget
+    get_llm_breaker().record_failure(timed_out=reason == "timeout")
+    state["llm_fallback"] = reason
+    return _generate_sql(state)
+
+
+def _llm_answered(state: NL2SQLState, response) -> NL2SQLState:
+    sql, questions = parse_llm_output(_response_text(response))
+    get_llm_breaker().record_success()
+    state["sql"] = sql
+    state["params"] = {}
+    state["questions"] = questions
+    state["generator"] = "llm"
+    return state
+
+
+def _generate_sql_llm(state: NL2SQLState) -> NL2SQLState:
+    llm = _open_llm(state)
+    if llm is None:
+        return _generate_sql(state)
+    try:
+        prompt = build_prompt(state["query"], state.get("domain"), state["schema"])
+        response = call_with_deadline(lambda: llm.invoke(prompt), get_settings().llm_timeout_seconds)
+    except TimeoutError:
+        return _llm_failed(state, "timeout")
+    except Exception:
+        return _llm_failed(state, "error")
+    return _llm_answered(state, response)
+
+
+async def _agenerate_sql_llm(state: NL2SQLState) -> NL2SQLState:
+    llm = _open_llm(state)
+    if llm is None:
+        return _generate_sql(state)
+    try:
+        prompt = build_prompt(state["query"], state.get("domain"), state["schema"])
+        response = await asyncio.wait_for(llm.ainvoke(prompt), get_settings().llm_timeout_seconds)
+    except TimeoutError:
+        return _llm_failed(state, "timeout")
+    except Exception:
+        return _llm_failed(state, "error")
+    return _llm_answered(state, response)
+
+
+class _Hedge:
+    def __init__(self, state: NL2SQLState) -> None:
+        settings = get_settings()
+        self.state = state
+        self.started = time.monotonic()
+        self.llm_timeout = settings.llm_timeout_seconds
+        self.deadline_ms = settings.nl2sql_hedge_deadline_ms
+        self.prompt = build_prompt(state["query"], state.get("domain"), state["schema"])
+        self.rules_sql: Optional[str] = None
+        self.rules_params: Dict[str, Any] = {}
+        self.rules_questions: List[str] = []
+        self.info: Dict[str, Any] = {"deadline_ms": self.deadline_ms}
+        self._settled = threading.Lock()
+
+    def run_rules(self) -> float:
+        sql, questions, meta = generate_sql_rules(self.state["query"], self.state.get("domain"), self.state["schema"])
+        sql, error = check_sql(sql)
+        self.rules_sql = sql
+        self.rules_params = meta["params"]
+        self.rules_questions = questions
+        self.info["rules_ms"] = round(self._elapsed_ms(), 2)
+        self.info["rules_ready"] = bool(sql) and error is None
+        # Only hold the request for the hedge deadline when rules already has a usable answer
+        budget = self.deadline_ms / 1000 if self.info["rules_ready"] else self.llm_timeout
+        return max(0.0, budget - (time.monotonic() - self.started))
+
+    def use_rules(self, reason: str) -> NL2SQLState:
+        self.state["sql"] = self.rules_sql
+        self.state["params"] = self.rules_params
+        self.state["questions"] = self.rules_questions
+        self.state["generator"] = "rules"
+        self.state["hedge"] = {**self.info, "winner": "rules", "reason": reason}
+        return self.state
+
+    def timed_out(self) -> NL2SQLState:
+        if self.info["rules_ready"]:
+            return self.use_rules("deadline")
+        get_llm_breaker().record_failure(timed_out=True)
+        self.state["llm_fallback"] = "timeout"
+        return self.use_rules("llm_timeout")
+
+    def failed(self) -> NL2SQLState:
+        get_llm_breaker().record_failure()
+        self.state["llm_fallback"] = "error"
+        return self.use_rules("llm_error")
+
+    def answered(self, response) -> NL2SQLState:
+        sql, questions = parse_llm_output(_response_text(response))
+        get_llm_breaker().record_success()
+        self.info["llm_ms"] = round(self._elapsed_ms(), 2)
+        if not sql and self.info["rules_ready"]:
+            return self.use_rules("llm_clarification")
+        self.state["sql"] = sql
+        self.state["params"] = {}
+        self.state["questions"] = questions
+        self.state["generator"] = "llm"
+        self.state["hedge"] = {**self.info, "winner": "llm", "reason": "answered"}
+        return self.state
+
+    def late_budget(self) -> float:
+        return max(0.0, self.llm_timeout - (time.monotonic() - self.started))
 
-    def _route_mode(state: NL2SQLState) -> str:
-        return "llm" if state.get("mode") == "llm" else "rules"
+    def record_late_outcome(self, failed: bool) -> None:
+        # Whichever comes first, the late answer or the llm_timeout expiry, settles the breaker exactly once
+        if not self._settled.acquire(blocking=False):
+            return
+        breaker = get_llm_breaker()
+        if failed:
+            breaker.record_failure()
+        elif time.monotonic() - self.started > self.llm_timeout:
+            breaker.record_failure(timed_out=True)
+        else:
+            breaker.record_success()
 
+    def expire_late(self) -> None:
+        # A hung call that lost the race would otherwise hold a half-open probe forever
+        if self._settled.acquire(blocking=False):
+            get_llm_breaker().record_failure(timed_out=True)
+
+    def _elapsed_ms(self) -> float:
+        return (time.monotonic() - self.started) * 1000
+
+
+def _settle_late(hedge: _Hedge, expiry: Any, call: Any) -> None:
+    expiry.cancel()
+    hedge.record_late_outcome(call.cancelled() or call.exception() is not None)
+
+
+def _expire_task(hedge: _Hedge, task: "asyncio.Task") -> None:
+    hedge.expire_late()
+    task.cancel()
+
+
+def _generate_sql_hedged(state: NL2SQLState) -> NL2SQLState:
+    llm = _open_llm(state)
+    if llm is None:
+        return _generate_sql(state)
+
+    hedge = _Hedge(state)
+    future = submit_call(lambda: llm.invoke(hedge.prompt))
+    remaining = hedge.run_rules()
+    try:
+        response = future.result(timeout=remaining)
+    except FutureTimeoutError:
+        if hedge.info["rules_ready"]:
+            # The LLM keeps running; its eventual outcome still feeds the breaker, bounded by llm_timeout
+            timer = threading.Timer(hedge.late_budget(), hedge.expire_late)
+            timer.daemon = True
+            timer.start()
+            future.add_done_callback(lambda f: _settle_late(hedge, timer, f))
+        else:
+            future.cancel()
+        return hedge.timed_out()
+    except Exception:
+        return hedge.failed()
+    return hedge.answered(response)
+
+
+async def _agenerate_sql_hedged(state: NL2SQLState) -> NL2SQLState:
+    llm = _open_llm(state)
+    if llm is None:
+        return _generate_sql(state)
+
+    hedge = _Hedge(state)
+    task = asyncio.ensure_future(llm.ainvoke(hedge.prompt))
+    remaining = hedge.run_rules()
+    try:
+        response = await asyncio.wait_for(asyncio.shield(task), remaining)
+    except TimeoutError:
+        if hedge.info["rules_ready"]:
+            expiry = asyncio.get_running_loop().call_later(hedge.late_budget(), _expire_task, hedge, task)
+            task.add_done_callback(lambda t: _settle_late(hedge, expiry, t))
+        else:
+            task.cancel()
+        return hedge.timed_out()
+    except Exception:
+        return hedge.failed()
+    return hedge.answered(response)
+
+
+def _assemble(load_schema: Callable, generate_sql_llm: Callable, generate_sql_hedged: Callable) -> StateGraph:
     graph = StateGraph(NL2SQLState)
-    graph.add_node("load_schema", _load_schema)
-    graph.add_node("generate_sql", _generate_sql)
-    graph.add_node("generate_sql_llm", _generate_sql_llm)
-    graph.add_node("validate_sql", _validate_sql)
+    graph.add_node("load_schema", timed("schema", load_schema))
+    graph.add_node("generate_sql", timed("generate", _generate_sql))
+    graph.add_node("generate_sql_llm", timed("generate", generate_sql_llm))
+    graph.add_node("generate_sql_hedged", timed("generate", generate_sql_hedged))
+    graph.add_node("validate_sql", timed("validate", _validate_sql))
 
     graph.set_entry_point("load_schema")
-    graph.add_conditional_edges("load_schema", _route_mode, {"rules": "generate_sql", "llm": "generate_sql_llm"})
+    graph.add_conditional_edges(
+        "load_schema",
+        _route_mode,
+        {"rules": "generate_sql", "llm": "generate_sql_llm", "hedged": "generate_sql_hedged"},
+    )
     graph.add_edge("generate_sql", "validate_sql")
     graph.add_edge("generate_sql_llm", "validate_sql")
+    graph.add_edge("generate_sql_hedged", "validate_sql")
     graph.add_edge("validate_sql", END)
 
     return graph
 
 
+def build_graph(db) -> StateGraph:
+    def _load_schema(state: NL2SQLState) -> NL2SQLState:
+        state["schema"] = get_schema_profile(db)
+        return state
+
+    return _assemble(_load_schema, _generate_sql_llm, _generate_sql_hedged)
+
+
+def build_async_graph(db) -> StateGraph:
+    async def _load_schema(state: NL2SQLState) -> NL2SQLState:
+        state["schema"] = await db.run_sync(get_schema_profile)
+        return state
+
+    return _assemble(_load_schema, _agenerate_sql_llm, _agenerate_sql_hedged)
+
+
 def run_graph(db, query: str, domain: Optional[str], mode: str) -> NL2SQLState:
     graph = build_graph(db).compile()
     state: NL2SQLState = {"query": query, "domain": domain, "mode": mode}
     return graph.invoke(state)
+
+
+async def arun_graph(db, query: str, domain: Optional[str], mode: str) -> NL2SQLState:
+    graph = build_async_graph(db).compile()
+    state: NL2SQLState = {"query": query, "domain": domain, "mode": mode}
+    return await graph.ainvoke(state)
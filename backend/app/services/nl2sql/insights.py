@@ -0,0 +1,256 @@
+import time
+from collections import Counter
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Any, Dict, List, Optional, Tuple, Union
+import numpy as np
+from app.core.config import get_settings
+from app.services.nl2sql.columnar import ColumnarRows
+
+_QUANTILES = (0.25, 0.5, 0.75, 0.95)
+_TIME_NAMES = {"date", "day", "timestamp"}
+_HISTOGRAM_BINS = 10
+_MAX_SERIES_POINTS = 366
+_MAX_OUTLIER_EXAMPLES = 5
+_PRIORITY = {"measure": 0, "time": 1, "category": 2}
+_KIND_PROBE_ROWS = 64
+_CHUNK_ROWS = 2048
+
+# numpy imports quantile's helpers on first use (~20 ms); paying that here keeps it out of the first request's budget
+np.quantile(np.zeros(2), _QUANTILES)
+
+
+def _column_names(rows: Union[List[Dict[str, Any]], ColumnarRows]) -> List[str]:
+    if isinstance(rows, ColumnarRows):
+        return list(rows.columns)
+    return list(rows[0]) if rows else []
+
+
+def _head(rows: Union[List[Dict[str, Any]], ColumnarRows], name: str) -> List[Any]:
+    # Column kinds are judged from the first rows, before any column is copied out
+    if isinstance(rows, ColumnarRows):
+        return rows.values[rows.columns.index(name)][:_KIND_PROBE_ROWS]
+    return [row.get(name) for row in rows[:_KIND_PROBE_ROWS]]
+
+
+def _column(
+    rows: Union[List[Dict[str, Any]], ColumnarRows], name: str, step: int, deadline: float
+) -> Optional[List[Any]]:
+    if isinstance(rows, ColumnarRows):
+        return rows.values[rows.columns.index(name)][::step]
+    # Only the strided sample is copied out of the row dicts, a chunk at a time so the budget can stop it
+    values: List[Any] = []
+    span = _CHUNK_ROWS * step
+    for start in range(0, len(rows), span):
+        if time.perf_counter() > deadline:
+            return None
+        values.extend(row.get(name) for row in rows[start:start + span:step])
+    return values
+
+
+def _is_identifier(name: str) -> bool:
+    return name == "id" or name.endswith("_id")
+
+
+def _kind(name: str, values: List[Any]) -> Optional[str]:
+    sample = next((value for value in values if value is not None), None)
+    if sample is None:
+        return None
+    if isinstance(sample, (datetime, date)) or name.endswith("_at") or name in _TIME_NAMES:
+        return "time"
+    if _is_identifier(name) or isinstance(sample, (str, bool)):
+        return "category"
+    if isinstance(sample, (int, float, Decimal)):
+        return "measure"
+    return None
+
+
+def _as_float(values: List[Any]) -> Optional[np.ndarray]:
+    try:
+        return np.asarray(values, dtype=np.float64)
+    except (TypeError, ValueError):
+        return None
+
+
+def _as_time(values: List[Any]) -> Optional[np.ndarray]:
+    try:
+        return np.asarray(values, dtype="datetime64[us]")
+    except (TypeError, ValueError):
+        return None
+
+
+def _measure_stats(values: np.ndarray, step: int = 1) -> Optional[Dict[str, Any]]:
+    valid = values[~np.isnan(values)]
+    if not valid.size:
+        return None
+    quantiles = np.quantile(valid, _QUANTILES)
+    low, high = float(valid.min()), float(valid.max())
+    edges = np.linspace(low, high, _HISTOGRAM_BINS + 1)
+    # Equal-width bins can be indexed arithmetically instead of searched per value
+    scale = _HISTOGRAM_BINS / (high - low) if high > low else 0.0
+    bins = np.minimum(((valid - low) * scale).astype(np.int64), _HISTOGRAM_BINS - 1)
+    counts = np.bincount(bins, minlength=_HISTOGRAM_BINS)
+    return {
+        "kind": "measure",
+        "count": int(valid.size) * step,
+        "sampled": step > 1,
+        "mean": float(valid.mean()),
+        "std": float(valid.std()),
+        "min": low,
+        "max": high,
+        "quantiles": {f"p{round(q * 100)}": float(value) for q, value in zip(_QUANTILES, quantiles)},
+        "histogram": {"edges": edges.tolist(), "counts": (counts * step).tolist()},
+    }
+
+
+def _outliers(values: np.ndarray, stats: Dict[str, Any], threshold: float, step: int = 1) -> Optional[Dict[str, Any]]:
+    if not stats["std"]:
+        return None
+    scores = np.abs((values - stats["mean"]) / stats["std"])
+    # NaN scores compare False, so missing values are never reported as outliers
+    indexes = np.flatnonzero(scores > threshold)
+    if not indexes.size:
+        return None
+    worst = indexes[np.argsort(scores[indexes])[::-1][:_MAX_OUTLIER_EXAMPLES]]
+    return {
+        "threshold": threshold,
+        "count": int(indexes.size) * step,
+        "examples": [{"row": int(index) * step, "value": float(values[index]), "z": float(scores[index])} for index in worst],
+    }
+
+
+def _top_k(values: List[Any], k: int, step: int) -> Optional[Dict[str, Any]]:
+    counts = Counter(values)
+    # Every value distinct (emails, names) says nothing about the distribution
+    if len(counts) == len(values):
+        return None
+    total = len(values)
+    return {
+        "kind": "category",
+        "distinct": len(counts),
+        "sampled": step > 1,
+        "top": [
+            {"value": value, "count": count * step, "share": count / total} for value, count in counts.most_common(k)
+        ],
+    }
+
+
+def _trend(moments: np.ndarray, measure: Optional[np.ndarray], step: int) -> Optional[Dict[str, Any]]:
+    days = moments.astype("datetime64[D]").astype(np.int64)
+    valid = ~np.isnat(moments)
+    if measure is not None:
+        valid &= ~np.isnan(measure)
+    if np.count_nonzero(valid) < 2:
+        return None
+    days = days[valid]
+    first = days.min()
+    buckets = days - first
+    weights = measure[valid] if measure is not None else None
+    # One pass buckets the rows per day; the slope is fitted over the daily totals
+    series = np.bincount(buckets, weights=weights) * step
+    occupied = np.flatnonzero(np.bincount(buckets))
+    if occupied.size < 2:
+        return None
+    x = occupied.astype(np.float64)
+    y = series[occupied]
+    slope = float(np.cov(x, y, bias=True)[0, 1] / x.var())
+    points = occupied[-_MAX_SERIES_POINTS:]
+    return {
+        "slope_per_day": slope,
+        "direction": "up" if slope > 0 else "down" if slope < 0 else "flat",
+        "sampled": step > 1,
+        "series": [
+            {"x": str(np.datetime64(int(first + day), "D")), "y": float(series[day])} for day in points
+        ],
+    }
+
+
+def compute_statistics(rows: Union[List[Dict[str, Any]], ColumnarRows]) -> Optional[Dict[str, Any]]:
+    settings = get_settings()
+    if len(rows) < 2:
+        return None
+    started = time.perf_counter()
+    deadline = started + settings.insights_time_budget_ms / 1000
+    # Past the sample size every column is read on an even stride; counts are scaled back up by the step
+    step = max(1, -(-len(rows) // max(1, settings.insights_sample_rows)))
+    kinds = [(name, _kind(name, _head(rows, name))) for name in _column_names(rows) if name != "id"]
+    kinds.sort(key=lambda item: _PRIORITY.get(item[1], len(_PRIORITY)))
+
+    columns: Dict[str, Dict[str, Any]] = {}
+    outliers: Dict[str, Dict[str, Any]] = {}
+    measures: List[Tuple[str, np.ndarray]] = []
+    times: List[Tuple[str, np.ndarray]] = []
+    truncated = False
+    for name, kind in kinds:
+        if kind is None:
+            continue
+        values = _column(rows, name, step, deadline) if time.perf_counter() <= deadline else None
+        if values is None:
+            truncated = True
+            break
+        if kind == "measure":
+            array = _as_float(values)
+            stats = _measure_stats(array, step) if array is not None else None
+            if stats is None:
+                continue
+            columns[name] = stats
+            measures.append((name, array))
+            found = _outliers(array, stats, settings.insights_outlier_z, step)
+            if found:
+                outliers[name] = found
+        elif kind == "time":
+            moments = _as_time(values)
+            present = moments[~np.isnat(moments)] if moments is not None else None
+            if present is not None and present.size:
+                columns[name] = {"kind": "time", "min": str(present.min()), "max": str(present.max())}
+                times.append((name, moments))
+        elif kind == "category":
+            top = _top_k(values, settings.insights_top_k, step)
+            if top is not None:
+                columns[name] = top
+
+    trend = None
+    if times and time.perf_counter() <= deadline:
+        time_column, moments = times[0]
+        measure_column, measure = measures[0] if measures else ("count", None)
+        trend = _trend(moments, measure, step)
+        if trend is not None:
+            trend = {"x": time_column, "y": measure_column, **trend}
+    elif times:
+        truncated = True
+
+    return {
+        "row_count": len(rows),
+        "columns": columns,
+        "outliers": outliers,
+        "trend": trend,
+        "truncated": truncated,
+        "elapsed_ms": round((time.perf_counter() - started) * 1000, 3),
+    }
+
+
+def _number(value: float) -> str:
+    return f"{value:,.2f}".rstrip("0").rstrip(".")
+
+
+def describe_statistics(statistics: Dict[str, Any]) -> List[str]:
+    insights: List[str] = []
+    for name, stats in statistics["columns"].items():
+        if stats["kind"] == "measure":
+            quantiles = stats["quantiles"]
+            insights.append(
+                f"{name}: mean {_number(stats['mean'])}, median {_number(quantiles['p50'])}, "
+                f"p95 {_number(quantiles['p95'])}, range {_number(stats['min'])} to {_number(stats['max'])}."
+            )
+        elif stats["kind"] == "category":
+            top = ", ".join(f"{item['value']} ({item['share']:.0%})" for item in stats["top"][:3])
+            insights.append(f"Top {name}: {top}.")
+    for name, found in statistics["outliers"].items():
+        insights.append(f"{found['count']} outlier(s) in {name} beyond {found['threshold']:g} standard deviations.")
+    trend = statistics["trend"]
+    if trend is not None and trend["direction"] != "flat":
+        insights.append(
+            f"{trend['y']} per day is trending {trend['direction']} "
+            f"({_number(trend['slope_per_day'])} per day) over {trend['x']}."
+        )
+    return insights
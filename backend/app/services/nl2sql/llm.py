@@ -1,18 +1,15 @@
 from typing import Any, Dict, List, Tuple, Optional
 from app.core.config import get_settings
 from app.services.nl2sql.prompts import DOMAIN_PROMPTS
+from app.services.nl2sql.schema import format_schema, select_schema
 
 
 def _format_schema(schema: Dict[str, List[str]]) -> str:
-    lines = []
-    for table, columns in schema.items():
-        cols = ", ".join(columns)
-        lines.append(f"{table}({cols})")
-    return "\n".join(lines)
+    return format_schema(schema)
 
 
 def build_prompt(query: str, domain: str | None, schema: Dict[str, List[str]]) -> str:
-    schema_text = _format_schema(schema)
+    schema_text = _format_schema(select_schema(query, schema))
     domain_text = domain or "general"
     domain_prompt = DOMAIN_PROMPTS.get(domain_text, DOMAIN_PROMPTS["general"])
     return (
@@ -61,4 +58,14 @@ def get_llm_client():
             raise ValueError("GEMINI_API_KEY is required for gemini provider")
         return ChatGoogleGenerativeAI(model=settings.llm_model, google_api_key=settings.gemini_api_key, temperature=0)
 
+    if provider == "fake":
+        from app.services.nl2sql.fake_llm import get_fake_llm
+
+        return get_fake_llm(
+            settings.llm_fake_fixtures_path,
+            settings.llm_fake_latency_ms,
+            settings.llm_fake_failure_rate,
+            settings.llm_fake_seed,
+        )
+
     return None
@@ -0,0 +1,170 @@
+import logging
+import re
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+from sqlalchemy import text
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.orm import Session
+from sqlglot import exp
+from app.core.config import get_settings
+from app.db.versions import get_table_versions
+from app.services.nl2sql.analysis import analyze_sql
+from app.services.nl2sql.governor import QueryRejected
+
+logger = logging.getLogger(__name__)
+
+PLAN_POLICIES = {"off", "warn", "rewrite", "reject"}
+_CACHE_SIZE = 1024
+
+_SQLITE_SCAN = re.compile(r"^SCAN (?:TABLE )?(\S+)(.*)$")
+_SQLITE_SORT = re.compile(r"^USE TEMP B-TREE FOR (.+)$")
+_PG_SCAN = re.compile(r"Seq Scan on (\S+)")
+_PG_SORT = re.compile(r"^\s*(?:->\s*)?Sort\b")
+
+_lock = threading.Lock()
+_plans: "OrderedDict[Tuple[str, str], Optional[Dict[str, Any]]]" = OrderedDict()
+_row_estimates: Dict[Tuple[str, str], Tuple[Any, Optional[int]]] = {}
+
+
+def clear_plan_cache() -> None:
+    with _lock:
+        _plans.clear()
+        _row_estimates.clear()
+
+
+def _explain_sqlite(db: Session, sql: str, params: Dict[str, Any], aliases: Dict[str, str]) -> Dict[str, Any]:
+    steps = [row[3] for row in db.execute(text(f"EXPLAIN QUERY PLAN {sql}"), params).all()]
+    scans: List[str] = []
+    sorts: List[str] = []
+    for step in steps:
+        scan = _SQLITE_SCAN.match(step)
+        # A covering index scan never touches the table rows, so it is not treated as a full scan
+        if scan and "COVERING INDEX" not in scan.group(2) and scan.group(1) in aliases:
+            scans.append(aliases[scan.group(1)])
+        sort = _SQLITE_SORT.match(step)
+        if sort:
+            sorts.append(sort.group(1))
+    return {"steps": steps, "scans": scans, "sorts": sorts}
+
+
+def _explain_postgresql(db: Session, sql: str, params: Dict[str, Any], aliases: Dict[str, str]) -> Dict[str, Any]:
+    steps = [row[0] for row in db.execute(text(f"EXPLAIN {sql}"), params).all()]
+    scans = [match.group(1) for match in (_PG_SCAN.search(step) for step in steps) if match]
+    sorts = [step.strip() for step in steps if _PG_SORT.match(step)]
+    return {"steps": steps, "scans": scans, "sorts": sorts}
+
+
+_EXPLAINERS = {"sqlite": _explain_sqlite, "postgresql": _explain_postgresql}
+
+
+def _fingerprint(db: Session, sql: str) -> Tuple[str, str]:
+    return str(db.get_bind().url), analyze_sql(sql).normalized_sql or sql
+
+
+def _explain(db: Session, sql: str, params: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    # Keyed on the SQL template, so one plan serves every set of bound parameters
+    key = _fingerprint(db, sql)
+    with _lock:
+        if key in _plans:
+            _plans.move_to_end(key)
+            return _plans[key]
+    explainer = _EXPLAINERS.get(db.get_bind().dialect.name)
+    expression = analyze_sql(sql).expression
+    if explainer is None or expression is None:
+        plan = None
+    else:
+        aliases = {table.alias_or_name: table.name for table in expression.find_all(exp.Table)}
+        try:
+            plan = explainer(db, sql, params, aliases)
+        except DBAPIError:
+            # Execution reports the real error; the guard only skips what it cannot inspect
+            db.rollback()
+            plan = None
+    with _lock:
+        _plans[key] = plan
+        while len(_plans) > _CACHE_SIZE:
+            _plans.popitem(last=False)
+    return plan
+
+
+def _count_rows(db: Session, table: str) -> Optional[int]:
+    dialect = db.get_bind().dialect.name
+    try:
+        if dialect == "sqlite":
+            # MAX(rowid) is an index seek and close enough to COUNT(*) for sizing
+            value = db.execute(text(f'SELECT MAX(rowid) FROM "{table}"')).scalar()
+        elif dialect == "postgresql":
+            value = db.execute(
+                text("SELECT reltuples::bigint FROM pg_class WHERE relname = :table"), {"table": table}
+            ).scalar()
+        else:
+            return None
+    except DBAPIError:
+        db.rollback()
+        return None
+    return int(value) if value is not None else 0
+
+
+def estimate_table_rows(db: Session, table: str) -> Optional[int]:
+    key = (str(db.get_bind().url), table)
+    version = get_table_versions([table])
+    with _lock:
+        cached = _row_estimates.get(key)
+    if cached is not None and cached[0] == version:
+        return cached[1]
+    rows = _count_rows(db, table)
+    with _lock:
+        _row_estimates[key] = (version, rows)
+    return rows
+
+
+def _plan_issues(db: Session, plan: Dict[str, Any], tables: Tuple[str, ...]) -> List[Dict[str, Any]]:
+    threshold = get_settings().query_plan_large_table_rows
+    sizes = {table: estimate_table_rows(db, table) for table in set(tables) | set(plan["scans"])}
+    large = {table: rows for table, rows in sizes.items() if rows is not None and rows >= threshold}
+    issues: List[Dict[str, Any]] = []
+    for table in dict.fromkeys(plan["scans"]):
+        if table in large:
+            issues.append({"type": "full_scan", "table": table, "estimated_rows": large[table]})
+    if large:
+        for purpose in plan["sorts"]:
+            issues.append({"type": "temp_sort", "purpose": purpose, "tables": sorted(large)})
+    return issues
+
+
+def review_plan(
+    db: Session, sql: str, params: Optional[Dict[str, Any]] = None
+) -> Tuple[str, Optional[Dict[str, Any]]]:
+    settings = get_settings()
+    policy = settings.query_plan_policy.lower()
+    if policy not in PLAN_POLICIES or policy == "off":
+        return sql, None
+    plan = _explain(db, sql, params or {})
+    if plan is None:
+        return sql, None
+
+    analysis = analyze_sql(sql)
+    issues = _plan_issues(db, plan, analysis.tables)
+    summary: Dict[str, Any] = {"policy": policy, "steps": plan["steps"], "issues": issues, "action": "none"}
+    if not issues:
+        return sql, summary
+
+    if policy == "reject":
+        summary["action"] = "rejected"
+        raise QueryRejected(
+            "QUERY_TOO_EXPENSIVE",
+            "Query would scan or sort a large table; add filters on indexed columns or a LIMIT.",
+            {"plan": summary},
+        )
+    # Elsewhere a LIMIT would leave the flagged scan or sort in place, so those queries are only warned about
+    if policy == "rewrite" and not analysis.has_limit and analysis.is_listing:
+        rewritten = analysis.with_limit(settings.query_plan_rewrite_limit)
+        if rewritten and rewritten != analysis.normalized_sql:
+            summary["action"] = "rewritten"
+            summary["original_sql"] = sql
+            return rewritten, summary
+
+    summary["action"] = "warned"
+    logger.warning("nl2sql.plan issues=%s sql=%s", issues, sql)
+    return sql, summary
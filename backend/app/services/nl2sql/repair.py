@@ -1,15 +1,6 @@
 from typing import Optional
-import sqlglot
-from sqlglot import exp
+from app.services.nl2sql.analysis import analyze_sql
 
 
 def repair_sql(sql: str, default_limit: int = 100) -> Optional[str]:
-    try:
-        expression = sqlglot.parse_one(sql)
-    except sqlglot.errors.ParseError:
-        return None
-
-    if isinstance(expression, exp.Select):
-        if not expression.args.get("limit"):
-            expression.set("limit", exp.Limit(this=exp.Literal.number(default_limit)))
-    return expression.sql()
+    return analyze_sql(sql).with_limit(default_limit)
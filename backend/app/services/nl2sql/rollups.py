@@ -0,0 +1,176 @@
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+from sqlglot import exp
+from app.core.config import get_settings
+from app.db.versions import is_derived_fresh
+from app.services.nl2sql.analysis import analyze_sql
+
+ROLLUP_TABLE = "daily_transaction_metrics"
+SOURCE_TABLE = "transactions"
+
+_LOWER_BOUNDS = {exp.GTE: ">=", exp.GT: ">"}
+_UPPER_BOUNDS = {exp.LT: "<", exp.LTE: "<="}
+_MIDNIGHT_SUFFIXES = {"", " 00:00:00", "T00:00:00"}
+
+
+def _literal(value: str) -> str:
+    return exp.Literal.string(value).sql()
+
+
+def _column_name(node: exp.Expression) -> Optional[str]:
+    return node.name if isinstance(node, exp.Column) else None
+
+
+def _day(value: str) -> Optional[str]:
+    try:
+        return datetime.strptime(value[:10], "%Y-%m-%d").strftime("%Y-%m-%d")
+    except ValueError:
+        return None
+
+
+def _next_day(day: str) -> str:
+    return (datetime.strptime(day, "%Y-%m-%d") + timedelta(days=1)).strftime("%Y-%m-%d")
+
+
+def _aggregate(node: exp.Expression) -> Optional[str]:
+    if isinstance(node, exp.Count) and (isinstance(node.this, exp.Star) or node.this == exp.Literal.number(1)):
+        return "count"
+    if isinstance(node, (exp.Sum, exp.Avg)) and _column_name(node.this) == "amount":
+        return "sum" if isinstance(node, exp.Sum) else "avg"
+    return None
+
+
+def _bound_value(node: exp.Expression, params: Dict[str, Any]) -> Optional[str]:
+    if isinstance(node, exp.Literal) and node.is_string:
+        return node.this
+    if isinstance(node, exp.Placeholder) and isinstance(params.get(node.name), str):
+        return params[node.name]
+    return None
+
+
+def _match(expression: Optional[exp.Expression], params: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    if not isinstance(expression, exp.Select):
+        return None
+    if any(expression.args.get(arg) for arg in ("joins", "group", "having", "distinct", "with", "laterals")):
+        return None
+    source = expression.args.get("from")
+    if source is None or not isinstance(source.this, exp.Table):
+        return None
+    if source.this.name != SOURCE_TABLE or source.this.args.get("db"):
+        return None
+
+    outputs: List[Tuple[str, str]] = []
+    for projection in expression.expressions:
+        aggregate = _aggregate(projection.unalias())
+        if aggregate is None:
+            return None
+        outputs.append((aggregate, projection.alias or projection.sql()))
+
+    lower = upper = None
+    flagged = False
+    where = expression.args.get("where")
+    conditions = list(where.this.flatten()) if where is not None and isinstance(where.this, exp.And) else []
+    if where is not None and not conditions:
+        conditions = [where.this]
+    for condition in conditions:
+        left, right = condition.this, condition.expression
+        value = _bound_value(right, params) if right is not None else None
+        if value is None:
+            return None
+        # Bounds keep their original SQL so bound parameters stay bound in the rewrite
+        if isinstance(condition, exp.EQ) and _column_name(left) == "status" and value == "flagged":
+            flagged = True
+        elif type(condition) in _LOWER_BOUNDS and _column_name(left) == "created_at" and lower is None:
+            lower = (_LOWER_BOUNDS[type(condition)], value, right.sql())
+        elif type(condition) in _UPPER_BOUNDS and _column_name(left) == "created_at" and upper is None:
+            upper = (_UPPER_BOUNDS[type(condition)], value, right.sql())
+        else:
+            return None
+
+    # The rollup only stores flagged counts, not flagged amounts
+    if flagged and any(aggregate != "count" for aggregate, _alias in outputs):
+        return None
+    limit = expression.args.get("limit")
+    return {"outputs": outputs, "lower": lower, "upper": upper, "flagged": flagged, "limit": limit}
+
+
+def _rollup_days(match: Dict[str, Any], first_raw_day: str) -> Optional[Tuple[str, Optional[str]]]:
+    # The earliest raw day may be partly archived, so it is always answered from raw rows
+    start = _next_day(first_raw_day)
+    if match["lower"]:
+        op, value, _bound = match["lower"]
+        day = _day(value)
+        if day is None:
+            return None
+        whole_day = op == ">=" and value[10:] in _MIDNIGHT_SUFFIXES
+        start = max(start, day if whole_day else _next_day(day))
+    end = None
+    if match["upper"]:
+        end = _day(match["upper"][1])
+        if end is None or start >= end:
+            return None
+    return start, end
+
+
+def _raw_part(match: Dict[str, Any], predicates: List[str]) -> str:
+    if match["flagged"]:
+        predicates = ["status = 'flagged'", *predicates]
+    return (
+        "SELECT SUM(amount) AS total_amount, COUNT(*) AS transaction_count "
+        f"FROM {SOURCE_TABLE} WHERE {' AND '.join(predicates)}"
+    )
+
+
+def _rewrite(match: Dict[str, Any], start: str, end: Optional[str]) -> str:
+    head = [f"created_at < {_literal(start)}"]
+    if match["lower"]:
+        head.insert(0, f"created_at {match['lower'][0]} {match['lower'][2]}")
+    rollup_filter = f"date >= {_literal(start)}"
+    if end is not None:
+        rollup_filter += f" AND date < {_literal(end)}"
+    count_column = "flagged_count" if match["flagged"] else "transaction_count"
+    parts = [
+        _raw_part(match, head),
+        f"SELECT SUM(total_amount) AS total_amount, SUM({count_column}) AS transaction_count "
+        f"FROM {ROLLUP_TABLE} WHERE {rollup_filter}",
+    ]
+    if end is not None:
+        tail = [f"created_at >= {_literal(end)}", f"created_at {match['upper'][0]} {match['upper'][2]}"]
+        parts.append(_raw_part(match, tail))
+
+    columns = {
+        "count": "COALESCE(SUM(transaction_count), 0)",
+        "sum": "SUM(total_amount)",
+        "avg": "SUM(total_amount) * 1.0 / NULLIF(SUM(transaction_count), 0)",
+    }
+    select = ", ".join(f"{columns[aggregate]} AS {exp.to_identifier(alias).sql()}" for aggregate, alias in match["outputs"])
+    sql = f"SELECT {select} FROM ({' UNION ALL '.join(parts)}) AS rollup_parts"
+    if match["limit"] is not None:
+        sql += f" {match['limit'].sql()}"
+    return sql
+
+
+def route_to_rollup(
+    db: Session, sql: str, params: Optional[Dict[str, Any]] = None
+) -> Tuple[str, Optional[Dict[str, Any]]]:
+    if not get_settings().query_rollups_enabled:
+        return sql, None
+    match = _match(analyze_sql(sql).expression, params or {})
+    if match is None or not is_derived_fresh(ROLLUP_TABLE, [SOURCE_TABLE]):
+        return sql, None
+    first_raw = db.execute(text(f"SELECT MIN(created_at) FROM {SOURCE_TABLE}")).scalar()
+    first_raw_day = _day(str(first_raw)) if first_raw is not None else None
+    if first_raw_day is None:
+        return sql, None
+    days = _rollup_days(match, first_raw_day)
+    if days is None:
+        return sql, None
+    start, end = days
+    return _rewrite(match, start, end), {
+        "table": ROLLUP_TABLE,
+        "original_sql": sql,
+        "rollup_start": start,
+        "rollup_end": end,
+    }
@@ -1,5 +1,6 @@
 from typing import Any, Dict, List, Optional, Tuple
 from datetime import datetime, timedelta
+from functools import lru_cache
 import re
 
 
@@ -47,46 +48,58 @@ def _format_dt(dt: datetime) -> str:
     return dt.strftime("%Y-%m-%d %H:%M:%S")
 
 
-def _detect_date_range(query: str) -> Optional[Tuple[str, str]]:
-    q = query.lower()
-    now = datetime.utcnow()
+def _now() -> datetime:
+    return datetime.utcnow()
 
-    if "today" in q:
-        start = datetime(now.year, now.month, now.day)
-        return _format_dt(start), _format_dt(now)
 
-    if "yesterday" in q:
-        end = datetime(now.year, now.month, now.day)
-        start = end - timedelta(days=1)
-        return _format_dt(start), _format_dt(end)
+def _ceil_minute(now: datetime) -> datetime:
+    # The exclusive end is rounded up so repeated questions bind identical parameters within a minute
+    floor = now.replace(second=0, microsecond=0)
+    return floor if floor == now else floor + timedelta(minutes=1)
 
-    if "this week" in q:
-        start = datetime(now.year, now.month, now.day) - timedelta(days=now.weekday())
-        return _format_dt(start), _format_dt(now)
 
+def _detect_period(query: str) -> Optional[Tuple[str, int]]:
+    q = query.lower()
+    if "today" in q:
+        return "today", 0
+    if "yesterday" in q:
+        return "yesterday", 0
+    if "this week" in q:
+        return "this_week", 0
     if "this month" in q:
-        start = datetime(now.year, now.month, 1)
-        return _format_dt(start), _format_dt(now)
+        return "this_month", 0
 
     match_days = re.search(r"(last|past)\s+(\d+)\s+days", q)
     if match_days:
-        days = int(match_days.group(2))
-        start = now - timedelta(days=days)
-        return _format_dt(start), _format_dt(now)
+        return "days", int(match_days.group(2))
 
     match_hours = re.search(r"(last|past)\s+(\d+)\s+hours", q)
     if match_hours:
-        hours = int(match_hours.group(2))
-        start = now - timedelta(hours=hours)
-        return _format_dt(start), _format_dt(now)
+        return "hours", int(match_hours.group(2))
 
     if "recent" in q:
-        start = now - timedelta(days=7)
-        return _format_dt(start), _format_dt(now)
-
+        return "days", 7
     return None
 
 
+def _period_range(period: Tuple[str, int], now: datetime) -> Tuple[str, str]:
+    kind, amount = period
+    # Calendar boundaries come from the real clock; only the end bound is rounded
+    midnight = datetime(now.year, now.month, now.day)
+    end = _ceil_minute(now)
+    if kind == "today":
+        return _format_dt(midnight), _format_dt(end)
+    if kind == "yesterday":
+        return _format_dt(midnight - timedelta(days=1)), _format_dt(midnight)
+    if kind == "this_week":
+        return _format_dt(midnight - timedelta(days=now.weekday())), _format_dt(end)
+    if kind == "this_month":
+        return _format_dt(datetime(now.year, now.month, 1)), _format_dt(end)
+    if kind == "days":
+        return _format_dt(end - timedelta(days=amount)), _format_dt(end)
+    return _format_dt(end - timedelta(hours=amount)), _format_dt(end)
+
+
 def _detect_intent(query: str) -> str:
     q = query.lower()
     if "count" in q or "number of" in q:
@@ -98,25 +111,28 @@ def _detect_intent(query: str) -> str:
     return "list"
 
 
-def generate_sql(query: str, domain: Optional[str], schema: Dict[str, List[str]]) -> Tuple[Optional[str], List[str], Dict[str, Any]]:
+@lru_cache(maxsize=512)
+def _build_template(
+    query: str, domain: Optional[str], schema_items: Tuple[Tuple[str, Tuple[str, ...]], ...]
+) -> Tuple[Optional[str], Tuple[str, ...], Dict[str, Any]]:
+    schema = {table: list(columns) for table, columns in schema_items}
     questions: List[str] = []
     meta: Dict[str, Any] = {"domain": domain, "intent": None, "table": None}
 
     table = _detect_table(query, list(schema.keys()))
     if not table:
         questions.append("Which dataset should I use: users, transactions, or login_events?")
-        return None, questions, meta
+        return None, tuple(questions), meta
 
     columns = schema[table]
     intent = _detect_intent(query)
     group_by = _detect_group_by(query, columns)
     filters = _detect_filters(query, table)
     limit = _detect_limit(query)
-    date_range = _detect_date_range(query)
+    period = _detect_period(query) if "created_at" in columns else None
 
-    if date_range and "created_at" in columns:
-        start, end = date_range
-        filters.append(f"created_at >= '{start}' AND created_at < '{end}'")
+    if period:
+        filters.append("created_at >= :start AND created_at < :end")
 
     meta.update(
         {
@@ -126,7 +142,7 @@ def generate_sql(query: str, domain: Optional[str], schema: Dict[str, List[str]]
             "group_by": group_by,
             "filters": filters,
             "limit": limit,
-            "date_range": date_range,
+            "period": period,
         }
     )
 
@@ -135,26 +151,51 @@ def generate_sql(query: str, domain: Optional[str], schema: Dict[str, List[str]]
     if group_by:
         if group_by not in columns:
             questions.append(f"Column '{group_by}' is not in {table}. Choose from: {', '.join(columns)}")
-            return None, questions, meta
+            return None, tuple(questions), meta
         sql = f"SELECT {group_by}, COUNT(*) AS count FROM {table}{where_clause} GROUP BY {group_by} ORDER BY count DESC"
-        return sql, [], meta
+        return sql, (), meta
 
     if intent == "count":
         sql = f"SELECT COUNT(*) AS count FROM {table}{where_clause}"
-        return sql, [], meta
+        return sql, (), meta
 
     if intent in {"sum", "avg"}:
         if "amount" not in columns:
             questions.append(f"'{table}' does not include an amount column. Choose a dataset with amounts.")
-            return None, questions, meta
+            return None, tuple(questions), meta
         metric = "SUM" if intent == "sum" else "AVG"
         alias = "total_amount" if intent == "sum" else "avg_amount"
         sql = f"SELECT {metric}(amount) AS {alias} FROM {table}{where_clause}"
-        return sql, [], meta
+        return sql, (), meta
 
     order_clause = ""
     if "recent" in query.lower() and "created_at" in columns:
         order_clause = " ORDER BY created_at DESC"
 
     sql = f"SELECT * FROM {table}{where_clause}{order_clause} LIMIT {limit}"
-    return sql, [], meta
+    return sql, (), meta
+
+
+def _template_key(query: str) -> str:
+    return " ".join(query.lower().split())
+
+
+def generate_sql(query: str, domain: Optional[str], schema: Dict[str, List[str]]) -> Tuple[Optional[str], List[str], Dict[str, Any]]:
+    schema_items = tuple((table, tuple(columns)) for table, columns in schema.items())
+    sql, questions, template_meta = _build_template(_template_key(query), domain, schema_items)
+    meta = dict(template_meta)
+    meta["params"] = {}
+    if meta.get("period"):
+        start, end = _period_range(meta["period"], _now())
+        meta["date_range"] = (start, end)
+        meta["params"] = {"start": start, "end": end}
+    return sql, list(questions), meta
+
+
+def rebind_period(query: str, params: Dict[str, Any]) -> Dict[str, Any]:
+    # Relative windows ("recent", "last 7 days") move with the clock, so reused SQL needs fresh bounds
+    period = _detect_period(_template_key(query))
+    if not period or "start" not in params or "end" not in params:
+        return params
+    start, end = _period_range(period, _now())
+    return {**params, "start": start, "end": end}
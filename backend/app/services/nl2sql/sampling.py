@@ -0,0 +1,174 @@
+import math
+from datetime import datetime
+from statistics import NormalDist
+from typing import Any, Dict, List, Optional, Tuple
+from sqlglot import exp
+from app.db.versions import is_derived_fresh
+from app.models.analytics import SAMPLE_STRATUM_COLUMNS, SAMPLED_TABLES
+from app.services.nl2sql.analysis import analyze_sql
+
+_BOUNDS = (exp.GTE, exp.GT, exp.LT, exp.LTE)
+
+
+def _day(value: Any) -> Optional[str]:
+    if not isinstance(value, str):
+        return None
+    try:
+        return datetime.strptime(value[:10], "%Y-%m-%d").strftime("%Y-%m-%d")
+    except ValueError:
+        return None
+
+
+def _bound_value(node: exp.Expression, params: Dict[str, Any]) -> Any:
+    if isinstance(node, exp.Literal) and node.is_string:
+        return node.this
+    if isinstance(node, exp.Placeholder):
+        return params.get(node.name)
+    return None
+
+
+def _aggregate(node: exp.Expression, columns: set) -> Optional[Tuple[str, Optional[str]]]:
+    target = node.args.get("this")
+    if isinstance(node, exp.Count):
+        if isinstance(target, exp.Star) or target == exp.Literal.number(1):
+            return "count", None
+        if isinstance(target, exp.Column) and target.name in columns:
+            return "count", target.name
+        return None
+    if isinstance(node, (exp.Sum, exp.Avg)) and isinstance(target, exp.Column) and target.name in columns:
+        return ("sum" if isinstance(node, exp.Sum) else "avg"), target.name
+    return None
+
+
+def _stratum_filter(condition: Optional[exp.Expression], params: Dict[str, Any]) -> List[str]:
+    # Strata are whole days, so only days outside the created_at bounds can be skipped outright
+    conjuncts = list(condition.flatten()) if isinstance(condition, exp.And) else [condition]
+    filters: List[str] = []
+    for node in conjuncts:
+        if not isinstance(node, _BOUNDS) or not isinstance(node.this, exp.Column) or node.this.name != "created_at":
+            continue
+        day = _day(_bound_value(node.expression, params))
+        if day is None:
+            continue
+        op = ">=" if isinstance(node, (exp.GTE, exp.GT)) else "<="
+        filters.append(f"stratum {op} {exp.Literal.string(day).sql()}")
+    return filters
+
+
+class SampleQuery:
+    def __init__(self, table: str, sql: str, outputs: List[Tuple[str, str, Optional[str]]]) -> None:
+        self.table = table
+        self.sql = sql
+        self.outputs = outputs
+
+    def estimate(self, strata: List[Dict[str, Any]], confidence: float) -> Tuple[List[Dict[str, Any]], Dict[str, Any]]:
+        z = NormalDist().inv_cdf(0.5 + confidence / 2)
+        row: Dict[str, Any] = {}
+        estimates: Dict[str, Dict[str, Any]] = {}
+        for alias, aggregate, column in self.outputs:
+            value, stderr = self._estimate(strata, aggregate, column)
+            if value is None:
+                estimates[alias] = {"value": None, "low": None, "high": None, "stderr": None}
+            elif aggregate == "count":
+                value = round(value)
+                estimates[alias] = {
+                    "value": value,
+                    "low": max(0, math.floor(value - z * stderr)),
+                    "high": math.ceil(value + z * stderr),
+                    "stderr": stderr,
+                }
+            else:
+                estimates[alias] = {"value": value, "low": value - z * stderr, "high": value + z * stderr, "stderr": stderr}
+            row[alias] = estimates[alias]["value"]
+        return [row], {
+            "table": self.table,
+            "confidence": confidence,
+            "sampled_rows": sum(stratum["sampled"] for stratum in strata),
+            "population_rows": sum(stratum["population"] for stratum in strata),
+            "estimates": estimates,
+        }
+
+    def _estimate(self, strata: List[Dict[str, Any]], aggregate: str, column: Optional[str]) -> Tuple[Optional[float], float]:
+        if aggregate == "count":
+            key = f"n_{column}" if column else "matched"
+            total, variance = _stratified_total(strata, lambda s: (s[key] or 0, s[key] or 0))
+            return total, math.sqrt(variance)
+        total, variance = _stratified_total(strata, lambda s: (s[f"s_{column}"] or 0, s[f"q_{column}"] or 0))
+        if aggregate == "sum":
+            return total, math.sqrt(variance)
+        count, _ = _stratified_total(strata, lambda s: (s[f"n_{column}"] or 0, s[f"n_{column}"] or 0))
+        if not count:
+            return None, 0.0
+        ratio = total / count
+
+        # Ratio estimator: the error comes from the spread of each matching value around the mean
+        def residuals(s: Dict[str, Any]) -> Tuple[float, float]:
+            n, y, yy = s[f"n_{column}"] or 0, s[f"s_{column}"] or 0, s[f"q_{column}"] or 0
+            return y - ratio * n, yy - 2 * ratio * y + ratio * ratio * n
+
+        _, residual_variance = _stratified_total(strata, residuals)
+        return ratio, math.sqrt(residual_variance) / count
+
+
+def _stratified_total(strata: List[Dict[str, Any]], sums) -> Tuple[float, float]:
+    total = variance = 0.0
+    for stratum in strata:
+        population, sampled = stratum["population"], stratum["sampled"]
+        linear, square = sums(stratum)
+        total += population * linear / sampled
+        if 1 < sampled < population:
+            spread = max(0.0, (square - linear * linear / sampled) / (sampled - 1))
+            variance += population * population * (1 - sampled / population) * spread / sampled
+    return total, variance
+
+
+def plan_sample_query(sql: str, params: Optional[Dict[str, Any]] = None) -> Optional[SampleQuery]:
+    expression = analyze_sql(sql).expression
+    if not isinstance(expression, exp.Select):
+        return None
+    if any(expression.args.get(arg) for arg in ("joins", "group", "having", "distinct", "with", "laterals")):
+        return None
+    source = expression.args.get("from")
+    if source is None or not isinstance(source.this, exp.Table) or source.this.args.get("db"):
+        return None
+    model = SAMPLED_TABLES.get(source.this.name)
+    if model is None or not is_derived_fresh(model.__tablename__, [source.this.name]):
+        return None
+    columns = {column.name for column in model.__table__.columns if column.name not in SAMPLE_STRATUM_COLUMNS}
+
+    outputs: List[Tuple[str, str, Optional[str]]] = []
+    for projection in expression.expressions:
+        aggregate = _aggregate(projection.unalias(), columns)
+        if aggregate is None:
+            return None
+        outputs.append((projection.alias or projection.sql(), *aggregate))
+
+    where = expression.args.get("where")
+    condition = where.this if where is not None else None
+    if condition is not None:
+        if condition.find(exp.Select, exp.AggFunc):
+            return None
+        if any(column.name not in columns for column in condition.find_all(exp.Column)):
+            return None
+
+    # Non-matching rows still count towards each stratum's sample size, so filters move into CASE
+    match = f"({condition.sql()})" if condition is not None else "1 = 1"
+    selects = [
+        "COUNT(*) AS sampled",
+        "MAX(stratum_rows) AS population",
+        f"SUM(CASE WHEN {match} THEN 1 ELSE 0 END) AS matched",
+    ]
+    for column in sorted({column for _alias, _aggregate, column in outputs if column}):
+        present = f"{match} AND {column} IS NOT NULL"
+        selects += [
+            f"SUM(CASE WHEN {present} THEN 1 ELSE 0 END) AS n_{column}",
+            f"SUM(CASE WHEN {present} THEN {column} ELSE 0 END) AS s_{column}",
+            f"SUM(CASE WHEN {present} THEN {column} * {column} ELSE 0 END) AS q_{column}",
+        ]
+    alias = exp.to_identifier(source.this.alias_or_name).sql()
+    sample_sql = f"SELECT {', '.join(selects)} FROM {model.__tablename__} AS {alias}"
+    filters = _stratum_filter(condition, params or {}) if condition is not None else []
+    if filters:
+        sample_sql += f" WHERE {' AND '.join(filters)}"
+    sample_sql += " GROUP BY stratum"
+    return SampleQuery(model.__tablename__, sample_sql, outputs)
@@ -1,6 +1,34 @@
-from typing import Dict, List
-from sqlalchemy import inspect
+import re
+from collections import Counter, defaultdict
+from functools import lru_cache
+from typing import Dict, List, Optional, Set, Tuple
+from sqlalchemy import inspect, text
 from sqlalchemy.orm import Session
+from app.core.config import get_settings
+from app.models.analytics import SAMPLED_TABLES
+from app.services.nl2sql.rules import TABLE_SYNONYMS
+
+OPERATIONAL_TABLES = {
+    "ingestion_runs",
+    "scan_history",
+    "scan_findings",
+    "sentinel_mission_state",
+    "sentinel_entity_counts",
+    "schema_registry",
+    "data_centers",
+    "data_center_sources",
+}
+# Sentinel bookkeeping holds compressed payloads and cursors no question can use, so naming it is not enough
+INTERNAL_TABLES = {"scan_findings", "sentinel_mission_state", "sentinel_entity_counts"}
+# Samples serve only the explicit approximate path; offered to the LLM they would pass for the exact tables
+SAMPLE_TABLES = {model.__tablename__ for model in SAMPLED_TABLES.values()}
+_KEY_COLUMNS = {"id", "created_at"}
+_STOPWORDS = {
+    "a", "all", "an", "and", "are", "at", "by", "for", "how", "id", "in", "is", "list", "many",
+    "me", "of", "on", "or", "show", "the", "to", "what", "with",
+}
+_TABLE_WEIGHT = 3
+_COLUMN_WEIGHT = 1
 
 
 def get_schema_profile(db: Session) -> Dict[str, List[str]]:
@@ -10,3 +38,100 @@ def get_schema_profile(db: Session) -> Dict[str, List[str]]:
         columns = inspector.get_columns(table)
         profile[table] = [column["name"] for column in columns]
     return profile
+
+
+def get_schema_version(db: Session) -> str:
+    # A short-lived connection, like the inspector's, so the session does not pin one before its first query
+    with db.bind.connect() as conn:
+        # SQLite bumps schema_version on every DDL change; elsewhere the column catalogue is hashed in one query
+        if conn.dialect.name == "sqlite":
+            return str(conn.execute(text("PRAGMA schema_version")).scalar())
+        return str(
+            conn.execute(
+                text(
+                    "SELECT md5(string_agg(table_name || '.' || column_name || ':' || data_type, ',' "
+                    "ORDER BY table_name, ordinal_position)) FROM information_schema.columns "
+                    "WHERE table_schema = current_schema()"
+                )
+            ).scalar()
+        )
+
+
+def is_operational_table(table: str) -> bool:
+    return table in OPERATIONAL_TABLES or table.endswith("_archive")
+
+
+def _stem(word: str) -> str:
+    return word[:-1] if len(word) > 3 and word.endswith("s") and not word.endswith("ss") else word
+
+
+def _words(text: str) -> List[str]:
+    return [_stem(word) for word in re.findall(r"[a-z0-9]+", text.lower().replace("_", " ")) if word not in _STOPWORDS]
+
+
+def format_schema(schema: Dict[str, List[str]]) -> str:
+    return "\n".join(f"{table}({', '.join(columns)})" for table, columns in schema.items())
+
+
+def estimate_tokens(text: str) -> int:
+    # Roughly four characters per token for schema-like text
+    return max(1, len(text) // 4)
+
+
+@lru_cache(maxsize=32)
+def _schema_index(
+    schema_items: Tuple[Tuple[str, Tuple[str, ...]], ...]
+) -> Dict[str, List[Tuple[str, Optional[str], int]]]:
+    index: Dict[str, List[Tuple[str, Optional[str], int]]] = defaultdict(list)
+    for table, columns in schema_items:
+        for word in set(_words(table)) | {_stem(alias) for alias in TABLE_SYNONYMS.get(table, [])}:
+            index[word].append((table, None, _TABLE_WEIGHT))
+        for column in columns:
+            for word in set(_words(column)):
+                index[word].append((table, column, _COLUMN_WEIGHT))
+    return dict(index)
+
+
+def _prunable_columns(columns: List[str], hits: Set[str]) -> List[str]:
+    return [column for column in columns if column in hits or column in _KEY_COLUMNS or column.endswith("_id")]
+
+
+def select_schema(query: str, schema: Dict[str, List[str]]) -> Dict[str, List[str]]:
+    settings = get_settings()
+    schema = {table: columns for table, columns in schema.items() if table not in SAMPLE_TABLES}
+    index = _schema_index(tuple((table, tuple(columns)) for table, columns in schema.items()))
+    lowered = query.lower()
+
+    scores: Counter = Counter()
+    column_hits: Dict[str, Set[str]] = defaultdict(set)
+    for word in _words(query):
+        for table, column, weight in index.get(word, ()):
+            scores[table] += weight
+            if column:
+                column_hits[table].add(column)
+
+    def _allowed(table: str) -> bool:
+        if settings.llm_schema_include_operational or not is_operational_table(table):
+            return True
+        if table in INTERNAL_TABLES:
+            return False
+        # Operational tables are only offered when the question names them outright
+        return table in lowered or table.replace("_", " ") in lowered
+
+    ranked = [table for table, _score in scores.most_common() if _allowed(table)][: settings.llm_schema_max_tables]
+    if not ranked:
+        ranked = [table for table in schema if not is_operational_table(table)] or list(schema)
+
+    selected: Dict[str, List[str]] = {}
+    used = 0
+    for table in ranked:
+        columns = schema[table]
+        cost = estimate_tokens(format_schema({table: columns}))
+        if used + cost > settings.llm_schema_token_budget:
+            columns = _prunable_columns(columns, column_hits[table])
+            cost = estimate_tokens(format_schema({table: columns}))
+            if selected and used + cost > settings.llm_schema_token_budget:
+                break
+        selected[table] = columns
+        used += cost
+    return selected
@@ -0,0 +1,60 @@
+import asyncio
+import json
+import logging
+from typing import Any, AsyncIterator, Dict, Optional
+from sqlalchemy import text
+from app.db.session import AsyncSessionLocalAnalytics
+from app.services.nl2sql.cache import estimate_record_bytes
+from app.services.nl2sql.governor import QueryBudget, QueryRejected, agoverned, check_limits
+
+logger = logging.getLogger(__name__)
+
+
+def _line(payload: Dict[str, Any]) -> bytes:
+    return (json.dumps(payload, default=str) + "\n").encode("utf-8")
+
+
+async def astream_ndjson(
+    sql: str,
+    params: Dict[str, Any],
+    generation: Dict[str, Any],
+    batch_size: int,
+    budget: Optional[QueryBudget] = None,
+) -> AsyncIterator[bytes]:
+    budget = budget or QueryBudget.from_settings()
+    # The request-scoped session is closed before the body is sent, so the stream owns its own
+    async with AsyncSessionLocalAnalytics() as db:
+        row_count = 0
+        byte_count = 0
+        try:
+            conn = await db.connection()
+            async with agoverned(conn, budget):
+                result = await conn.stream(text(sql), params)
+                try:
+                    yield _line({"type": "meta", "sql": sql, "params": params, "columns": list(result.keys()), **generation})
+                    async for partition in result.partitions(batch_size):
+                        # Each chunk is checked before it is sent; the one crossing a limit ends the stream
+                        chunk_bytes = sum(estimate_record_bytes(record) for record in partition)
+                        check_limits(budget, row_count + len(partition), byte_count + chunk_bytes)
+                        if budget.should_stop():
+                            raise budget.stop_error()
+                        row_count += len(partition)
+                        byte_count += chunk_bytes
+                        yield _line({"type": "rows", "rows": [list(row) for row in partition]})
+                except (asyncio.CancelledError, GeneratorExit):
+                    # The client went away; the progress handler stops any statement still running in the driver thread
+                    budget.cancel()
+                    raise
+                finally:
+                    await result.close()
+        except QueryRejected as exc:
+            error = {"type": "error", "code": exc.code, "message": exc.message, "details": exc.details}
+            yield _line({**error, "row_count": row_count})
+            return
+        except Exception as exc:
+            # Driver errors carry SQL and connection details, so the client gets the same message as a failed query
+            logger.exception("nl2sql stream failed: %s", exc)
+            error = {"type": "error", "code": "QUERY_FAILED", "message": "Query failed unexpectedly."}
+            yield _line({**error, "row_count": row_count})
+            return
+        yield _line({"type": "end", "row_count": row_count})
@@ -0,0 +1,50 @@
+import asyncio
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+from typing import Callable, Dict, Optional
+
+_timings: ContextVar[Optional[Dict[str, float]]] = ContextVar("nl2sql_stage_timings", default=None)
+
+
+@contextmanager
+def collect_stage_timings():
+    timings: Dict[str, float] = defaultdict(float)
+    token = _timings.set(timings)
+    try:
+        yield timings
+    finally:
+        _timings.reset(token)
+
+
+@contextmanager
+def stage(name: str):
+    timings = _timings.get()
+    if timings is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings[name] += (time.perf_counter() - started) * 1000
+
+
+def timed(name: str, fn: Callable) -> Callable:
+    if asyncio.iscoroutinefunction(fn):
+
+        @wraps(fn)
+        async def _timed_async(*args, **kwargs):
+            with stage(name):
+                return await fn(*args, **kwargs)
+
+        return _timed_async
+
+    @wraps(fn)
+    def _timed(*args, **kwargs):
+        with stage(name):
+            return fn(*args, **kwargs)
+
+    return _timed
@@ -1,30 +1,14 @@
 from typing import Optional
-import sqlglot
-from sqlglot import exp
+from app.services.nl2sql.analysis import analyze_sql
 
 
 def is_read_only_sql(sql: str) -> bool:
-    try:
-        expression = sqlglot.parse_one(sql)
-    except sqlglot.errors.ParseError:
-        return False
-    if not isinstance(expression, exp.Select):
-        return False
-    banned = (exp.Insert, exp.Update, exp.Delete, exp.Drop, exp.AlterTable, exp.TruncateTable)
-    return not expression.find(banned)
+    return analyze_sql(sql).read_only
 
 
 def has_single_statement(sql: str) -> bool:
-    try:
-        statements = sqlglot.parse(sql)
-    except sqlglot.errors.ParseError:
-        return False
-    return len(statements) == 1
+    return analyze_sql(sql).single_statement
 
 
 def validate_sql(sql: str) -> Optional[str]:
-    if not has_single_statement(sql):
-        return "Only a single SQL statement is allowed."
-    if not is_read_only_sql(sql):
-        return "SQL must be read-only (SELECT statements only)."
-    return None
+    return analyze_sql(sql).error()
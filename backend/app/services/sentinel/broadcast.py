@@ -0,0 +1,131 @@
+import logging
+import threading
+import time
+import uuid
+from functools import lru_cache
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+from app.core.config import get_settings
+from app.core.serialization import dumps
+from app.db.session import SessionLocalPrimary
+from app.services.sentinel.engine import run_scan_stream
+
+logger = logging.getLogger(__name__)
+
+# Progress events a lagging client can lose; the outcome events are always delivered
+_DROPPABLE = {"status", "mission", "deep_dive"}
+_FINAL = {"complete", "error"}
+
+
+class ScanBroadcast:
+    def __init__(self, domain: str, columnar: bool, incremental: bool) -> None:
+        self.id = uuid.uuid4().hex[:12]
+        self.key = (domain, columnar, incremental)
+        self.frames: List[Tuple[str, bytes]] = []
+        self.done = False
+        self.finished_at: Optional[float] = None
+        self._condition = threading.Condition()
+
+    def publish(self, event: str, payload: Dict[str, Any]) -> None:
+        with self._condition:
+            seq = len(self.frames)
+            # Frames are rendered once and shared, so each extra subscriber costs no serialisation
+            frame = f"id: {self.id}:{seq}\nevent: {event}\ndata: ".encode() + dumps(payload) + b"\n\n"
+            self.frames.append((event, frame))
+            self._condition.notify_all()
+
+    def close(self) -> None:
+        with self._condition:
+            self.done = True
+            self.finished_at = time.monotonic()
+            self._condition.notify_all()
+
+    def follow(self, after: int = -1, heartbeat: Optional[float] = None) -> Iterator[bytes]:
+        settings = get_settings()
+        heartbeat = heartbeat if heartbeat is not None else settings.sentinel_stream_heartbeat_seconds
+        max_backlog = max(1, settings.sentinel_stream_max_backlog)
+        position = after + 1
+        while True:
+            with self._condition:
+                if position >= len(self.frames) and not self.done:
+                    self._condition.wait(heartbeat)
+                frames = self.frames[position:]
+                done = self.done
+            if not frames:
+                if done:
+                    return
+                yield b": keep-alive\n\n"
+                continue
+            # Each client reads at its own pace from the shared log; one far behind skips progress frames
+            skipped = 0
+            if len(frames) > max_backlog:
+                kept = [(event, frame) for event, frame in frames if event not in _DROPPABLE]
+                skipped = len(frames) - len(kept)
+            else:
+                kept = frames
+            if skipped:
+                yield f"event: lagged\ndata: {{\"skipped\": {skipped}}}\n\n".encode()
+            for event, frame in kept:
+                yield frame
+                if event in _FINAL:
+                    return
+            position += len(frames)
+
+
+class ScanBroadcaster:
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._active: Dict[Tuple[str, bool, bool], ScanBroadcast] = {}
+        self._by_id: Dict[str, ScanBroadcast] = {}
+
+    def _prune(self) -> None:
+        retention = get_settings().sentinel_stream_retention_seconds
+        now = time.monotonic()
+        for broadcast_id, broadcast in list(self._by_id.items()):
+            if broadcast.done and now - broadcast.finished_at > retention:
+                del self._by_id[broadcast_id]
+
+    def resume(self, last_event_id: Optional[str]) -> Optional[Tuple[ScanBroadcast, int]]:
+        broadcast_id, _, seq = (last_event_id or "").partition(":")
+        with self._lock:
+            self._prune()
+            broadcast = self._by_id.get(broadcast_id)
+        if broadcast is None or not seq.isdigit():
+            return None
+        return broadcast, int(seq)
+
+    def join(self, domain: str, columnar: bool = False, incremental: bool = False) -> ScanBroadcast:
+        key = (domain, columnar, incremental)
+        with self._lock:
+            self._prune()
+            broadcast = self._active.get(key)
+            if broadcast is not None and not broadcast.done:
+                return broadcast
+            broadcast = ScanBroadcast(domain, columnar, incremental)
+            self._active[key] = broadcast
+            self._by_id[broadcast.id] = broadcast
+        threading.Thread(target=self._produce, args=(broadcast,), name=f"sentinel-stream-{domain}", daemon=True).start()
+        return broadcast
+
+    def _produce(self, broadcast: ScanBroadcast) -> None:
+        domain, columnar, incremental = broadcast.key
+        try:
+            with SessionLocalPrimary() as db:
+                for event, payload in run_scan_stream(db, domain, columnar=columnar, incremental=incremental):
+                    broadcast.publish(event, payload)
+        except Exception as exc:
+            logger.exception("sentinel stream error domain=%s: %s", domain, exc)
+            broadcast.publish("error", {"status": "failed", "domain": domain, "error": str(exc)})
+        finally:
+            with self._lock:
+                if self._active.get(broadcast.key) is broadcast:
+                    del self._active[broadcast.key]
+            broadcast.close()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"active": len(self._active), "retained": len(self._by_id)}
+
+
+@lru_cache
+def get_scan_broadcaster() -> ScanBroadcaster:
+    return ScanBroadcaster()
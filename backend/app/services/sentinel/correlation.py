@@ -0,0 +1,100 @@
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+from app.core.config import get_settings
+from app.models.demo import LoginEvent, Transaction
+
+CORRELATION_RISK_WEIGHT = 5
+
+
+def _entity_batches(db: Session, since: datetime, batch_size: int) -> Iterator[Tuple[int, int]]:
+    # Users with a failed login drive the join; keyset ranges keep each pair of index scans bounded
+    after: Optional[int] = None
+    while True:
+        stmt = select(LoginEvent.user_id).where(LoginEvent.success == 0, LoginEvent.created_at >= since)
+        if after is not None:
+            stmt = stmt.where(LoginEvent.user_id > after)
+        user_ids = list(db.execute(stmt.distinct().order_by(LoginEvent.user_id).limit(batch_size)).scalars())
+        if not user_ids:
+            return
+        yield user_ids[0], user_ids[-1]
+        if len(user_ids) < batch_size:
+            return
+        after = user_ids[-1]
+
+
+def _failed_logins(db: Session, first: int, last: int, since: datetime) -> List[Tuple[int, datetime]]:
+    stmt = (
+        select(LoginEvent.user_id, LoginEvent.created_at)
+        .where(LoginEvent.user_id.between(first, last), LoginEvent.created_at >= since, LoginEvent.success == 0)
+        .order_by(LoginEvent.user_id, LoginEvent.created_at)
+    )
+    return [(row.user_id, row.created_at) for row in db.execute(stmt)]
+
+
+def _flagged_transactions(db: Session, first: int, last: int, since: datetime) -> List[Tuple[int, datetime, float]]:
+    stmt = (
+        select(Transaction.user_id, Transaction.created_at, Transaction.amount)
+        .where(Transaction.user_id.between(first, last), Transaction.created_at >= since, Transaction.status == "flagged")
+        .order_by(Transaction.user_id, Transaction.created_at)
+    )
+    return [(row.user_id, row.created_at, row.amount) for row in db.execute(stmt)]
+
+
+def merge_correlated(
+    logins: Sequence[Tuple[int, datetime]],
+    flagged: Sequence[Tuple[int, datetime, float]],
+    window: timedelta,
+) -> Dict[int, Dict[str, Any]]:
+    # Both inputs are ordered by (user_id, created_at), so one forward pass pairs each
+    # flagged transaction with the latest failed login at or before it
+    entities: Dict[int, Dict[str, Any]] = {}
+    position = 0
+    latest: Optional[Tuple[int, datetime]] = None
+    for user_id, created_at, amount in flagged:
+        while position < len(logins) and logins[position] <= (user_id, created_at):
+            latest = logins[position]
+            position += 1
+        if latest is None or latest[0] != user_id or created_at - latest[1] > window:
+            continue
+        gap = (created_at - latest[1]).total_seconds() / 60
+        entity = entities.setdefault(
+            user_id, {"user_id": user_id, "correlated": 0, "amount": 0.0, "min_gap_minutes": gap, "last_flagged_at": None}
+        )
+        entity["correlated"] += 1
+        entity["amount"] += amount or 0.0
+        entity["min_gap_minutes"] = min(entity["min_gap_minutes"], gap)
+        entity["last_flagged_at"] = created_at.isoformat()
+    return entities
+
+
+def correlate_failed_then_flagged(
+    db: Session, window_minutes: Optional[int] = None, lookback_hours: Optional[int] = None
+) -> Dict[str, Any]:
+    settings = get_settings()
+    if window_minutes is None:
+        window_minutes = settings.sentinel_correlation_window_minutes
+    if lookback_hours is None:
+        lookback_hours = settings.sentinel_correlation_lookback_hours
+    window = timedelta(minutes=window_minutes)
+    since = datetime.utcnow() - timedelta(hours=lookback_hours)
+    entities: List[Dict[str, Any]] = []
+    batches = 0
+    for first, last in _entity_batches(db, since - window, max(1, settings.sentinel_correlation_batch_size)):
+        batches += 1
+        # Logins start one window earlier so a transaction at the edge still sees the login before it
+        logins = _failed_logins(db, first, last, since - window)
+        flagged = _flagged_transactions(db, first, last, since)
+        entities.extend(merge_correlated(logins, flagged, window).values())
+    for entity in entities:
+        entity["min_gap_minutes"] = round(entity["min_gap_minutes"], 2)
+        entity["amount"] = round(entity["amount"], 2)
+        entity["risk"] = min(entity["correlated"], 10) * CORRELATION_RISK_WEIGHT
+    entities.sort(key=lambda entity: (entity["risk"], entity["amount"]), reverse=True)
+    return {
+        "entities": entities,
+        "window_minutes": window_minutes,
+        "since": since.isoformat(),
+        "batches": batches,
+    }
@@ -1,11 +1,21 @@
-import json
+import logging
+import threading
 import uuid
-from typing import Any, Dict, Iterable, List, Optional, Tuple
-from sqlalchemy import select
+from contextlib import ExitStack, contextmanager, nullcontext
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
 from sqlalchemy.orm import Session
-from app.models.sentinel import ScanHistory
-from app.services.nl2sql.engine import run_query_pipeline
-
+from app.core.config import get_settings
+from app.db.session import SessionLocalAnalytics
+from app.services.nl2sql.columnar import payload_to_rows, rows_to_payload
+from app.services.nl2sql.governor import QueryRejected
+from app.services.sentinel.correlation import CORRELATION_RISK_WEIGHT, correlate_failed_then_flagged
+from app.services.sentinel.fusion import FusedMission, plan_fusion, run_fused
+from app.services.sentinel.history import save_scan
+from app.services.sentinel.incremental import MissionCursor, open_cursors, run_incremental, supports_incremental
+from app.services.sentinel.missions import run_mission_query
+
+logger = logging.getLogger(__name__)
 
 DOMAIN_MISSIONS: Dict[str, List[Dict[str, Any]]] = {
     "security": [
@@ -30,6 +40,12 @@ DOMAIN_MISSIONS: Dict[str, List[Dict[str, Any]]] = {
     ],
 }
 
+DEEP_DIVE_RISK = 6
+
+# Incremental scans read and advance shared watermarks, so two scans sharing a mission must not interleave
+_cursor_locks: Dict[str, threading.Lock] = {}
+_cursor_locks_guard = threading.Lock()
+
 DEEP_DIVE_QUERIES: Dict[str, str] = {
     "failed_logins": "Show failed logins by user_id",
     "flagged_transactions": "List flagged transactions by user_id",
@@ -37,15 +53,117 @@ DEEP_DIVE_QUERIES: Dict[str, str] = {
 }
 
 
-def _calc_risk(rows: List[Dict[str, Any]], weight: int) -> int:
-    if not rows:
+def _calc_risk(row_count: int, weight: int) -> int:
+    if not row_count:
         return 0
-    base = min(len(rows), 10)
+    base = min(row_count, 10)
     return base * weight
 
 
-def _mission_result(db: Session, mission: Dict[str, Any], domain: str) -> Dict[str, Any]:
-    result = run_query_pipeline(db, mission["query"], domain)
+def _row_count(result: Dict[str, Any]) -> int:
+    if "row_count" in result:
+        return result["row_count"]
+    if "columnar" in result:
+        return result["columnar"]["row_count"]
+    return len(result.get("rows", []))
+
+
+def _rows_field(result: Dict[str, Any]) -> Dict[str, Any]:
+    if "columnar" in result:
+        return {"columnar": result["columnar"]}
+    return {"rows": result.get("rows", [])}
+
+
+def convert_findings(scan: Dict[str, Any], columnar: bool) -> Dict[str, Any]:
+    # History keeps findings in the format the scan ran with; readers may ask for the other one
+    findings = []
+    for finding in scan.get("findings", []):
+        finding = dict(finding)
+        if columnar and "rows" in finding:
+            finding["columnar"] = rows_to_payload(finding.pop("rows"))
+        elif not columnar and "columnar" in finding:
+            finding["rows"] = payload_to_rows(finding.pop("columnar"))
+        findings.append(finding)
+    return {**scan, "findings": findings}
+
+
+def _domain_missions(domain: str) -> List[Dict[str, Any]]:
+    if domain != "all":
+        return DOMAIN_MISSIONS.get(domain, DOMAIN_MISSIONS["general"])
+    missions: Dict[str, Dict[str, Any]] = {}
+    for domain_missions in DOMAIN_MISSIONS.values():
+        for mission in domain_missions:
+            missions.setdefault(mission["id"], mission)
+    return list(missions.values())
+
+
+def _mission_result(db: Session, mission: Dict[str, Any], domain: str, columnar: bool = False) -> Dict[str, Any]:
+    return _finding(mission, run_mission_query(db, mission["query"], domain, columnar=columnar))
+
+
+def _mission_task(db: Session, mission: Dict[str, Any], domain: str, columnar: bool = False) -> List[Dict[str, Any]]:
+    return [_mission_result(db, mission, domain, columnar)]
+
+
+def _fused_task(
+    db: Session, table: str, group: List[FusedMission], domain: str, columnar: bool = False
+) -> List[Dict[str, Any]]:
+    try:
+        results = run_fused(db, table, group, columnar)
+    except QueryRejected:
+        db.rollback()
+        return [_mission_result(db, fused.mission, domain, columnar) for fused in group]
+    return [{**_finding(fused.mission, result), "fused": result["fused"]} for fused, result in zip(group, results)]
+
+
+def _incremental_task(
+    db: Session, table: str, group: List[FusedMission], since_ids: List[int], domain: str, columnar: bool = False
+) -> List[Dict[str, Any]]:
+    try:
+        results = run_incremental(db, table, group, since_ids, columnar)
+    except QueryRejected as exc:
+        # The watermarks stay where they are, so the finding says it is a full listing rather than a delta
+        logger.warning("sentinel incremental scan fell back table=%s code=%s: %s", table, exc.code, exc.message)
+        db.rollback()
+        fallback = {"code": exc.code, "message": exc.message}
+        return [{**_mission_result(db, fused.mission, domain, columnar), "incremental_fallback": fallback} for fused in group]
+    return [
+        {**_finding(fused.mission, result), "incremental": result["incremental"]} for fused, result in zip(group, results)
+    ]
+
+
+def _advance(cursor: MissionCursor, finding: Dict[str, Any]) -> Dict[str, Any]:
+    window = finding.pop("incremental", None)
+    if window is None:
+        return finding
+    cursor.advance(finding["match_count"], window["entities"], window["since_id"], window["until_id"])
+    rebaselined = cursor.rebaseline
+    running = cursor.state.match_count
+    return {
+        **finding,
+        "new_rows": finding["match_count"],
+        "match_count": running,
+        "risk": _calc_risk(running, cursor.mission["risk_weight"]),
+        "incremental": {"since_id": window["since_id"], "until_id": window["until_id"], "rebaselined": rebaselined},
+    }
+
+
+def _entity_deep_dive(cursor: MissionCursor, columnar: bool = False) -> Dict[str, Any]:
+    # The running per-entity counts already answer the deep dive, so no follow-up query is needed
+    mission_id = cursor.mission["id"]
+    rows = cursor.top_entities(get_settings().sentinel_sample_rows)
+    return {
+        "mission_id": f"{mission_id}_deep_dive",
+        "mission": DEEP_DIVE_QUERIES[mission_id],
+        "status": "completed",
+        **({"columnar": rows_to_payload(rows)} if columnar else {"rows": rows}),
+        "risk": 0,
+        "visualization": {"type": "bar", "x": "user_id", "y": "count"},
+        "insights": [f"{len(rows)} entities with matches since the last baseline."],
+    }
+
+
+def _finding(mission: Dict[str, Any], result: Dict[str, Any]) -> Dict[str, Any]:
     if result.get("clarification_needed"):
         return {
             "mission_id": mission["id"],
@@ -57,29 +175,32 @@ def _mission_result(db: Session, mission: Dict[str, Any], domain: str) -> Dict[s
         return {
             "mission_id": mission["id"],
             "mission": mission["query"],
-            "status": "invalid",
+            "status": "rejected" if result.get("error_code") else "invalid",
             "error": result.get("error"),
+            "error_code": result.get("error_code", "INVALID_SQL"),
         }
 
-    rows = result.get("rows", [])
-    risk = _calc_risk(rows, mission["risk_weight"])
+    row_count = _row_count(result)
     return {
         "mission_id": mission["id"],
         "mission": mission["query"],
         "status": "completed",
         "sql": result.get("sql"),
-        "rows": rows,
-        "risk": risk,
+        "params": result.get("params", {}),
+        **_rows_field(result),
+        "row_count": row_count,
+        **({"match_count": result["match_count"]} if "match_count" in result else {}),
+        "risk": _calc_risk(row_count, mission["risk_weight"]),
         "visualization": result.get("visualization"),
         "insights": result.get("insights"),
     }
 
 
-def _deep_dive(db: Session, mission_id: str, domain: str) -> Optional[Dict[str, Any]]:
+def _deep_dive(db: Session, mission_id: str, domain: str, columnar: bool = False) -> Optional[Dict[str, Any]]:
     follow_up = DEEP_DIVE_QUERIES.get(mission_id)
     if not follow_up:
         return None
-    result = run_query_pipeline(db, follow_up, domain)
+    result = run_mission_query(db, follow_up, domain, columnar=columnar)
     if result.get("error") or result.get("clarification_needed"):
         return {
             "mission_id": f"{mission_id}_deep_dive",
@@ -92,25 +213,40 @@ def _deep_dive(db: Session, mission_id: str, domain: str) -> Optional[Dict[str,
         "mission": follow_up,
         "status": "completed",
         "sql": result.get("sql"),
-        "rows": result.get("rows", []),
+        "params": result.get("params", {}),
+        **_rows_field(result),
         "risk": 0,
         "visualization": result.get("visualization"),
         "insights": result.get("insights"),
     }
 
 
-def _correlate(findings: List[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+def _correlate(findings: List[Dict[str, Any]], columnar: bool = False) -> Optional[Dict[str, Any]]:
     has_failed = any(f.get("mission_id") == "failed_logins" and f.get("risk", 0) > 0 for f in findings)
     has_flagged = any(f.get("mission_id") == "flagged_transactions" and f.get("risk", 0) > 0 for f in findings)
-    if has_failed and has_flagged:
-        return {
-            "mission_id": "correlation_failed_flagged",
-            "mission": "Correlate failed logins with flagged transactions",
-            "status": "completed",
-            "summary": "Failed logins and flagged transactions both present; investigate account compromise risk.",
-            "risk": 10,
-        }
-    return None
+    if not (has_failed and has_flagged):
+        return None
+    with SessionLocalAnalytics() as db:
+        correlation = correlate_failed_then_flagged(db)
+    entities = correlation["entities"]
+    if not entities:
+        return None
+    rows = entities[: get_settings().sentinel_sample_rows]
+    window = correlation["window_minutes"]
+    return {
+        "mission_id": "correlation_failed_flagged",
+        "mission": "Correlate failed logins with flagged transactions",
+        "status": "completed",
+        "summary": (
+            f"{len(entities)} users had a flagged transaction within {window} minutes of a failed login; "
+            "investigate account compromise risk."
+        ),
+        **({"columnar": rows_to_payload(rows)} if columnar else {"rows": rows}),
+        "row_count": len(entities),
+        "risk": _calc_risk(len(entities), CORRELATION_RISK_WEIGHT),
+        "window_minutes": window,
+        "visualization": {"type": "bar", "x": "user_id", "y": "risk"},
+    }
 
 
 def _narrative(domain: str, findings: List[Dict[str, Any]], risk_score: int) -> str:
@@ -121,70 +257,96 @@ def _narrative(domain: str, findings: List[Dict[str, Any]], risk_score: int) ->
     )
 
 
-def run_scan(db: Session, domain: str) -> Dict[str, Any]:
-    missions = DOMAIN_MISSIONS.get(domain, DOMAIN_MISSIONS["general"])
-    findings: List[Dict[str, Any]] = []
-    risk_score = 0
-
-    for mission in missions:
-        result = _mission_result(db, mission, domain)
-        findings.append(result)
-        risk_score += result.get("risk", 0)
-
-        if result.get("risk", 0) >= 6:
-            deep_dive = _deep_dive(db, mission["id"], domain)
-            if deep_dive:
-                findings.append(deep_dive)
-
-    correlation = _correlate(findings)
-    if correlation:
-        findings.append(correlation)
-        risk_score += correlation.get("risk", 0)
-
-    scan_id = uuid.uuid4().hex
-    result = {
-        "scan_id": scan_id,
-        "domain": domain,
-        "status": "completed",
-        "risk_score": risk_score,
-        "findings": findings,
-        "narrative": _narrative(domain, findings, risk_score),
-    }
-
-    history = ScanHistory(
-        scan_id=scan_id,
-        domain=domain,
-        status="completed",
-        risk_score=risk_score,
-        result_json=json.dumps(result),
-    )
-    db.add(history)
-    db.commit()
-
-    return result
-
-
-def run_scan_stream(db: Session, domain: str) -> Iterable[Tuple[str, Dict[str, Any]]]:
-    yield "status", {"status": "started", "domain": domain}
-
-    missions = DOMAIN_MISSIONS.get(domain, DOMAIN_MISSIONS["general"])
-    findings: List[Dict[str, Any]] = []
-    risk_score = 0
-
-    for mission in missions:
-        yield "mission", {"mission_id": mission["id"], "status": "running"}
-        result = _mission_result(db, mission, domain)
-        findings.append(result)
-        risk_score += result.get("risk", 0)
-        yield "mission", {"mission_id": mission["id"], "status": result.get("status"), "risk": result.get("risk", 0)}
-
-        if result.get("risk", 0) >= 6:
-            deep_dive = _deep_dive(db, mission["id"], domain)
-            if deep_dive:
-                findings.append(deep_dive)
-                yield "deep_dive", {"mission_id": deep_dive.get("mission_id"), "status": deep_dive.get("status")}
-
-    correlation = _correlate(findings)
+def _isolated(task: Callable[..., Any], *args: Any) -> Any:
+    # Each mission gets its own read session so missions never share a connection
+    with SessionLocalAnalytics() as db:
+        return task(db, *args)
+
+
+@contextmanager
+def _locked_cursors(mission_ids: Iterable[str]) -> Iterator[None]:
+    with _cursor_locks_guard:
+        locks = [_cursor_locks.setdefault(mission_id, threading.Lock()) for mission_id in sorted(set(mission_ids))]
+    # Domains overlap (security and risk both run failed_logins), so locks are always taken in the same order
+    with ExitStack() as stack:
+        for lock in locks:
+            stack.enter_context(lock)
+        yield
+
+
+def _scan_events(
+    db: Session, domain: str, columnar: bool = False, incremental: bool = False
+) -> Iterator[Tuple[str, Dict[str, Any]]]:
+    missions = [mission["id"] for mission in _domain_missions(domain)]
+    with _locked_cursors(missions) if incremental else nullcontext():
+        yield from _run_scan_events(db, domain, columnar, incremental)
+
+
+def _run_scan_events(
+    db: Session, domain: str, columnar: bool, incremental: bool
+) -> Iterator[Tuple[str, Dict[str, Any]]]:
+    missions = _domain_missions(domain)
+    # Findings keep mission order (each deep dive after its mission) however the work completes
+    slots: Dict[str, List[Dict[str, Any]]] = {mission["id"]: [] for mission in missions}
+    settings = get_settings()
+    workers = max(1, settings.sentinel_mission_concurrency)
+    tables: Dict[str, List[FusedMission]] = {}
+    loose = missions
+    if settings.sentinel_fuse_missions or incremental:
+        with SessionLocalAnalytics() as analytics:
+            # Incremental scans bound every listing by id, so even a lone mission goes through the fused path
+            tables, loose = plan_fusion(
+                analytics, missions, domain, min_group=1 if incremental else 2, allow_unconditioned=incremental
+            )
+    cursors: Dict[str, MissionCursor] = {}
+    if incremental:
+        for table in [table for table in tables if not supports_incremental(table)]:
+            loose = loose + [fused.mission for fused in tables.pop(table)]
+        cursors = open_cursors(db, [fused.mission for group in tables.values() for fused in group])
+
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="sentinel") as executor:
+        pending: Dict[Future, Tuple[str, List[str]]] = {}
+        for table, group in tables.items():
+            mission_ids = [fused.mission["id"] for fused in group]
+            if incremental:
+                since_ids = [cursors[mission_id].since_id for mission_id in mission_ids]
+                task = executor.submit(_isolated, _incremental_task, table, group, since_ids, domain, columnar)
+            else:
+                task = executor.submit(_isolated, _fused_task, table, group, domain, columnar)
+            pending[task] = ("mission", mission_ids)
+        for mission in loose:
+            pending[executor.submit(_isolated, _mission_task, mission, domain, columnar)] = ("mission", [mission["id"]])
+        for mission in missions:
+            yield "mission", {"mission_id": mission["id"], "status": "running"}
+
+        while pending:
+            done, _running = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                kind, mission_ids = pending.pop(future)
+                result = future.result()
+                if kind == "deep_dive":
+                    if result:
+                        slots[mission_ids[0]].append(result)
+                        yield "deep_dive", {"mission_id": result.get("mission_id"), "status": result.get("status")}
+                    continue
+                for mission_id, finding in zip(mission_ids, result):
+                    cursor = cursors.get(mission_id)
+                    if cursor is not None:
+                        finding = _advance(cursor, finding)
+                    slots[mission_id].insert(0, finding)
+                    yield "mission", {"mission_id": mission_id, "status": finding.get("status"), "risk": finding.get("risk", 0)}
+                    if finding.get("risk", 0) < DEEP_DIVE_RISK or mission_id not in DEEP_DIVE_QUERIES:
+                        continue
+                    if cursor is not None and "incremental" in finding:
+                        deep_dive = _entity_deep_dive(cursor, columnar)
+                        slots[mission_id].append(deep_dive)
+                        yield "deep_dive", {"mission_id": deep_dive["mission_id"], "status": deep_dive["status"]}
+                    else:
+                        pending[executor.submit(_isolated, _deep_dive, mission_id, domain, columnar)] = ("deep_dive", [mission_id])
+
+    findings = [finding for mission in missions for finding in slots[mission["id"]]]
+    risk_score = sum(finding.get("risk", 0) for finding in findings)
+    correlation = _correlate(findings, columnar)
     if correlation:
         findings.append(correlation)
         risk_score += correlation.get("risk", 0)
@@ -200,22 +362,21 @@ def run_scan_stream(db: Session, domain: str) -> Iterable[Tuple[str, Dict[str, A
         "narrative": _narrative(domain, findings, risk_score),
     }
 
-    history = ScanHistory(
-        scan_id=scan_id,
-        domain=domain,
-        status="completed",
-        risk_score=risk_score,
-        result_json=json.dumps(result),
-    )
-    db.add(history)
-    db.commit()
+    save_scan(db, result)
 
     yield "complete", result
 
 
-def list_history(db: Session) -> List[ScanHistory]:
-    return list(db.execute(select(ScanHistory).order_by(ScanHistory.created_at.desc())).scalars())
+def run_scan(db: Session, domain: str, columnar: bool = False, incremental: bool = False) -> Dict[str, Any]:
+    for event, payload in _scan_events(db, domain, columnar, incremental):
+        if event == "complete":
+            return payload
+    raise RuntimeError("Sentinel scan ended without a result")
+
 
+def run_scan_stream(
+    db: Session, domain: str, columnar: bool = False, incremental: bool = False
+) -> Iterable[Tuple[str, Dict[str, Any]]]:
+    yield "status", {"status": "started", "domain": domain}
+    yield from _scan_events(db, domain, columnar, incremental)
 
-def get_history(db: Session, scan_id: str) -> ScanHistory | None:
-    return db.execute(select(ScanHistory).where(ScanHistory.scan_id == scan_id)).scalar_one_or_none()
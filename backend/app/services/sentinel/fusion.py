@@ -0,0 +1,185 @@
+import sys
+from typing import Any, Dict, List, Optional, Tuple
+from sqlalchemy.orm import Session
+from sqlglot import exp
+from app.core.config import get_settings
+from app.services.nl2sql.analysis import analyze_sql
+from app.services.nl2sql.columnar import ColumnarRows
+from app.services.nl2sql.engine import execute_sql, executed_result
+from app.services.nl2sql.governor import QueryBudget
+from app.services.nl2sql.rules import rebind_period
+from app.services.sentinel.missions import get_mission_compiler
+
+_UNFUSABLE = ("joins", "group", "having", "distinct", "with", "laterals", "offset")
+
+
+class FusedMission:
+    def __init__(
+        self,
+        mission: Dict[str, Any],
+        generated: Dict[str, Any],
+        condition: Optional[exp.Expression],
+        order: List[exp.Expression],
+        limit: Optional[int],
+    ) -> None:
+        self.mission = mission
+        self.generated = generated
+        self.condition = condition
+        self.order = order
+        self.limit = limit
+        self.extra_params: Dict[str, Any] = {}
+
+    def params(self) -> Dict[str, Any]:
+        return {**rebind_period(self.mission["query"], self.generated["params"]), **self.extra_params}
+
+    def between_ids(self, since_id: int, until_id: int) -> "FusedMission":
+        bound = exp.condition("id > :since_id AND id <= :until_id")
+        condition = exp.and_(self.condition, bound) if self.condition is not None else bound
+        narrowed = FusedMission(self.mission, self.generated, condition, self.order, self.limit)
+        narrowed.extra_params = {**self.extra_params, "since_id": since_id, "until_id": until_id}
+        return narrowed
+
+    @property
+    def sample_size(self) -> int:
+        sample_rows = get_settings().sentinel_sample_rows
+        return min(self.limit or sample_rows, sample_rows)
+
+
+def _unqualify(node: exp.Expression) -> exp.Expression:
+    if isinstance(node, exp.Column):
+        return exp.column(node.name)
+    return node
+
+
+def _shape(generated: Dict[str, Any]) -> Optional[Tuple[str, Optional[exp.Expression], List[exp.Expression], Optional[int]]]:
+    # Only plain row listings over one table can share a scan; aggregates and joins keep their own query
+    if not generated["sql"] or generated["error"]:
+        return None
+    expression = analyze_sql(generated["sql"]).expression
+    if not isinstance(expression, exp.Select) or any(expression.args.get(arg) for arg in _UNFUSABLE):
+        return None
+    if len(expression.expressions) != 1 or not isinstance(expression.expressions[0], exp.Star):
+        return None
+    source = expression.args.get("from")
+    if source is None or not isinstance(source.this, exp.Table) or source.this.args.get("db") or source.this.alias:
+        return None
+    where = expression.args.get("where")
+    condition = where.this if where is not None else None
+    if condition is not None and condition.find(exp.Select, exp.AggFunc):
+        return None
+    limit = expression.args.get("limit")
+    count = None
+    if limit is not None:
+        value = limit.expression
+        if not isinstance(value, exp.Literal) or value.is_string:
+            return None
+        count = int(value.name)
+    order = expression.args.get("order")
+    return source.this.name, condition, order.expressions if order else [], count
+
+
+def plan_fusion(
+    db: Session,
+    missions: List[Dict[str, Any]],
+    domain: Optional[str],
+    min_group: int = 2,
+    allow_unconditioned: bool = False,
+) -> Tuple[Dict[str, List[FusedMission]], List[Dict[str, Any]]]:
+    compiler = get_mission_compiler()
+    tables: Dict[str, List[FusedMission]] = {}
+    loose: List[Dict[str, Any]] = []
+    for mission in missions:
+        generated = compiler.compile(db, mission["query"], domain)
+        shape = _shape(generated)
+        # Without a WHERE the shared window would run over the whole table, where alone the mission
+        # stops at its LIMIT; only an id-bounded (incremental) scan keeps such a mission cheap
+        if shape is None or (shape[1] is None and not allow_unconditioned):
+            loose.append(mission)
+            continue
+        table, condition, order, limit = shape
+        tables.setdefault(table, []).append(FusedMission(mission, generated, condition, order, limit))
+    # A table read by a single mission has nothing to share, so it keeps the usual path with rollups and caching
+    for table in [table for table, group in tables.items() if len(group) < min_group]:
+        loose.extend(fused.mission for fused in tables.pop(table))
+    return tables, loose
+
+
+def _flagged_source(table: str, group: List[FusedMission]) -> Tuple[str, Dict[str, Any], List[Dict[str, Any]]]:
+    params: Dict[str, Any] = {}
+    bound: List[Dict[str, Any]] = []
+    matches: List[Optional[str]] = []
+    flags: List[str] = []
+    for index, fused in enumerate(group):
+        mission_params = fused.params()
+        bound.append(mission_params)
+        params.update({f"m{index}_{name}": value for name, value in mission_params.items()})
+        condition = fused.condition
+        if condition is not None:
+            # Missions bind the same names (start, end) to different windows, so each gets its own prefix
+            condition = condition.transform(
+                lambda node, index=index: exp.Placeholder(this=f"m{index}_{node.name}")
+                if isinstance(node, exp.Placeholder)
+                else node
+            )
+        match = condition.sql() if condition is not None else None
+        matches.append(match)
+        flags.append(f"CASE WHEN {match or '1 = 1'} THEN 1 ELSE 0 END AS __m{index}")
+
+    where = ""
+    if all(match is not None for match in matches):
+        where = " WHERE " + " OR ".join(f"({match})" for match in matches)
+    return f"SELECT {table}.*, {', '.join(flags)} FROM {table}{where}", params, bound
+
+
+def fused_sql(table: str, group: List[FusedMission]) -> Tuple[str, Dict[str, Any], List[Dict[str, Any]]]:
+    source, params, bound = _flagged_source(table, group)
+    windows: List[str] = []
+    keep: List[str] = []
+    for index, fused in enumerate(group):
+        order = ", ".join(ordered.transform(_unqualify).sql() for ordered in fused.order)
+        window = f"PARTITION BY __m{index}" + (f" ORDER BY {order}" if order else "")
+        windows.append(f"SUM(__m{index}) OVER () AS __n{index}")
+        windows.append(f"CASE WHEN __m{index} = 1 THEN ROW_NUMBER() OVER ({window}) END AS __r{index}")
+        keep.append(f"__r{index} <= {fused.sample_size}")
+    sql = (
+        f"SELECT * FROM (SELECT matched.*, {', '.join(windows)} FROM ({source}) AS matched) AS ranked "
+        f"WHERE {' OR '.join(keep)}"
+    )
+    return sql, params, bound
+
+
+def fused_entity_counts(db: Session, table: str, group: List[FusedMission], entity: str) -> List[Dict[str, int]]:
+    source, params, _bound = _flagged_source(table, group)
+    sums = ", ".join(f"SUM(__m{index}) AS __m{index}" for index in range(len(group)))
+    # One row per entity is the expected size here, so only the time budget applies, not the interactive row cap
+    budget = QueryBudget(get_settings().query_timeout_ms, sys.maxsize, sys.maxsize)
+    rows = execute_sql(db, f"SELECT {entity}, {sums} FROM ({source}) AS matched GROUP BY {entity}", budget, params)
+    counts: List[Dict[str, int]] = [{} for _ in group]
+    for row in rows:
+        for index, mission_counts in enumerate(counts):
+            if row[f"__m{index}"]:
+                mission_counts[str(row[entity])] = int(row[f"__m{index}"])
+    return counts
+
+
+def run_fused(
+    db: Session, table: str, group: List[FusedMission], columnar: bool = False
+) -> List[Dict[str, Any]]:
+    sql, params, bound = fused_sql(table, group)
+    rows = execute_sql(db, sql, None, params)
+    results: List[Dict[str, Any]] = []
+    for index, fused in enumerate(group):
+        rank = f"__r{index}"
+        # Rows kept for another mission still carry this mission's rank, so the cut-off is applied again
+        ranked = sorted(
+            (row for row in rows if row[rank] is not None and row[rank] <= fused.sample_size),
+            key=lambda row: row[rank],
+        )
+        sample = [{name: value for name, value in row.items() if not name.startswith("__")} for row in ranked]
+        generated = {**fused.generated, "params": bound[index]}
+        result = executed_result(generated, ColumnarRows.from_rows(sample) if columnar else sample)
+        # row_count stays the sample length, as on the unfused path; every returned row carries the window total
+        result["match_count"] = int(rows[0][f"__n{index}"] or 0) if rows else 0
+        result["fused"] = {"table": table, "missions": len(group)}
+        results.append(result)
+    return results
@@ -0,0 +1,163 @@
+import json
+import zlib
+from typing import Any, Dict, List, Optional, Tuple, Union
+from sqlalchemy import select
+from sqlalchemy.orm import Session, load_only
+from app.core.config import get_settings
+from app.models.sentinel import ScanFinding, ScanHistory
+from app.services.nl2sql.columnar import payload_to_rows
+
+_SUMMARY_FIELDS = ("scan_id", "domain", "status", "risk_score", "narrative")
+
+
+def _encode(payload: Dict[str, Any]) -> bytes:
+    return zlib.compress(json.dumps(payload, default=str, separators=(",", ":")).encode("utf-8"))
+
+
+def _decode(blob: bytes) -> Dict[str, Any]:
+    return json.loads(zlib.decompress(blob))
+
+
+def _row_key(row: Dict[str, Any]) -> str:
+    return json.dumps(row, default=str, sort_keys=True)
+
+
+def _split_finding(finding: Dict[str, Any], limit: int) -> Tuple[Dict[str, Any], Optional[List[Dict[str, Any]]]]:
+    meta = dict(finding)
+    rows = meta.pop("rows", None)
+    if rows is None and "columnar" in meta:
+        rows = payload_to_rows(meta.pop("columnar"))
+    if rows is None:
+        return meta, None
+    if len(rows) > limit:
+        meta["rows_truncated"] = len(rows) - limit
+    # Rows go through JSON first so a delta compares them exactly as they will be read back
+    return meta, json.loads(json.dumps(rows[:limit], default=str))
+
+
+def _latest_keyframes(db: Session, domain: str, mission_ids: List[str]) -> Dict[str, ScanFinding]:
+    keyframes: Dict[str, ScanFinding] = {}
+    for mission_id in set(mission_ids):
+        keyframe = db.execute(
+            select(ScanFinding)
+            .where(
+                ScanFinding.domain == domain,
+                ScanFinding.mission_id == mission_id,
+                ScanFinding.encoding == "full",
+            )
+            .order_by(ScanFinding.id.desc())
+            .limit(1)
+        ).scalar_one_or_none()
+        if keyframe is not None:
+            keyframes[mission_id] = keyframe
+    return keyframes
+
+
+def _delta_rows(rows: List[Dict[str, Any]], base_rows: List[Dict[str, Any]]) -> Optional[List[Union[int, Dict[str, Any]]]]:
+    # Rows already stored in the keyframe become indexes; a mostly new sample is cheaper stored whole
+    positions = {_row_key(row): index for index, row in enumerate(base_rows)}
+    delta: List[Union[int, Dict[str, Any]]] = [positions.get(_row_key(row), row) for row in rows]
+    fresh = sum(1 for entry in delta if isinstance(entry, dict))
+    if rows and fresh * 2 > len(rows):
+        return None
+    return delta
+
+
+def save_scan(db: Session, result: Dict[str, Any]) -> ScanHistory:
+    limit = get_settings().sentinel_history_rows
+    domain = result["domain"]
+    findings = result.get("findings", [])
+    summary = {field: result.get(field) for field in _SUMMARY_FIELDS}
+    summary["finding_count"] = len(findings)
+    history = ScanHistory(
+        scan_id=result["scan_id"],
+        domain=domain,
+        status=result.get("status", "completed"),
+        risk_score=result.get("risk_score", 0),
+        result_json=json.dumps(summary),
+    )
+    db.add(history)
+
+    keyframes = _latest_keyframes(db, domain, [finding.get("mission_id", "") for finding in findings])
+    for position, finding in enumerate(findings):
+        meta, rows = _split_finding(finding, limit)
+        mission_id = finding.get("mission_id", "")
+        record = ScanFinding(
+            scan_id=result["scan_id"],
+            domain=domain,
+            position=position,
+            mission_id=mission_id,
+            status=finding.get("status", "completed"),
+            risk=finding.get("risk", 0),
+            row_count=finding.get("row_count", len(rows or [])),
+        )
+        keyframe = keyframes.get(mission_id)
+        delta = None
+        if rows is not None and keyframe is not None:
+            base_rows = _decode(keyframe.payload)["rows"]
+            delta = _delta_rows(rows, base_rows) if base_rows is not None else None
+        if delta is not None:
+            record.encoding = "delta"
+            record.base_id = keyframe.id
+            record.payload = _encode({"finding": meta, "rows": delta})
+        else:
+            record.encoding = "full"
+            record.payload = _encode({"finding": meta, "rows": rows})
+        db.add(record)
+    db.commit()
+    return history
+
+
+def list_history(db: Session, limit: Optional[int] = None, before: Optional[int] = None) -> Tuple[List[ScanHistory], Optional[int]]:
+    limit = max(1, min(limit or get_settings().sentinel_history_page_size, 500))
+    # Only the summary columns are loaded; one extra row tells whether another page exists
+    stmt = select(ScanHistory).options(
+        load_only(
+            ScanHistory.id,
+            ScanHistory.scan_id,
+            ScanHistory.domain,
+            ScanHistory.status,
+            ScanHistory.risk_score,
+            ScanHistory.created_at,
+        )
+    )
+    if before is not None:
+        stmt = stmt.where(ScanHistory.id < before)
+    records = list(db.execute(stmt.order_by(ScanHistory.id.desc()).limit(limit + 1)).scalars())
+    next_cursor = records[limit - 1].id if len(records) > limit else None
+    return records[:limit], next_cursor
+
+
+def get_history(db: Session, scan_id: str) -> Optional[ScanHistory]:
+    return db.execute(select(ScanHistory).where(ScanHistory.scan_id == scan_id)).scalar_one_or_none()
+
+
+def load_scan(db: Session, scan_id: str) -> Optional[Dict[str, Any]]:
+    record = get_history(db, scan_id)
+    if record is None:
+        return None
+    result = json.loads(record.result_json)
+    stored = list(
+        db.execute(select(ScanFinding).where(ScanFinding.scan_id == scan_id).order_by(ScanFinding.position)).scalars()
+    )
+    if not stored:
+        # Scans saved before findings moved out keep them inline in result_json
+        return result
+    base_ids = {finding.base_id for finding in stored if finding.base_id is not None}
+    bases: Dict[int, Any] = {}
+    if base_ids:
+        for base in db.execute(select(ScanFinding).where(ScanFinding.id.in_(base_ids))).scalars():
+            bases[base.id] = _decode(base.payload)["rows"]
+    findings = []
+    for finding in stored:
+        payload = _decode(finding.payload)
+        rows = payload["rows"]
+        if rows is None:
+            findings.append(payload["finding"])
+            continue
+        if finding.encoding == "delta":
+            base_rows = bases.get(finding.base_id) or []
+            rows = [base_rows[entry] if isinstance(entry, int) else entry for entry in rows]
+        findings.append({**payload["finding"], "rows": rows})
+    result.pop("finding_count", None)
+    return {**result, "findings": findings}
@@ -0,0 +1,118 @@
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional
+from sqlalchemy import Integer, delete, select, text
+from sqlalchemy.orm import Session
+from app.core.config import get_settings
+from app.models.base import Base
+from app.models.sentinel import SentinelEntityCount, SentinelMissionState
+from app.services.sentinel.fusion import FusedMission, fused_entity_counts, run_fused
+
+ENTITY_COLUMN = "user_id"
+# Stays under SQLite's bound-parameter limit when looking up the entities a scan touched
+_ENTITY_BATCH = 500
+
+
+def _naive_utc(value: Optional[datetime]) -> Optional[datetime]:
+    if value is None or value.tzinfo is None:
+        return value
+    return value.astimezone(timezone.utc).replace(tzinfo=None)
+
+
+def supports_incremental(table: str) -> bool:
+    # Watermarks rely on the increasing integer key every ingested row receives
+    model = Base.metadata.tables.get(table)
+    if model is None or "id" not in model.c:
+        return False
+    return model.c["id"].primary_key and isinstance(model.c["id"].type, Integer)
+
+
+class MissionCursor:
+    def __init__(self, db: Session, state: SentinelMissionState, mission: Dict[str, Any]) -> None:
+        self.db = db
+        self.state = state
+        self.mission = mission
+        baseline = _naive_utc(state.baseline_at)
+        interval = timedelta(minutes=get_settings().sentinel_rebaseline_minutes)
+        # Rows leaving the time window are never subtracted, so the running state is rebuilt periodically
+        self.rebaseline = baseline is None or state.query != mission["query"] or datetime.utcnow() - baseline >= interval
+
+    @property
+    def since_id(self) -> int:
+        return 0 if self.rebaseline else self.state.watermark_id
+
+    def advance(self, matched: int, entities: Dict[str, int], since_id: int, until_id: int) -> None:
+        state = self.state
+        if since_id < self.since_id:
+            # The table shrank below the watermark (restore, truncate), so the scan started over from the first row
+            self.rebaseline = True
+        if self.rebaseline:
+            state.query = self.mission["query"]
+            state.match_count = 0
+            state.baseline_at = datetime.utcnow()
+            self.db.execute(delete(SentinelEntityCount).where(SentinelEntityCount.mission_id == self.mission["id"]))
+        self._add_entity_counts(entities)
+        state.match_count = (state.match_count or 0) + matched
+        state.watermark_id = until_id
+
+    def _add_entity_counts(self, entities: Dict[str, int]) -> None:
+        # Only the entities seen in this scan's id range are read and written, never the whole running state
+        keys = list(entities)
+        for start in range(0, len(keys), _ENTITY_BATCH):
+            batch = keys[start : start + _ENTITY_BATCH]
+            stmt = select(SentinelEntityCount).where(
+                SentinelEntityCount.mission_id == self.mission["id"], SentinelEntityCount.entity.in_(batch)
+            )
+            existing = {row.entity: row for row in self.db.execute(stmt).scalars()}
+            for entity in batch:
+                row = existing.get(entity)
+                if row is None:
+                    self.db.add(SentinelEntityCount(mission_id=self.mission["id"], entity=entity, count=entities[entity]))
+                else:
+                    row.count += entities[entity]
+        # Sessions do not autoflush, and the deep dive reads the counts back in the same scan
+        self.db.flush()
+
+    def top_entities(self, limit: int) -> List[Dict[str, Any]]:
+        stmt = (
+            select(SentinelEntityCount.entity, SentinelEntityCount.count)
+            .where(SentinelEntityCount.mission_id == self.mission["id"])
+            .order_by(SentinelEntityCount.count.desc())
+            .limit(limit)
+        )
+        return [
+            {ENTITY_COLUMN: int(entity) if entity.isdigit() else entity, "count": count}
+            for entity, count in self.db.execute(stmt)
+        ]
+
+
+def open_cursors(db: Session, missions: List[Dict[str, Any]]) -> Dict[str, MissionCursor]:
+    ids = [mission["id"] for mission in missions]
+    states = {
+        state.mission_id: state
+        for state in db.execute(select(SentinelMissionState).where(SentinelMissionState.mission_id.in_(ids))).scalars()
+    }
+    cursors: Dict[str, MissionCursor] = {}
+    for mission in missions:
+        state = states.get(mission["id"])
+        if state is None:
+            state = SentinelMissionState(mission_id=mission["id"], query=mission["query"], watermark_id=0, match_count=0)
+            db.add(state)
+        cursors[mission["id"]] = MissionCursor(db, state, mission)
+    return cursors
+
+
+def run_incremental(
+    db: Session, table: str, group: List[FusedMission], since_ids: List[int], columnar: bool = False
+) -> List[Dict[str, Any]]:
+    # The upper bound is fixed first so rows landing mid-scan are left for the next one
+    until_id = db.execute(text(f"SELECT MAX(id) FROM {table}")).scalar() or 0
+    # A watermark above the newest row means rows were removed, so the running counts are rebuilt in this scan
+    since_ids = [0 if since_id > until_id else since_id for since_id in since_ids]
+    bounded = [fused.between_ids(since_id, until_id) for fused, since_id in zip(group, since_ids)]
+    results = run_fused(db, table, bounded, columnar)
+    entity_counts: List[Dict[str, int]] = [{} for _ in group]
+    if ENTITY_COLUMN in Base.metadata.tables[table].c:
+        entity_counts = fused_entity_counts(db, table, bounded, ENTITY_COLUMN)
+    for result, since_id, entities in zip(results, since_ids, entity_counts):
+        result["incremental"] = {"since_id": since_id, "until_id": until_id, "entities": entities}
+    return results
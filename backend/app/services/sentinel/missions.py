@@ -0,0 +1,63 @@
+import threading
+import time
+from functools import lru_cache
+from typing import Any, Dict, Hashable, Optional, Tuple
+from sqlalchemy.orm import Session
+from app.core.config import get_settings
+from app.services.nl2sql.engine import generate_statement, run_generated
+from app.services.nl2sql.rules import rebind_period
+from app.services.nl2sql.schema import get_schema_version
+
+
+class MissionCompiler:
+    def __init__(self) -> None:
+        self._entries: Dict[Hashable, Tuple[str, Optional[float], Dict[str, Any]]] = {}
+        self._lock = threading.Lock()
+        self._compiles = 0
+        self._reuses = 0
+
+    def compile(self, db: Session, query: str, domain: Optional[str]) -> Dict[str, Any]:
+        # Mission text is part of the key, so editing a mission compiles it afresh
+        key = (str(db.bind.url), get_settings().nl2sql_mode.lower(), domain, query)
+        version = get_schema_version(db)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == version and (entry[1] is None or time.monotonic() < entry[1]):
+                self._reuses += 1
+                return entry[2]
+        generated = generate_statement(db, query, domain)
+        with self._lock:
+            self._compiles += 1
+            # A failed generation may be transient (LLM outage), so only usable outcomes are kept
+            if not generated["error"]:
+                expires_at = self._expiry(generated)
+                if expires_at is None or expires_at > time.monotonic():
+                    self._entries[key] = (version, expires_at, generated)
+        return generated
+
+    @staticmethod
+    def _expiry(generated: Dict[str, Any]) -> Optional[float]:
+        # Rules templates bind their time window as parameters that rebind_period refreshes on every run;
+        # LLM SQL may carry literal dates, so it is only trusted for a short while
+        if generated["generation"].get("generator", "rules") == "rules":
+            return None
+        return time.monotonic() + get_settings().sentinel_mission_llm_ttl_seconds
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"entries": len(self._entries), "compiles": self._compiles, "reuses": self._reuses}
+
+
+@lru_cache
+def get_mission_compiler() -> MissionCompiler:
+    return MissionCompiler()
+
+
+def run_mission_query(db: Session, query: str, domain: Optional[str], columnar: bool = False) -> Dict[str, Any]:
+    compiled = get_mission_compiler().compile(db, query, domain)
+    generated = {**compiled, "params": rebind_period(query, compiled["params"])}
+    return run_generated(db, generated, query, domain, columnar=columnar)
@@ -0,0 +1,195 @@
+import asyncio
+import logging
+import time
+from typing import Any, Callable, Dict, FrozenSet, Iterable, List, Optional, Set, Tuple
+from app.core.config import get_settings
+from app.db.session import SessionLocalAnalytics, SessionLocalPrimary
+from app.db.versions import get_table_versions, subscribe_table_changes, unsubscribe_table_changes
+from app.services.nl2sql.analysis import analyze_sql
+from app.services.sentinel.engine import DEEP_DIVE_QUERIES, DOMAIN_MISSIONS, run_scan
+from app.services.sentinel.missions import get_mission_compiler
+
+logger = logging.getLogger(__name__)
+
+_task: Optional[asyncio.Task] = None
+_scheduler: Optional["SentinelScheduler"] = None
+
+
+def _scan_domain(domain: str) -> Dict[str, Any]:
+    with SessionLocalPrimary() as db:
+        return run_scan(db, domain, incremental=True)
+
+
+def _domain_tables(domain: str) -> Tuple[str, ...]:
+    queries = [mission["query"] for mission in DOMAIN_MISSIONS[domain]]
+    queries += [DEEP_DIVE_QUERIES[mission["id"]] for mission in DOMAIN_MISSIONS[domain] if mission["id"] in DEEP_DIVE_QUERIES]
+    tables: Set[str] = set()
+    with SessionLocalAnalytics() as db:
+        for query in queries:
+            generated = get_mission_compiler().compile(db, query, domain)
+            if generated["sql"]:
+                tables.update(analyze_sql(generated["sql"]).tables)
+    return tuple(sorted(tables))
+
+
+class SentinelScheduler:
+    def __init__(self, domains: Iterable[str], scan: Callable[[str], Dict[str, Any]] = _scan_domain) -> None:
+        settings = get_settings()
+        self.debounce = settings.sentinel_scheduler_debounce_seconds
+        self.min_interval = settings.sentinel_scheduler_min_interval_seconds
+        self.max_interval = settings.sentinel_scheduler_max_interval_seconds
+        self._scan = scan
+        self._semaphore = asyncio.Semaphore(max(1, settings.sentinel_scheduler_concurrency))
+        self._states: Dict[str, Dict[str, Any]] = {
+            domain: {
+                "tables": (),
+                "versions": None,
+                "last_scan": None,
+                "interval": self.min_interval,
+                "risk": None,
+                "scans": 0,
+                "skipped": 0,
+            }
+            for domain in domains
+            if domain in DOMAIN_MISSIONS
+        }
+        self._watched: Set[str] = set()
+        self._running: Set[str] = set()
+        self._tasks: Set[asyncio.Task] = set()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._wake: Optional[asyncio.Event] = None
+
+    def notify(self, tables: FrozenSet[str]) -> None:
+        # Called from whichever thread committed; only changes to scanned tables wake the loop
+        if self._loop is None or self._wake is None or not tables & self._watched:
+            return
+        try:
+            self._loop.call_soon_threadsafe(self._wake.set)
+        except RuntimeError:
+            pass
+
+    async def run(self) -> None:
+        self._loop = asyncio.get_running_loop()
+        self._wake = asyncio.Event()
+        for domain, state in self._states.items():
+            state["tables"] = await asyncio.to_thread(_domain_tables, domain)
+            self._watched.update(state["tables"])
+        subscribe_table_changes(self.notify)
+        try:
+            while True:
+                self._dispatch()
+                await self._sleep(self._next_wake())
+        finally:
+            unsubscribe_table_changes(self.notify)
+            for task in self._tasks:
+                task.cancel()
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    async def _sleep(self, timeout: float) -> None:
+        try:
+            await asyncio.wait_for(self._wake.wait(), timeout)
+        except asyncio.TimeoutError:
+            return
+        # A burst of commits (one per ingested batch) collapses into the scan after the quiet period
+        await asyncio.sleep(self.debounce)
+        self._wake.clear()
+
+    def _next_wake(self) -> float:
+        now = time.monotonic()
+        waits: List[float] = [self.max_interval]
+        for domain, state in self._states.items():
+            if domain in self._running:
+                continue
+            if state["last_scan"] is None:
+                return 0.0
+            elapsed = now - state["last_scan"]
+            waits.append(self.max_interval - elapsed)
+            if get_table_versions(state["tables"]) != state["versions"]:
+                waits.append(state["interval"] - elapsed)
+        return max(0.0, min(waits))
+
+    def _dispatch(self) -> None:
+        now = time.monotonic()
+        for domain, state in self._states.items():
+            if domain in self._running:
+                continue
+            # Versions are read before the scan, so commits landing during it trigger the next one
+            versions = get_table_versions(state["tables"])
+            elapsed = float("inf") if state["last_scan"] is None else now - state["last_scan"]
+            changed = versions != state["versions"]
+            # Relative windows still move on idle tables, so each domain is refreshed at the slowest cadence
+            if elapsed >= self.max_interval or (changed and elapsed >= state["interval"]):
+                self._running.add(domain)
+                # The loop only keeps weak references, so the scheduler holds each scan until it finishes
+                task = asyncio.create_task(self._run_scan(domain, versions))
+                self._tasks.add(task)
+                task.add_done_callback(self._tasks.discard)
+            elif not changed and state["last_scan"] is not None and elapsed >= state["interval"]:
+                state["skipped"] += 1
+
+    async def _run_scan(self, domain: str, versions: Tuple[Tuple[str, int], ...]) -> None:
+        state = self._states[domain]
+        risk = None
+        try:
+            async with self._semaphore:
+                result = await asyncio.to_thread(self._scan, domain)
+            risk = result.get("risk_score")
+        except Exception as exc:
+            logger.exception("sentinel scheduler scan error domain=%s: %s", domain, exc)
+        finally:
+            self._running.discard(domain)
+        state["last_scan"] = time.monotonic()
+        state["versions"] = versions
+        state["scans"] += 1
+        # Quiet domains back off towards the slowest cadence; a change in risk pulls them back in
+        if risk != state["risk"]:
+            state["interval"] = self.min_interval
+        else:
+            state["interval"] = min(max(state["interval"] * 2, self.min_interval), self.max_interval)
+        state["risk"] = risk
+        self._wake.set()
+
+    def snapshot(self) -> Dict[str, Any]:
+        now = time.monotonic()
+        return {
+            domain: {
+                "tables": list(state["tables"]),
+                "interval_seconds": state["interval"],
+                "risk_score": state["risk"],
+                "scans": state["scans"],
+                "skipped": state["skipped"],
+                "running": domain in self._running,
+                "seconds_since_scan": None if state["last_scan"] is None else round(now - state["last_scan"], 3),
+            }
+            for domain, state in self._states.items()
+        }
+
+
+def get_sentinel_scheduler() -> Optional[SentinelScheduler]:
+    return _scheduler
+
+
+async def _run_scheduler(scheduler: SentinelScheduler) -> None:
+    try:
+        await scheduler.run()
+    except asyncio.CancelledError:
+        raise
+    except Exception as exc:
+        logger.exception("sentinel scheduler error: %s", exc)
+
+
+def start_sentinel_scheduler() -> None:
+    global _task, _scheduler
+    settings = get_settings()
+    if not settings.sentinel_scheduler_enabled:
+        return
+    if _task is None or _task.done():
+        domains = [domain.strip() for domain in settings.sentinel_scheduler_domains.split(",") if domain.strip()]
+        _scheduler = SentinelScheduler(domains)
+        _task = asyncio.create_task(_run_scheduler(_scheduler))
+
+
+def stop_sentinel_scheduler() -> None:
+    global _task
+    if _task and not _task.done():
+        _task.cancel()
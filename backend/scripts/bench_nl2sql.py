@@ -0,0 +1,127 @@
+import argparse
+import json
+import os
+import sys
+import time
+from typing import Dict, List
+
+BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+if BASE_DIR not in sys.path:
+    sys.path.insert(0, BASE_DIR)
+
+DEFAULT_QUESTIONS = [
+    "List users",
+    "Count users",
+    "List transactions",
+    "List flagged transactions",
+    "List high value transactions",
+    "Count transactions",
+    "Total amount of transactions",
+    "Average transaction amount",
+    "Transactions by status",
+    "Show recent logins",
+    "Show recent failed logins",
+    "Show failed logins by user_id",
+]
+CONFIGS = {"rules": "rules", "llm": "llm", "hybrid": "hedged"}
+STAGES = ["schema", "generate", "validate", "plan", "execute", "insights", "serialize", "total"]
+
+
+def _percentile(samples: List[float], pct: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    rank = max(0, min(len(ordered) - 1, int(round(pct / 100 * len(ordered) + 0.5)) - 1))
+    return ordered[rank]
+
+
+def _load_questions(path: str | None) -> List[str]:
+    if not path:
+        return DEFAULT_QUESTIONS
+    with open(path, encoding="utf-8") as handle:
+        return [line.strip() for line in handle if line.strip()]
+
+
+def _bench(config: str, questions: List[str], iterations: int, warmup: int) -> Dict[str, Dict[str, float]]:
+    from app.core.config import get_settings
+    from app.db.session import SessionLocalPrimary
+    from app.schemas.common import APIResponse
+    from app.services.nl2sql.engine import run_query_pipeline
+    from app.services.nl2sql.timing import collect_stage_timings, stage
+
+    get_settings().nl2sql_mode = CONFIGS[config]
+    samples: Dict[str, List[float]] = {name: [] for name in STAGES}
+    with SessionLocalPrimary() as db:
+        for iteration in range(warmup + iterations):
+            for question in questions:
+                started = time.perf_counter()
+                with collect_stage_timings() as timings:
+                    result = run_query_pipeline(db, question, None)
+                    with stage("serialize"):
+                        APIResponse(success=True, data={"result": result}).model_dump_json()
+                total = (time.perf_counter() - started) * 1000
+                db.rollback()
+                if iteration < warmup:
+                    continue
+                for name in STAGES[:-1]:
+                    samples[name].append(timings.get(name, 0.0))
+                samples["total"].append(total)
+
+    return {
+        name: {
+            "p50": _percentile(values, 50),
+            "p95": _percentile(values, 95),
+            "p99": _percentile(values, 99),
+        }
+        for name, values in samples.items()
+    }
+
+
+def _print_report(config: str, report: Dict[str, Dict[str, float]]) -> None:
+    print(f"\n[{config}]")
+    print(f"{'stage':<10} {'p50 ms':>10} {'p95 ms':>10} {'p99 ms':>10}")
+    for name in STAGES:
+        row = report[name]
+        print(f"{name:<10} {row['p50']:>10.3f} {row['p95']:>10.3f} {row['p99']:>10.3f}")
+
+
+def run() -> int:
+    parser = argparse.ArgumentParser(description="Benchmark the NL2SQL pipeline per stage without network access.")
+    parser.add_argument("--configs", default="rules,llm,hybrid", help="Comma-separated: rules, llm, hybrid")
+    parser.add_argument("--questions", help="File with one question per line (defaults to a built-in corpus)")
+    parser.add_argument("--iterations", type=int, default=20)
+    parser.add_argument("--warmup", type=int, default=2)
+    parser.add_argument("--latency-ms", type=float, default=50.0, help="Simulated fake LLM latency")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="Simulated fake LLM failure rate")
+    parser.add_argument("--fixtures", help="Fake LLM fixtures file (defaults to the bundled fixtures)")
+    parser.add_argument("--cache", action="store_true", help="Keep the result cache enabled")
+    parser.add_argument("--json", action="store_true", help="Print the report as JSON")
+    args = parser.parse_args()
+
+    configs = [name.strip() for name in args.configs.split(",") if name.strip()]
+    unknown = [name for name in configs if name not in CONFIGS]
+    if unknown:
+        parser.error(f"unknown configs: {', '.join(unknown)}")
+
+    # Settings are read once at import, so the fake provider is configured before the app loads
+    os.environ["LLM_PROVIDER"] = "fake"
+    os.environ["LLM_FAKE_LATENCY_MS"] = str(args.latency_ms)
+    os.environ["LLM_FAKE_FAILURE_RATE"] = str(args.failure_rate)
+    os.environ["QUERY_CACHE_ENABLED"] = "true" if args.cache else "false"
+    if args.fixtures:
+        os.environ["LLM_FAKE_FIXTURES_PATH"] = args.fixtures
+
+    questions = _load_questions(args.questions)
+    reports = {config: _bench(config, questions, args.iterations, args.warmup) for config in configs}
+
+    if args.json:
+        print(json.dumps(reports, indent=2))
+    else:
+        print(f"{len(questions)} questions x {args.iterations} iterations, fake LLM latency {args.latency_ms} ms")
+        for config, report in reports.items():
+            _print_report(config, report)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(run())
@@ -1,6 +1,22 @@
+import os
+import shutil
+import tempfile
+
+# The suite runs against throwaway databases so it never writes to the tracked ones under data/
+_DB_DIR = tempfile.mkdtemp(prefix="nexus-tests-")
+for _name, _file in (
+    ("DATABASE_URL", "primary.db"),
+    ("ALERTS_DATABASE_URL", "alerts.db"),
+    ("DASHBOARDS_DATABASE_URL", "dashboards.db"),
+):
+    os.environ.setdefault(_name, f"sqlite:///{os.path.join(_DB_DIR, _file)}")
+
 import pytest
 from fastapi.testclient import TestClient
+from sqlalchemy import Integer, delete, func, inspect, select
+from app.db.session import engine_primary
 from app.main import app
+from app.models.base import Base
 
 
 @pytest.fixture(scope="session", autouse=True)
@@ -8,6 +24,31 @@ def _init_app():
     """Use TestClient as a context manager so startup/shutdown events fire."""
     with TestClient(app):
         yield
+    shutil.rmtree(_DB_DIR, ignore_errors=True)
+
+
+def _inserted_tables():
+    existing = set(inspect(engine_primary).get_table_names())
+    tables = []
+    for table in reversed(Base.metadata.sorted_tables):
+        column = table.c.get("id")
+        if table.name not in existing or column is None or not column.primary_key:
+            continue
+        if isinstance(column.type, Integer) and column.autoincrement in ("auto", True):
+            tables.append(table)
+    return tables
+
+
+@pytest.fixture(autouse=True)
+def _discard_inserted_rows():
+    """Delete rows a test inserted into the primary database so later tests see the seeded state."""
+    tables = _inserted_tables()
+    with engine_primary.connect() as connection:
+        marks = {table.name: connection.execute(select(func.max(table.c.id))).scalar() or 0 for table in tables}
+    yield
+    with engine_primary.begin() as connection:
+        for table in tables:
+            connection.execute(delete(table).where(table.c.id > marks[table.name]))
 
 
 @pytest.fixture()
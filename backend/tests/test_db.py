@@ -1,5 +1,11 @@
 """Tests for DB diagnostics endpoints and database integrity."""
 
+from unittest.mock import patch
+
+import pytest
+
+from app.db.session import _async_database_url
+
 
 def test_db_health(client) -> None:
     response = client.get("/api/db-test/health")
@@ -95,3 +101,14 @@ def test_db_seed_data_present(client) -> None:
     names = [r["name"] for r in rows]
     assert "Ava Chen" in names
     assert "Jordan Miles" in names
+
+
+def test_async_database_url_picks_async_drivers() -> None:
+    assert _async_database_url("sqlite:///./data/x.db") == "sqlite+aiosqlite:///./data/x.db"
+    assert _async_database_url("postgresql+asyncpg://u@h/db") == "postgresql+asyncpg://u@h/db"
+    with patch("app.db.session.importlib.util.find_spec", return_value=object()):
+        assert _async_database_url("postgresql+psycopg2://u@h/db") == "postgresql+asyncpg://u@h/db"
+        assert _async_database_url("mysql://u@h/db") == "mysql+aiomysql://u@h/db"
+    with patch("app.db.session.importlib.util.find_spec", return_value=None):
+        with pytest.raises(RuntimeError, match="pip install asyncpg"):
+            _async_database_url("postgresql://u@h/db")
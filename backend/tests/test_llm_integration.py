@@ -66,6 +66,72 @@ class TestBuildPrompt:
             assert DOMAIN_PROMPTS[domain] in prompt
 
 
+class TestSchemaSelection:
+    SCHEMA = {
+        "users": ["id", "name", "email", "role", "created_at"],
+        "transactions": ["id", "user_id", "amount", "currency", "status", "created_at"],
+        "login_events": ["id", "user_id", "ip_address", "success", "created_at", "metadata"],
+        "transactions_archive": ["id", "user_id", "amount", "currency", "status", "created_at"],
+        "ingestion_runs": ["id", "source_id", "status", "started_at", "finished_at"],
+        "scan_history": ["id", "scan_id", "domain", "status", "result_json", "created_at"],
+    }
+
+    def test_prunes_to_relevant_tables(self):
+        from app.services.nl2sql.schema import select_schema
+
+        selected = select_schema("total payments by currency", self.SCHEMA)
+        assert list(selected)[0] == "transactions"
+        assert "transactions_archive" not in selected
+        assert "ingestion_runs" not in selected
+
+    def test_operational_tables_only_when_named(self):
+        from app.services.nl2sql.schema import select_schema
+
+        assert "scan_history" in select_schema("latest scan history status", self.SCHEMA)
+        assert "scan_history" not in select_schema("status of payments", self.SCHEMA)
+
+    def test_sample_tables_never_reach_the_prompt(self, client):
+        from app.db.session import SessionLocalAnalytics
+        from app.services.nl2sql.schema import get_schema_profile, select_schema
+
+        with SessionLocalAnalytics() as db:
+            schema = get_schema_profile(db)
+        assert {"transactions_sample", "login_events_sample"} <= set(schema)
+        for query in ("List flagged transactions", "How many failed logins in the last 7 days", "show transactions_sample"):
+            selected = select_schema(query, schema)
+            assert selected
+            assert not any(table.endswith("_sample") for table in selected)
+
+    def test_sentinel_bookkeeping_is_operational(self, client):
+        from app.db.session import SessionLocalAnalytics
+        from app.services.nl2sql.schema import get_schema_profile, select_schema
+
+        with SessionLocalAnalytics() as db:
+            schema = get_schema_profile(db)
+        internal = {"scan_findings", "sentinel_mission_state", "sentinel_entity_counts"}
+        assert internal <= set(schema)
+        assert not internal & set(select_schema("Show scan findings with high risk", schema))
+        assert not internal & set(select_schema("mission state entity counts", schema))
+
+    def test_falls_back_to_canonical_tables(self):
+        from app.services.nl2sql.schema import select_schema
+
+        assert list(select_schema("anything unusual?", self.SCHEMA)) == ["users", "transactions", "login_events"]
+
+    def test_token_budget_prunes_columns(self):
+        from app.core.config import get_settings
+        from app.services.nl2sql.schema import select_schema
+
+        with patch.object(get_settings(), "llm_schema_token_budget", 12):
+            selected = select_schema("failed logins by ip_address", self.SCHEMA)
+        assert selected == {"login_events": ["id", "user_id", "ip_address", "created_at"]}
+
+    def test_prompt_uses_pruned_schema(self):
+        prompt = build_prompt("list payments", "general", self.SCHEMA)
+        assert "transactions(id, user_id, amount" in prompt
+        assert "ingestion_runs" not in prompt
+
+
 # ── parse_llm_output ───────────────────────────────────────────────────────
 
 class TestParseLlmOutput:
@@ -406,6 +472,38 @@ class TestRepair:
         assert result is None or isinstance(result, str)
 
 
+class TestSQLAnalysis:
+    def test_parses_once_across_validate_repair_and_cache(self):
+        from app.services.nl2sql import analysis
+        from app.services.nl2sql.cache import result_cache_key
+
+        analysis.clear_analysis_cache()
+        sql = "SELECT user_id, COUNT(*) AS count FROM login_events GROUP BY user_id"
+        with patch.object(analysis.sqlglot, "parse", wraps=analysis.sqlglot.parse) as parse:
+            assert validate_sql(sql) is None
+            assert has_single_statement(sql) and is_read_only_sql(sql)
+            assert "LIMIT 100" in repair_sql(sql)
+            assert result_cache_key("sqlite://", sql) is not None
+            assert analysis.analyze_sql(sql).meta() == {"intent": "count", "group_by": "user_id"}
+        assert parse.call_count == 1
+
+    def test_repaired_sql_is_validated_from_cache(self):
+        from app.services.nl2sql import analysis
+
+        analysis.clear_analysis_cache()
+        with patch.object(analysis.sqlglot, "parse", wraps=analysis.sqlglot.parse) as parse:
+            sql, error = analysis.check_sql("SELECT 1; SELECT 2")
+        assert error is None
+        assert sql == "SELECT 1 LIMIT 100"
+        assert parse.call_count == 1
+
+    def test_meta_uses_ast_not_text(self):
+        from app.services.nl2sql.analysis import analyze_sql
+
+        meta = analyze_sql("SELECT 'count(' AS label, SUM(amount) AS total_amount FROM transactions").meta()
+        assert meta == {"intent": "sum", "group_by": None}
+
+
 # ── Prompts module ──────────────────────────────────────────────────────────
 
 class TestDomainPrompts:
@@ -417,3 +515,351 @@ class TestDomainPrompts:
         for domain, prompt in DOMAIN_PROMPTS.items():
             assert isinstance(prompt, str), f"{domain} prompt is not a string"
             assert len(prompt) > 10, f"{domain} prompt is too short"
+
+
+# ── Circuit breaker around the LLM call ────────────────────────────────────
+
+import threading
+import time
+
+from app.services.nl2sql.breaker import CircuitBreaker, call_with_deadline, get_llm_breaker
+
+
+class TestCircuitBreaker:
+    def test_opens_after_threshold(self):
+        breaker = CircuitBreaker("test", failure_threshold=2, cooldown_seconds=60)
+        assert breaker.allow()
+        breaker.record_failure()
+        assert breaker.state == "closed"
+        assert breaker.allow()
+        breaker.record_failure()
+        assert breaker.state == "open"
+        assert breaker.allow() is False
+        snapshot = breaker.snapshot()
+        assert snapshot["trips"] == 1
+        assert snapshot["short_circuits"] == 1
+
+    def test_half_open_probe_closes_on_success(self):
+        breaker = CircuitBreaker("test", failure_threshold=1, cooldown_seconds=0)
+        breaker.allow()
+        breaker.record_failure()
+        assert breaker.state == "half_open"
+        assert breaker.allow() is True
+        # Only one probe at a time while half open
+        assert breaker.allow() is False
+        breaker.record_success()
+        assert breaker.state == "closed"
+
+    def test_half_open_probe_failure_reopens(self):
+        breaker = CircuitBreaker("test", failure_threshold=1, cooldown_seconds=0)
+        breaker.allow()
+        breaker.record_failure()
+        breaker.allow()
+        breaker.record_failure(timed_out=True)
+        snapshot = breaker.snapshot()
+        assert snapshot["trips"] == 2
+        assert snapshot["timeouts"] == 1
+
+    def test_call_with_deadline_times_out(self):
+        started = time.monotonic()
+        with pytest.raises(TimeoutError):
+            call_with_deadline(lambda: time.sleep(1), 0.05)
+        assert time.monotonic() - started < 0.5
+
+
+class TestLLMBreakerFallback:
+    def test_open_breaker_skips_llm(self, client):
+        from app.db.session import SessionLocalPrimary
+        db = SessionLocalPrimary()
+        breaker = get_llm_breaker()
+        try:
+            mock_llm = MagicMock()
+            mock_llm.invoke.side_effect = RuntimeError("quota exceeded")
+            with patch("app.services.nl2sql.graph.get_llm_client", return_value=mock_llm):
+                for _ in range(breaker.failure_threshold):
+                    state = run_graph(db, "list all users", None, "llm")
+                    assert state["llm_fallback"] == "error"
+                assert breaker.state == "open"
+
+                calls = mock_llm.invoke.call_count
+                state = run_graph(db, "list all users", None, "llm")
+            assert mock_llm.invoke.call_count == calls
+            assert state["llm_fallback"] == "circuit_open"
+            assert "users" in state["sql"].lower()
+        finally:
+            breaker.reset()
+            db.close()
+
+    def test_breaker_status_endpoint(self, client):
+        response = client.get("/api/v1/query/llm-breaker")
+        assert response.status_code == 200
+        body = response.json()
+        assert body["success"] is True
+        assert body["data"]["breaker"]["state"] in {"closed", "open", "half_open"}
+        assert "trips" in body["data"]["breaker"]
+
+
+# ── Hedged generation (rules vs LLM race) ──────────────────────────────────
+
+from app.core.config import get_settings
+
+
+def _slow_llm(content: str, delay: float) -> MagicMock:
+    def _invoke(prompt):
+        time.sleep(delay)
+        response = MagicMock()
+        response.content = content
+        return response
+
+    mock_llm = MagicMock()
+    mock_llm.invoke.side_effect = _invoke
+    return mock_llm
+
+
+class TestHedgedMode:
+    def test_rules_wins_when_llm_misses_deadline(self, client):
+        from app.db.session import SessionLocalPrimary
+        db = SessionLocalPrimary()
+        try:
+            mock_llm = _slow_llm("SELECT id FROM users LIMIT 1", 0.5)
+            with (
+                patch("app.services.nl2sql.graph.get_llm_client", return_value=mock_llm),
+                patch.object(get_settings(), "nl2sql_hedge_deadline_ms", 50),
+            ):
+                started = time.monotonic()
+                state = run_graph(db, "list all users", None, "hedged")
+                elapsed = time.monotonic() - started
+            assert state["generator"] == "rules"
+            assert state["hedge"]["winner"] == "rules"
+            assert state["hedge"]["reason"] == "deadline"
+            assert "users" in state["sql"].lower()
+            assert elapsed < 0.45
+        finally:
+            db.close()
+
+    def test_llm_wins_within_deadline(self, client):
+        from app.db.session import SessionLocalPrimary
+        db = SessionLocalPrimary()
+        try:
+            mock_llm = _slow_llm("SELECT id, name FROM users LIMIT 3", 0)
+            with (
+                patch("app.services.nl2sql.graph.get_llm_client", return_value=mock_llm),
+                patch.object(get_settings(), "nl2sql_hedge_deadline_ms", 2000),
+            ):
+                state = run_graph(db, "list all users", None, "hedged")
+            assert state["generator"] == "llm"
+            assert state["hedge"]["winner"] == "llm"
+            assert "llm_ms" in state["hedge"]
+            assert state["sql"] == "SELECT id, name FROM users LIMIT 3"
+        finally:
+            db.close()
+
+    def test_waits_for_llm_when_rules_cannot_answer(self, client):
+        from app.db.session import SessionLocalPrimary
+        db = SessionLocalPrimary()
+        try:
+            mock_llm = _slow_llm("SELECT name FROM data_centers LIMIT 5", 0.1)
+            with (
+                patch("app.services.nl2sql.graph.get_llm_client", return_value=mock_llm),
+                patch.object(get_settings(), "nl2sql_hedge_deadline_ms", 10),
+            ):
+                state = run_graph(db, "which data centers exist", None, "hedged")
+            assert state["generator"] == "llm"
+            assert state["hedge"]["rules_ready"] is False
+            assert "data_centers" in state["sql"]
+        finally:
+            db.close()
+
+    def test_hung_probe_releases_half_open_breaker_at_llm_timeout(self, client):
+        from app.db.session import SessionLocalPrimary
+        db = SessionLocalPrimary()
+        breaker = get_llm_breaker()
+        release = threading.Event()
+        try:
+            mock_llm = MagicMock()
+            mock_llm.invoke.side_effect = lambda prompt: release.wait(5)
+            settings = get_settings()
+            with (
+                patch("app.services.nl2sql.graph.get_llm_client", return_value=mock_llm),
+                patch.object(settings, "nl2sql_hedge_deadline_ms", 20),
+                patch.object(settings, "llm_timeout_seconds", 0.2),
+                patch.object(breaker, "cooldown_seconds", 0),
+            ):
+                breaker.reset()
+                for _ in range(breaker.failure_threshold):
+                    breaker.allow()
+                    breaker.record_failure()
+                assert breaker.state == "half_open"
+                state = run_graph(db, "list all users", None, "hedged")
+                assert state["hedge"]["winner"] == "rules"
+                # The probe is still hanging, but once llm_timeout passes it counts as a timed-out probe
+                time.sleep(0.4)
+                snapshot = breaker.snapshot()
+                assert snapshot["timeouts"] >= 1
+                assert breaker.allow() is True
+        finally:
+            release.set()
+            breaker.reset()
+            db.close()
+
+
+# ── Async pipeline ─────────────────────────────────────────────────────────
+
+import asyncio
+from unittest.mock import AsyncMock
+
+from app.services.nl2sql.engine import arun_query_pipeline
+from app.services.nl2sql.graph import arun_graph
+
+
+def _run_async(coro_fn):
+    from app.db.session import AsyncSessionLocalAnalytics, engine_analytics_async
+
+    async def _run():
+        try:
+            async with AsyncSessionLocalAnalytics() as db:
+                return await coro_fn(db)
+        finally:
+            await engine_analytics_async.dispose()
+
+    return asyncio.run(_run())
+
+
+class TestAsyncPipeline:
+    def test_arun_graph_rules(self, client):
+        state = _run_async(lambda db: arun_graph(db, "list all users", None, "rules"))
+        assert "users" in state["sql"].lower()
+        assert state["schema"]["users"]
+
+    def test_arun_graph_llm_uses_ainvoke(self, client):
+        mock_response = MagicMock()
+        mock_response.content = "SELECT id, name FROM users LIMIT 2"
+        mock_llm = MagicMock()
+        mock_llm.ainvoke = AsyncMock(return_value=mock_response)
+
+        with patch("app.services.nl2sql.graph.get_llm_client", return_value=mock_llm):
+            state = _run_async(lambda db: arun_graph(db, "show users", None, "llm"))
+        mock_llm.ainvoke.assert_awaited_once()
+        mock_llm.invoke.assert_not_called()
+        assert state["sql"] == "SELECT id, name FROM users LIMIT 2"
+        assert state["generator"] == "llm"
+
+    def test_arun_graph_hedged_rules_wins(self, client):
+        async def _slow(prompt):
+            await asyncio.sleep(0.5)
+            response = MagicMock()
+            response.content = "SELECT id FROM users LIMIT 1"
+            return response
+
+        mock_llm = MagicMock()
+        mock_llm.ainvoke = _slow
+        with (
+            patch("app.services.nl2sql.graph.get_llm_client", return_value=mock_llm),
+            patch.object(get_settings(), "nl2sql_hedge_deadline_ms", 20),
+        ):
+            state = _run_async(lambda db: arun_graph(db, "list all users", None, "hedged"))
+        assert state["hedge"]["winner"] == "rules"
+
+    def test_async_hung_probe_is_cancelled_at_llm_timeout(self, client):
+        breaker = get_llm_breaker()
+        cancelled = []
+
+        async def _hang(prompt):
+            try:
+                await asyncio.sleep(5)
+            except asyncio.CancelledError:
+                cancelled.append(True)
+                raise
+
+        async def _scenario(db):
+            state = await arun_graph(db, "list all users", None, "hedged")
+            await asyncio.sleep(0.4)
+            return state
+
+        mock_llm = MagicMock()
+        mock_llm.ainvoke = _hang
+        settings = get_settings()
+        try:
+            with (
+                patch("app.services.nl2sql.graph.get_llm_client", return_value=mock_llm),
+                patch.object(settings, "nl2sql_hedge_deadline_ms", 20),
+                patch.object(settings, "llm_timeout_seconds", 0.2),
+                patch.object(breaker, "cooldown_seconds", 0),
+            ):
+                breaker.reset()
+                for _ in range(breaker.failure_threshold):
+                    breaker.allow()
+                    breaker.record_failure()
+                state = _run_async(_scenario)
+                assert state["hedge"]["winner"] == "rules"
+                assert cancelled == [True]
+                assert breaker.allow() is True
+        finally:
+            breaker.reset()
+
+    def test_arun_query_pipeline_executes(self, client):
+        with patch("app.services.nl2sql.graph.get_llm_client", return_value=None):
+            result = _run_async(lambda db: arun_query_pipeline(db, "list all users", None))
+        assert result["clarification_needed"] is False
+        assert len(result["rows"]) >= 2
+
+
+# ── Fake LLM provider and stage timings ────────────────────────────────────
+
+from app.services.nl2sql.fake_llm import DEFAULT_FIXTURES, FakeLLM, FakeLLMError
+from app.services.nl2sql.timing import collect_stage_timings
+
+
+class TestFakeLLM:
+    def test_fake_provider_answers_from_fixtures(self):
+        with patch.object(get_settings(), "llm_provider", "fake"):
+            llm = get_llm_client()
+        prompt = build_prompt("Count transactions?", None, SAMPLE_SCHEMA)
+        assert "count(*)" in llm.invoke(prompt).content.lower()
+        assert llm.invoke(build_prompt("something unknown", None, SAMPLE_SCHEMA)).content.startswith("CLARIFY:")
+
+    def test_seeded_failures_are_deterministic(self):
+        def outcomes():
+            llm = FakeLLM({}, "CLARIFY: ?", failure_rate=0.5, seed=7)
+            results = []
+            for _ in range(20):
+                try:
+                    llm.invoke("User question: x")
+                    results.append(True)
+                except FakeLLMError:
+                    results.append(False)
+            return results
+
+        assert outcomes() == outcomes()
+        assert not all(outcomes())
+
+    def test_failing_fake_falls_back_to_rules(self, client):
+        from app.db.session import SessionLocalPrimary
+        db = SessionLocalPrimary()
+        breaker = get_llm_breaker()
+        try:
+            breaker.reset()
+            failing = FakeLLM({}, "", failure_rate=1.0)
+            with patch("app.services.nl2sql.graph.get_llm_client", return_value=failing):
+                state = run_graph(db, "list all users", None, "llm")
+            assert state["llm_fallback"] == "error"
+            assert "users" in state["sql"].lower()
+        finally:
+            breaker.reset()
+            db.close()
+
+    def test_pipeline_records_stage_timings(self, client):
+        from app.db.session import SessionLocalPrimary
+        from app.services.nl2sql.engine import run_query_pipeline
+        db = SessionLocalPrimary()
+        try:
+            with (
+                patch.object(get_settings(), "nl2sql_mode", "llm"),
+                patch("app.services.nl2sql.graph.get_llm_client", return_value=FakeLLM.from_file(DEFAULT_FIXTURES)),
+                collect_stage_timings() as timings,
+            ):
+                result = run_query_pipeline(db, "list users", None)
+            assert result["generator"] == "llm"
+            assert {"schema", "generate", "validate", "execute"} <= set(timings)
+        finally:
+            db.close()
@@ -1,6 +1,527 @@
+import asyncio
+import json
+import random
+import time
+from datetime import datetime, timedelta
+from unittest.mock import MagicMock, patch
+import pytest
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+
+from app.core.config import get_settings
+from app.db.session import AsyncSessionLocalAnalytics, SessionLocalPrimary, engine_analytics_async, engine_primary
+from app.db.versions import get_table_versions
+from app.models.demo import Transaction, User
+from app.models.ingestion import DataCenter
+from app.services.maintenance.archive import refresh_daily_transaction_metrics, refresh_sample_tables
+from app.services.nl2sql import rules
+from app.services.nl2sql.cache import ResultCache, estimate_rows_bytes, get_result_cache
+from app.services.nl2sql.columnar import ColumnarRows, payload_to_rows
+from app.services.nl2sql.engine import _suggest_visualization, aexecute_sql, execute_sql
+from app.services.nl2sql.governor import QueryBudget, QueryRejected, cancel_on_disconnect, governed
+from app.services.nl2sql.insights import compute_statistics, describe_statistics
+from app.services.nl2sql.planner import clear_plan_cache, review_plan
+from app.services.nl2sql.rollups import route_to_rollup
+from app.services.nl2sql.sampling import plan_sample_query
+from app.services.nl2sql.streaming import astream_ndjson
+
+
 def test_query_list_users(client) -> None:
     response = client.post("/api/v1/query", json={"query": "List users"})
     assert response.status_code == 200
     body = response.json()
     assert body["success"] is True
     assert "result" in body["data"]
+
+
+def test_query_result_cache_hits_until_ingestion_commit(client) -> None:
+    cache = get_result_cache()
+    first = client.post("/api/v1/query", json={"query": "List users"}).json()["data"]["result"]["rows"]
+    hits = cache.stats()["hits"]
+    second = client.post("/api/v1/query", json={"query": "List users"}).json()["data"]["result"]["rows"]
+    assert second == first
+    assert cache.stats()["hits"] == hits + 1
+
+    email = f"cache_{datetime.utcnow().timestamp()}@example.com"
+    with SessionLocalPrimary() as session:
+        session.add(User(name="Cache Probe", email=email, role="analyst"))
+        session.commit()
+
+    rows = client.post("/api/v1/query", json={"query": "List users"}).json()["data"]["result"]["rows"]
+    assert email in [r["email"] for r in rows]
+
+
+def test_result_cache_lru_eviction_by_bytes() -> None:
+    rows = [{"id": i, "name": "x" * 50} for i in range(10)]
+    size = estimate_rows_bytes(rows)
+    cache = ResultCache(max_bytes=size * 4)
+    cache.put("a", rows)
+    cache.put("b", rows)
+    cache.put("c", rows)
+    assert cache.get("a") is not None  # a becomes most recently used
+    cache.put("d", rows)
+    cache.put("e", rows)
+    stats = cache.stats()
+    assert stats["bytes"] <= size * 4
+    assert stats["evictions"] >= 1
+    assert cache.get("a") is not None
+    assert cache.get("b") is None
+
+
+def test_table_versions_bump_on_commit() -> None:
+    before = dict(get_table_versions(["data_centers", "users"]))
+    with SessionLocalPrimary() as session:
+        session.add(DataCenter(name=f"dc-version-{datetime.utcnow().timestamp()}", status="healthy"))
+        session.commit()
+    after = dict(get_table_versions(["data_centers", "users"]))
+    assert after["data_centers"] == before["data_centers"] + 1
+    assert after["users"] == before["users"]
+
+    # text() DML through a session and writes on a raw connection bump versions too, but only once committed
+    with SessionLocalPrimary() as session:
+        session.execute(text("UPDATE data_centers SET status = status WHERE id = -1"))
+        assert dict(get_table_versions(["data_centers"]))["data_centers"] == after["data_centers"]
+        session.commit()
+    assert dict(get_table_versions(["data_centers"]))["data_centers"] == after["data_centers"] + 1
+    with engine_primary.connect() as connection:
+        connection.execute(text("DELETE FROM data_centers WHERE id = -1"))
+        connection.rollback()
+    assert dict(get_table_versions(["data_centers"]))["data_centers"] == after["data_centers"] + 1
+    email = f"raw_{datetime.utcnow().timestamp()}@example.com"
+    with engine_primary.begin() as connection:
+        connection.execute(
+            text('INSERT INTO "users" (name, email, role) VALUES (:name, :email, :role)'),
+            {"name": "Raw Probe", "email": email, "role": "analyst"},
+        )
+    assert dict(get_table_versions(["users"]))["users"] == after["users"] + 1
+
+
+def test_result_cache_hands_out_copies_and_expires() -> None:
+    rows = [{"id": 1, "name": "a"}]
+    cache = ResultCache(max_bytes=1_000_000, ttl_seconds=0.05)
+    cache.put("k", rows)
+    rows[0]["name"] = "changed"
+    hit = cache.get("k")
+    assert hit == [{"id": 1, "name": "a"}]
+    hit[0]["name"] = "mutated"
+    assert cache.get("k")[0]["name"] == "a"
+    time.sleep(0.06)
+    assert cache.get("k") is None
+    assert cache.stats()["entries"] == 0
+
+
+def test_query_ndjson_stream(client) -> None:
+    response = client.post("/api/v1/query", json={"query": "List users", "format": "ndjson"})
+    assert response.status_code == 200
+    assert "application/x-ndjson" in response.headers["content-type"]
+    lines = [json.loads(line) for line in response.text.splitlines() if line]
+    assert lines[0]["type"] == "meta"
+    assert "email" in lines[0]["columns"]
+    assert lines[-1]["type"] == "end"
+    rows = [row for line in lines if line["type"] == "rows" for row in line["rows"]]
+    assert lines[-1]["row_count"] == len(rows) >= 2
+    email_index = lines[0]["columns"].index("email")
+    assert "ava.chen@example.com" in [row[email_index] for row in rows]
+
+
+def test_query_ndjson_clarification_falls_back_to_json(client) -> None:
+    response = client.post("/api/v1/query", json={"query": "show me the widget stock", "format": "ndjson"})
+    assert response.status_code == 200
+    body = response.json()
+    assert body["success"] is True
+    assert body["data"]["result"]["clarification_needed"] is True
+
+
+_RUNAWAY_SQL = (
+    "WITH RECURSIVE spin(x) AS (SELECT 1 UNION ALL SELECT x + 1 FROM spin) "
+    "SELECT COUNT(*) AS count FROM spin"
+)
+
+
+def test_governor_interrupts_runaway_query() -> None:
+    with SessionLocalPrimary() as session:
+        started = time.monotonic()
+        with pytest.raises(QueryRejected) as info:
+            execute_sql(session, _RUNAWAY_SQL, QueryBudget(timeout_ms=100, max_rows=10, max_bytes=1_000_000))
+        assert info.value.code == "QUERY_TIMEOUT"
+        assert time.monotonic() - started < 2
+        # The connection is still usable after the interrupt
+        assert execute_sql(session, "SELECT 1 AS one")[0]["one"] == 1
+
+
+def test_governor_row_and_byte_caps() -> None:
+    with SessionLocalPrimary() as session:
+        for columnar in (False, True):
+            with pytest.raises(QueryRejected) as info:
+                budget = QueryBudget(5000, max_rows=1, max_bytes=1_000_000)
+                execute_sql(session, "SELECT id FROM users WHERE id > 0", budget, columnar=columnar)
+            assert info.value.code == "ROW_LIMIT_EXCEEDED"
+            assert info.value.details["max_rows"] == 1
+
+            with pytest.raises(QueryRejected) as info:
+                budget = QueryBudget(5000, max_rows=1000, max_bytes=10)
+                execute_sql(session, "SELECT * FROM users WHERE id > -1", budget, columnar=columnar)
+            assert info.value.code == "RESULT_TOO_LARGE"
+
+
+def test_governor_resets_mysql_session_timeout() -> None:
+    conn = MagicMock()
+    conn.dialect.name = "mysql"
+    with governed(conn, QueryBudget(5000, 10, 1_000)):
+        pass
+    statements = [str(call.args[0]) for call in conn.execute.call_args_list]
+    assert statements[0].startswith("SET SESSION MAX_EXECUTION_TIME = ")
+    assert statements[-1] == "SET SESSION MAX_EXECUTION_TIME = DEFAULT"
+
+
+def test_governor_async_timeout_and_cancel() -> None:
+    async def _run():
+        try:
+            async with AsyncSessionLocalAnalytics() as db:
+                with pytest.raises(QueryRejected) as info:
+                    await aexecute_sql(db, _RUNAWAY_SQL, QueryBudget(100, 10, 1_000_000))
+                assert info.value.code == "QUERY_TIMEOUT"
+
+                budget = QueryBudget(60_000, 10, 1_000_000)
+                polls = []
+
+                async def _disconnected() -> bool:
+                    polls.append(1)
+                    return len(polls) > 1
+
+                with pytest.raises(QueryRejected) as info:
+                    await cancel_on_disconnect(aexecute_sql(db, _RUNAWAY_SQL, budget), budget, _disconnected, 0.05)
+                assert info.value.code == "QUERY_CANCELLED"
+        finally:
+            await engine_analytics_async.dispose()
+
+    asyncio.run(_run())
+
+
+def test_query_ndjson_stream_is_governed(client) -> None:
+    with patch.object(get_settings(), "query_max_rows", 1):
+        response = client.post("/api/v1/query", json={"query": "List users", "format": "ndjson"})
+    lines = [json.loads(line) for line in response.text.splitlines() if line]
+    assert lines[0]["type"] == "meta"
+    assert lines[-1]["type"] == "error" and lines[-1]["code"] == "ROW_LIMIT_EXCEEDED"
+    assert lines[-1]["row_count"] == 0
+
+    async def _run():
+        try:
+            budget = QueryBudget(100, 10, 1_000_000)
+            started = time.monotonic()
+            stream = [json.loads(line) async for line in astream_ndjson(_RUNAWAY_SQL, {}, {}, 10, budget)]
+            return stream, time.monotonic() - started
+        finally:
+            await engine_analytics_async.dispose()
+
+    stream, elapsed = asyncio.run(_run())
+    assert stream[-1]["type"] == "error" and stream[-1]["code"] == "QUERY_TIMEOUT"
+    assert elapsed < 2
+
+
+def test_query_ndjson_stream_hides_driver_errors(client) -> None:
+    async def _run():
+        try:
+            return [json.loads(line) async for line in astream_ndjson("SELECT secret_column FROM missing_table", {}, {}, 10)]
+        finally:
+            await engine_analytics_async.dispose()
+
+    stream = asyncio.run(_run())
+    assert stream == [{"type": "error", "code": "QUERY_FAILED", "message": "Query failed unexpectedly.", "row_count": 0}]
+
+
+def test_plan_guard_policies() -> None:
+    sql = "SELECT * FROM transactions t WHERE t.amount > 0 ORDER BY t.currency"
+    settings = get_settings()
+    clear_plan_cache()
+    with SessionLocalPrimary() as db, patch.object(settings, "query_plan_large_table_rows", 0):
+        with patch.object(settings, "query_plan_policy", "warn"):
+            checked, plan = review_plan(db, sql)
+        assert checked == sql
+        assert plan["action"] == "warned"
+        assert {issue["type"] for issue in plan["issues"]} == {"full_scan", "temp_sort"}
+        assert plan["issues"][0]["table"] == "transactions"
+
+        with patch.object(settings, "query_plan_policy", "rewrite"):
+            checked, plan = review_plan(db, sql)
+        assert checked.endswith("LIMIT 1000")
+        assert plan["action"] == "rewritten" and plan["original_sql"] == sql
+
+        grouped = "SELECT t.currency, COUNT(*) AS total FROM transactions t WHERE t.amount > 0 GROUP BY t.currency"
+        with patch.object(settings, "query_plan_policy", "rewrite"):
+            checked, plan = review_plan(db, grouped)
+        assert checked == grouped
+        assert plan["issues"] and plan["action"] == "warned"
+
+        with patch.object(settings, "query_plan_policy", "reject"), pytest.raises(QueryRejected) as rejected:
+            review_plan(db, sql)
+        assert rejected.value.code == "QUERY_TOO_EXPENSIVE"
+
+        _checked, plan = review_plan(db, "SELECT * FROM transactions WHERE user_id = 1")
+        assert plan["issues"] == []
+
+
+def test_query_result_includes_plan(client) -> None:
+    result = client.post("/api/v1/query", json={"query": "List users"}).json()["data"]["result"]
+    assert result["plan"]["policy"] == "warn"
+    assert result["plan"]["steps"]
+
+
+def test_rollup_routing_matches_raw_and_tracks_freshness() -> None:
+    with SessionLocalPrimary() as db:
+        user = User(name="Rollup Probe", email=f"rollup_{datetime.utcnow().timestamp()}@example.com", role="analyst")
+        db.add(user)
+        db.flush()
+        for created_at, status in [
+            ("2021-06-01 08:00:00", "completed"),
+            ("2021-06-02 09:30:00", "flagged"),
+            ("2021-06-03 23:59:00", "completed"),
+            ("2021-06-04 00:00:00", "flagged"),
+            ("2021-06-05 12:00:00", "completed"),
+        ]:
+            created = datetime.strptime(created_at, "%Y-%m-%d %H:%M:%S")
+            db.add(Transaction(user_id=user.id, amount=10.5, status=status, created_at=created))
+        db.commit()
+        refresh_daily_transaction_metrics(db)
+
+        queries = [
+            "SELECT SUM(amount) AS total_amount, COUNT(*) AS count FROM transactions "
+            "WHERE created_at >= '2021-06-01 12:00:00' AND created_at < '2021-06-05 06:00:00'",
+            "SELECT AVG(amount) AS avg_amount FROM transactions WHERE created_at >= '2021-06-02'",
+            "SELECT COUNT(*) AS count FROM transactions WHERE status = 'flagged' AND created_at <= '2021-06-04 00:00:00'",
+        ]
+        for sql in queries:
+            rewritten, info = route_to_rollup(db, sql)
+            assert info is not None and info["table"] == "daily_transaction_metrics"
+            assert "daily_transaction_metrics" in rewritten
+            assert db.execute(text(rewritten)).mappings().one() == db.execute(text(sql)).mappings().one()
+
+        assert route_to_rollup(db, "SELECT SUM(amount) FROM transactions WHERE currency = 'USD'")[1] is None
+        db.add(Transaction(user_id=user.id, amount=1.0, status="completed", created_at=datetime(2021, 6, 3, 10)))
+        db.commit()
+        assert route_to_rollup(db, queries[0])[1] is None
+
+
+def test_rules_templates_bind_time_parameters() -> None:
+    schema = {"transactions": ["id", "user_id", "amount", "status", "created_at"]}
+    rules._build_template.cache_clear()
+    sql, _questions, meta = rules.generate_sql("Total amount of transactions in the last 30 days", None, schema)
+    again, _questions, meta_again = rules.generate_sql("total amount of  transactions in the last 30 days", None, schema)
+    assert sql == again
+    assert "created_at >= :start AND created_at < :end" in sql
+    assert meta["params"] == meta_again["params"]
+    assert meta["params"]["end"].endswith(":00")
+    assert rules._build_template.cache_info().hits == 1
+
+
+def test_rules_periods_at_the_last_minute_of_the_day() -> None:
+    schema = {"transactions": ["id", "user_id", "amount", "status", "created_at"]}
+    # Sunday 2030-03-31 23:59:30: the end of a day, a week and a month at once
+    with patch("app.services.nl2sql.rules._now", return_value=datetime(2030, 3, 31, 23, 59, 30)):
+        params = {
+            question: rules.generate_sql(f"Count transactions {question}", None, schema)[2]["params"]
+            for question in ("today", "yesterday", "this week", "this month", "in the last 7 days")
+        }
+    assert params["today"] == {"start": "2030-03-31 00:00:00", "end": "2030-04-01 00:00:00"}
+    assert params["yesterday"] == {"start": "2030-03-30 00:00:00", "end": "2030-03-31 00:00:00"}
+    assert params["this week"] == {"start": "2030-03-25 00:00:00", "end": "2030-04-01 00:00:00"}
+    assert params["this month"] == {"start": "2030-03-01 00:00:00", "end": "2030-04-01 00:00:00"}
+    assert params["in the last 7 days"] == {"start": "2030-03-25 00:00:00", "end": "2030-04-01 00:00:00"}
+
+
+def test_query_with_period_executes_bound_and_hits_cache(client) -> None:
+    payload = {"query": "Count transactions in the last 7 days"}
+    with patch("app.services.nl2sql.rules._now", return_value=datetime(2030, 1, 1, 12, 1)):
+        first = client.post("/api/v1/query", json=payload).json()["data"]["result"]
+        assert ":start" in first["sql"]
+        assert first["params"] == {"start": "2029-12-25 12:01:00", "end": "2030-01-01 12:01:00"}
+        hits = get_result_cache().stats()["hits"]
+        second = client.post("/api/v1/query", json=payload).json()["data"]["result"]
+    assert second["rows"] == first["rows"]
+    assert get_result_cache().stats()["hits"] == hits + 1
+
+
+def test_query_batch_dedupes_and_keeps_input_order(client) -> None:
+    payload = {
+        "queries": [
+            {"query": "List users"},
+            {"query": "Count transactions"},
+            {"query": "List users"},
+            {"query": "Show me something"},
+            {"query": "Number of transactions"},
+        ]
+    }
+    body = client.post("/api/v1/query/batch", json=payload).json()
+    assert body["success"] is True
+    results = body["data"]["results"]
+    assert len(results) == 5
+    assert body["data"]["stats"] == {"questions": 5, "unique_questions": 4, "unique_statements": 2}
+    assert results[0] == results[2]
+    assert results[1]["data"]["result"]["visualization"] == {"type": "metric", "value": "count"}
+    assert results[4]["data"]["result"]["rows"] == results[1]["data"]["result"]["rows"]
+    assert results[3]["data"]["result"]["clarification_needed"] is True
+
+
+def test_query_batch_rejects_oversized_batch(client) -> None:
+    with patch.object(get_settings(), "query_batch_max_items", 1):
+        body = client.post("/api/v1/query/batch", json={"queries": [{"query": "a"}, {"query": "b"}]}).json()
+    assert body["success"] is False
+    assert body["error"]["code"] == "BATCH_TOO_LARGE"
+
+
+def test_analytics_engine_is_read_only() -> None:
+    async def _run():
+        try:
+            async with AsyncSessionLocalAnalytics() as db:
+                assert (await db.execute(text("PRAGMA query_only"))).scalar() == 1
+                assert (await db.execute(text("PRAGMA mmap_size"))).scalar() > 0
+                with pytest.raises(OperationalError):
+                    await db.execute(text("DELETE FROM users"))
+        finally:
+            await engine_analytics_async.dispose()
+
+    asyncio.run(_run())
+
+
+def test_sample_estimates_cover_exact_answers() -> None:
+    rng = random.Random(40)
+    with SessionLocalPrimary() as db:
+        user = User(name="Sample Probe", email=f"sample_{datetime.utcnow().timestamp()}@example.com", role="analyst")
+        db.add(user)
+        db.flush()
+        for day, rows in [(datetime(2019, 3, 1), 600), (datetime(2019, 3, 2), 400), (datetime(2019, 3, 3), 5)]:
+            for index in range(rows):
+                status = "flagged" if rng.random() < 0.2 else "completed"
+                created = day + timedelta(seconds=index * 60)
+                db.add(Transaction(user_id=user.id, amount=round(rng.uniform(1, 500), 2), status=status, created_at=created))
+        db.commit()
+        refresh_sample_tables(db, fraction=0.1, min_stratum_rows=20)
+
+        window = "created_at >= '2019-03-01' AND created_at < '2019-03-04'"
+        queries = [
+            f"SELECT COUNT(*) AS count FROM transactions WHERE status = 'flagged' AND {window}",
+            f"SELECT SUM(amount) AS total_amount FROM transactions WHERE {window}",
+            f"SELECT AVG(t.amount) AS avg_amount FROM transactions AS t WHERE {window}",
+        ]
+        for sql in queries:
+            sample = plan_sample_query(sql)
+            assert sample is not None and "GROUP BY stratum" in sample.sql
+            strata = [dict(row) for row in db.execute(text(sample.sql)).mappings()]
+            assert sum(stratum["population"] for stratum in strata) == 1005
+            rows, info = sample.estimate(strata, 0.95)
+            (alias, exact), = db.execute(text(sql)).mappings().one().items()
+            estimate = info["estimates"][alias]
+            assert rows[0][alias] == estimate["value"]
+            assert estimate["stderr"] > 0
+            assert abs(estimate["value"] - exact) <= 4 * estimate["stderr"]
+
+        # A stratum smaller than the minimum is kept whole, so its answer is exact
+        census = "SELECT SUM(amount) AS total FROM transactions WHERE created_at >= '2019-03-03' AND created_at < '2019-03-04'"
+        sample = plan_sample_query(census)
+        rows, info = sample.estimate([dict(row) for row in db.execute(text(sample.sql)).mappings()], 0.95)
+        assert info["estimates"]["total"]["stderr"] == 0
+        assert rows[0]["total"] == pytest.approx(db.execute(text(census)).scalar())
+
+        assert plan_sample_query("SELECT user_id, COUNT(*) FROM transactions GROUP BY user_id") is None
+        db.add(Transaction(user_id=user.id, amount=1.0, status="completed", created_at=datetime(2019, 3, 2, 10)))
+        db.commit()
+        assert plan_sample_query(queries[1]) is None
+
+
+def test_query_approximate_mode_reports_interval(client) -> None:
+    rng = random.Random(41)
+    with SessionLocalPrimary() as db:
+        user = User(name="Approx Probe", email=f"approx_{datetime.utcnow().timestamp()}@example.com", role="analyst")
+        db.add(user)
+        db.flush()
+        db.add_all(
+            Transaction(
+                user_id=user.id,
+                amount=10.0,
+                status="flagged" if rng.random() < 0.3 else "completed",
+                created_at=datetime(2018, 5, day) + timedelta(seconds=index * 60),
+            )
+            for day in (1, 2, 3)
+            for index in range(1000)
+        )
+        db.commit()
+
+    payload = {"query": "Number of flagged transactions", "approximate": True}
+    # A wide interval keeps the random sample from making the coverage check flaky
+    with patch.object(get_settings(), "query_approximate_confidence", 0.999):
+        assert client.post("/api/v1/maintenance/refresh-samples").json()["success"] is True
+        result = client.post("/api/v1/query", json=payload).json()["data"]["result"]
+    approximate = result["approximate"]
+    assert approximate["table"] == "transactions_sample"
+    assert approximate["exact_follow_up"] == {"query": payload["query"], "domain": None, "approximate": False}
+    assert approximate["sampled_rows"] < approximate["population_rows"]
+    estimate = approximate["estimates"]["count"]
+    assert estimate["low"] < estimate["high"]
+
+    exact = client.post("/api/v1/query", json=approximate["exact_follow_up"]).json()["data"]["result"]
+    assert "approximate" not in exact
+    assert estimate["low"] <= exact["rows"][0]["count"] <= estimate["high"]
+
+
+def test_query_columnar_format_matches_rows(client) -> None:
+    rows = client.post("/api/v1/query", json={"query": "List users"}).json()["data"]["result"]["rows"]
+    response = client.post("/api/v1/query", json={"query": "List users", "format": "columnar"})
+    assert response.headers["content-type"] == "application/json"
+    result = response.json()["data"]["result"]
+    assert "rows" not in result
+    columnar = result["columnar"]
+    assert columnar["row_count"] == len(rows)
+    assert columnar["types"][columnar["columns"].index("id")] == "integer"
+    assert payload_to_rows(columnar) == rows
+
+
+def test_result_statistics_are_vectorized_and_budgeted() -> None:
+    days = 20
+    amounts = [10.0 + day for day in range(days) for _ in range(50)]
+    amounts[997] = 10_000.0
+    rows = ColumnarRows(
+        ["id", "amount", "status", "created_at"],
+        [
+            list(range(len(amounts))),
+            amounts,
+            ["flagged" if index % 4 == 0 else "completed" for index in range(len(amounts))],
+            [f"2022-01-{day + 1:02d} 12:00:00" for day in range(days) for _ in range(50)],
+        ],
+    )
+    statistics = compute_statistics(rows)
+    assert statistics["truncated"] is False
+    assert "id" not in statistics["columns"]
+    amount = statistics["columns"]["amount"]
+    assert amount["count"] == len(amounts) and amount["max"] == 10_000.0
+    assert amount["quantiles"]["p50"] == pytest.approx(19.5)
+    assert sum(amount["histogram"]["counts"]) == len(amounts)
+    assert statistics["outliers"]["amount"]["examples"][0]["row"] == 997
+    assert statistics["columns"]["status"]["top"][0] == {"value": "completed", "count": 750, "share": 0.75}
+    assert statistics["trend"]["x"] == "created_at" and statistics["trend"]["direction"] == "up"
+    assert len(statistics["trend"]["series"]) == days
+    assert any("outlier" in insight for insight in describe_statistics(statistics))
+    assert _suggest_visualization({"intent": "list"}, statistics)["type"] == "line"
+
+    with patch.object(get_settings(), "insights_time_budget_ms", 0):
+        assert compute_statistics(rows)["truncated"] is True
+    assert compute_statistics(ColumnarRows(["amount"], [[1.0]])) is None
+
+
+def test_result_statistics_sample_large_results_within_the_default_budget() -> None:
+    rng = random.Random(42)
+    count = 100_000
+    rows = [
+        {"id": index, "amount": rng.uniform(0, 100), "status": "flagged" if rng.random() < 0.25 else "completed"}
+        for index in range(count)
+    ]
+    started = time.perf_counter()
+    statistics = compute_statistics(rows)
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    amount = statistics["columns"]["amount"]
+    assert amount["sampled"] is True
+    assert amount["count"] == pytest.approx(count, rel=0.01)
+    assert amount["mean"] == pytest.approx(50, rel=0.05)
+    assert statistics["columns"]["status"]["top"][0]["value"] == "completed"
+    # Only the strided sample is copied out, so the cost does not grow with the result
+    assert elapsed_ms < 10 * get_settings().insights_time_budget_ms
@@ -1,3 +1,29 @@
+import asyncio
+import re
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+from unittest.mock import patch
+from sqlalchemy import delete, func, inspect, select, text
+
+from app.core.config import get_settings
+from app.db.session import SessionLocalAnalytics, SessionLocalPrimary
+from app.db.versions import bump_table_versions
+from app.models.demo import LoginEvent, Transaction, User
+from app.models.sentinel import ScanFinding, ScanHistory, SentinelEntityCount, SentinelMissionState
+from app.services.nl2sql import engine
+from app.services.nl2sql.governor import QueryRejected
+from app.services.sentinel import engine as sentinel_engine
+from app.services.sentinel import fusion
+from app.services.sentinel.broadcast import ScanBroadcaster
+from app.services.sentinel.correlation import correlate_failed_then_flagged
+from app.services.sentinel.engine import run_scan, run_scan_stream
+from app.services.sentinel.history import list_history
+from app.services.sentinel.missions import MissionCompiler, get_mission_compiler
+from app.services.sentinel.scheduler import SentinelScheduler
+
+
 def test_sentinel_scan(client) -> None:
     response = client.get("/api/v1/sentinel/scan?domain=security")
     assert response.status_code == 200
@@ -103,7 +129,434 @@ def test_sentinel_scan_stream(client) -> None:
     response = client.get("/api/v1/sentinel/scan/stream?domain=general")
     assert response.status_code == 200
     assert "text/event-stream" in response.headers["content-type"]
-    text = response.text
-    assert "event: status" in text
-    assert "event: complete" in text
-    assert "event: mission" in text
+    stream = response.text
+    assert "event: status" in stream
+    assert "event: complete" in stream
+    assert "event: mission" in stream
+
+    ids = [line[4:] for line in stream.splitlines() if line.startswith("id: ")]
+    resumed = client.get("/api/v1/sentinel/scan/stream?domain=general", headers={"Last-Event-ID": ids[-2]}).text
+    assert [line[4:] for line in resumed.splitlines() if line.startswith("id: ")] == ids[-1:]
+
+
+def test_sentinel_scan_columnar_and_history_conversion(client) -> None:
+    body = client.get("/api/v1/sentinel/scan?domain=general&format=columnar").json()
+    assert body["success"] is True
+    completed = [f for f in body["data"]["findings"] if f["status"] == "completed"]
+    assert completed
+    for finding in completed:
+        assert "rows" not in finding
+        columnar = finding["columnar"]
+        assert len(columnar["columns"]) == len(columnar["types"]) == len(columnar["data"])
+        assert all(len(values) == columnar["row_count"] for values in columnar["data"])
+
+    scan_id = body["data"]["scan_id"]
+    rows_view = client.get(f"/api/v1/sentinel/history/{scan_id}").json()["data"]
+    cap = get_settings().sentinel_history_rows
+    for finding, columnar_finding in zip(rows_view["findings"], body["data"]["findings"]):
+        if "columnar" in columnar_finding:
+            # History keeps a capped sample of each finding's rows
+            assert len(finding["rows"]) == min(columnar_finding["columnar"]["row_count"], cap)
+            if finding["rows"]:
+                assert list(finding["rows"][0]) == columnar_finding["columnar"]["columns"]
+
+
+def test_sentinel_missions_run_concurrently_on_separate_sessions(client) -> None:
+    delays = {"Show recent failed logins": 0.4, "List flagged transactions": 0.1, "List flagged transactions by user_id": 0.1}
+    sessions = set()
+
+    def fake_pipeline(db, query, domain, columnar=False):
+        sessions.add(id(db))
+        time.sleep(delays.get(query, 0))
+        return {"sql": "SELECT 1", "params": {}, "rows": [{"n": i} for i in range(3)], "visualization": {}, "insights": []}
+
+    with (
+        patch("app.services.sentinel.engine.run_mission_query", side_effect=fake_pipeline),
+        patch.object(get_settings(), "sentinel_mission_concurrency", 4),
+        SessionLocalPrimary() as db,
+    ):
+        started = time.monotonic()
+        events = list(run_scan_stream(db, "security"))
+        elapsed = time.monotonic() - started
+
+    completed = [
+        payload["mission_id"]
+        for event, payload in events
+        if event in {"mission", "deep_dive"} and payload["status"] == "completed"
+    ]
+    # flagged_transactions (risk 12) finishes first and its deep dive starts while failed_logins still runs
+    assert completed[:3] == ["flagged_transactions", "flagged_transactions_deep_dive", "failed_logins"]
+    assert elapsed < 0.55
+    assert len(sessions) == len(completed) == 4
+    findings = events[-1][1]["findings"]
+    assert [f["mission_id"] for f in findings][:4] == [
+        "failed_logins",
+        "failed_logins_deep_dive",
+        "flagged_transactions",
+        "flagged_transactions_deep_dive",
+    ]
+
+
+def test_sentinel_missions_reuse_compiled_sql_until_schema_changes(client) -> None:
+    get_mission_compiler().clear()
+    with patch("app.services.sentinel.missions.generate_statement", wraps=engine.generate_statement) as generate:
+        first = client.get("/api/v1/sentinel/scan?domain=security").json()["data"]
+        compiled = generate.call_count
+        assert compiled > 0
+
+        second = client.get("/api/v1/sentinel/scan?domain=security").json()["data"]
+        assert generate.call_count == compiled
+        assert [f.get("sql") for f in second["findings"]] == [f.get("sql") for f in first["findings"]]
+        assert second["findings"][0]["params"].keys() == {"start", "end"}
+
+        with SessionLocalPrimary() as db:
+            db.execute(text("CREATE TABLE IF NOT EXISTS sentinel_schema_probe (id INTEGER PRIMARY KEY)"))
+            db.execute(text("DROP TABLE sentinel_schema_probe"))
+            db.commit()
+        client.get("/api/v1/sentinel/scan?domain=security")
+        assert generate.call_count == compiled * 2
+
+    stats = client.get("/api/v1/sentinel/missions/compiled").json()["data"]["missions"]
+    assert stats["entries"] > 0 and stats["reuses"] > 0
+
+
+def test_sentinel_missions_expire_llm_compiled_sql(client) -> None:
+    statement = {
+        "sql": "SELECT * FROM login_events WHERE created_at >= '2030-01-01' LIMIT 10",
+        "params": {},
+        "questions": [],
+        "error": None,
+        "generation": {"generator": "llm"},
+    }
+    compiler = MissionCompiler()
+    settings = get_settings()
+    with (
+        SessionLocalAnalytics() as db,
+        patch("app.services.sentinel.missions.generate_statement", return_value=statement) as generate,
+    ):
+        with patch.object(settings, "sentinel_mission_llm_ttl_seconds", 60.0):
+            compiler.compile(db, "Show recent failed logins", "security")
+            compiler.compile(db, "Show recent failed logins", "security")
+        assert generate.call_count == 1
+
+        # Literal dates written by the LLM would freeze, so an expired entry is compiled again
+        with patch("app.services.sentinel.missions.time.monotonic", return_value=time.monotonic() + 61):
+            compiler.compile(db, "Show recent failed logins", "security")
+        assert generate.call_count == 2
+
+        with patch.object(settings, "sentinel_mission_llm_ttl_seconds", 0.0):
+            compiler.clear()
+            compiler.compile(db, "Show recent failed logins", "security")
+            compiler.compile(db, "Show recent failed logins", "security")
+        assert generate.call_count == 4
+
+
+def test_sentinel_all_domains_fuse_missions_into_one_scan_per_table(client) -> None:
+    scanned = []
+
+    def spy(db, sql, budget, params):
+        scanned.append(re.search(r"SELECT (\w+)\.\*, CASE", sql).group(1))
+        return execute_sql(db, sql, budget, params)
+
+    execute_sql = fusion.execute_sql
+    with patch.object(fusion, "execute_sql", side_effect=spy):
+        fused = client.get("/api/v1/sentinel/scan?domain=all").json()["data"]
+    # transactions has one filtered mission; the unfiltered listings keep their own LIMIT-bounded queries
+    assert scanned == ["login_events"]
+    by_id = {f["mission_id"]: f for f in fused["findings"]}
+    assert by_id["failed_logins"]["fused"] == by_id["recent_logins"]["fused"] == {"table": "login_events", "missions": 2}
+    assert "fused" not in by_id["high_value_transactions"]
+
+    with patch.object(get_settings(), "sentinel_fuse_missions", False):
+        separate = client.get("/api/v1/sentinel/scan?domain=all").json()["data"]
+    expected = {f["mission_id"]: f for f in separate["findings"] if "row_count" in f}
+    for finding in fused["findings"]:
+        if "fused" in finding:
+            # row_count is the sample on both paths; only the fused scan also counts every matching row
+            assert finding["row_count"] == expected[finding["mission_id"]]["row_count"] == len(finding["rows"])
+            assert finding["match_count"] >= finding["row_count"]
+            assert finding["risk"] == expected[finding["mission_id"]]["risk"]
+            assert len(finding["rows"]) == min(finding["match_count"], get_settings().sentinel_sample_rows)
+
+
+def test_sentinel_incremental_scan_reads_only_new_rows(client) -> None:
+    def failed_logins(data):
+        return next(f for f in data["findings"] if f["mission_id"] == "failed_logins")
+
+    with patch.object(get_settings(), "sentinel_rebaseline_minutes", 0):
+        baseline = failed_logins(client.get("/api/v1/sentinel/scan?domain=security&incremental=true").json()["data"])
+    assert baseline["incremental"]["since_id"] == 0
+    assert baseline["incremental"]["rebaselined"] is True
+
+    idle = failed_logins(client.get("/api/v1/sentinel/scan?domain=security&incremental=true").json()["data"])
+    assert idle["incremental"]["since_id"] == baseline["incremental"]["until_id"]
+    assert idle["new_rows"] == 0
+    assert idle["match_count"] == baseline["match_count"]
+    assert idle["risk"] == baseline["risk"]
+
+    with SessionLocalPrimary() as db:
+        user_id = db.execute(select(User.id)).scalars().first()
+        db.add(LoginEvent(user_id=user_id, ip_address="10.9.9.9", success=0, created_at=datetime.utcnow()))
+        db.commit()
+
+    data = client.get("/api/v1/sentinel/scan?domain=security&incremental=true").json()["data"]
+    latest = failed_logins(data)
+    assert latest["incremental"]["since_id"] == idle["incremental"]["until_id"]
+    assert latest["new_rows"] == 1
+    assert latest["match_count"] == baseline["match_count"] + 1
+    assert [row["ip_address"] for row in latest["rows"]] == ["10.9.9.9"]
+    if latest["risk"] >= 6:
+        deep_dive = next(f for f in data["findings"] if f["mission_id"] == "failed_logins_deep_dive")
+        assert deep_dive["rows"]
+        assert sum(row["count"] for row in deep_dive["rows"]) <= latest["match_count"]
+
+
+def test_sentinel_incremental_scan_rebuilds_counts_when_rows_are_removed(client) -> None:
+    def failed_logins():
+        data = client.get("/api/v1/sentinel/scan?domain=security&incremental=true").json()["data"]
+        return next(f for f in data["findings"] if f["mission_id"] == "failed_logins")
+
+    with patch.object(get_settings(), "sentinel_rebaseline_minutes", 0):
+        baseline = failed_logins()
+
+    with SessionLocalPrimary() as db:
+        user_id = db.execute(select(User.id)).scalars().first()
+        added = [LoginEvent(user_id=user_id, ip_address="10.8.8.8", success=0, created_at=datetime.utcnow()) for _ in range(3)]
+        db.add_all(added)
+        db.commit()
+        added_ids = [event.id for event in added]
+
+    grown = failed_logins()
+    assert grown["match_count"] == baseline["match_count"] + 3
+
+    with SessionLocalPrimary() as db:
+        db.execute(delete(LoginEvent).where(LoginEvent.id.in_(added_ids)))
+        db.commit()
+
+    # MAX(id) is now below the watermark; the same scan starts over instead of reporting the stale total
+    shrunk = failed_logins()
+    assert shrunk["incremental"]["since_id"] == 0
+    assert shrunk["incremental"]["until_id"] < grown["incremental"]["until_id"]
+    assert shrunk["incremental"]["rebaselined"] is True
+    assert shrunk["match_count"] == baseline["match_count"]
+    assert shrunk["risk"] == baseline["risk"]
+
+
+def test_sentinel_incremental_scan_counts_more_entities_than_the_row_cap(client) -> None:
+    def scan():
+        return client.get("/api/v1/sentinel/scan?domain=security&incremental=true").json()["data"]["findings"]
+
+    settings = get_settings()
+    # The fused listing keeps at most sentinel_sample_rows rows, so only the per-entity counts exceed the cap
+    with patch.object(settings, "query_max_rows", settings.sentinel_sample_rows):
+        with patch.object(settings, "sentinel_rebaseline_minutes", 0):
+            scan()
+        with SessionLocalPrimary() as db:
+            users = [User(name=f"Entity {index}", email=f"entity-{uuid.uuid4().hex}@example.com") for index in range(settings.sentinel_sample_rows + 5)]
+            db.add_all(users)
+            db.flush()
+            db.add_all(LoginEvent(user_id=user.id, ip_address="10.7.7.7", success=0, created_at=datetime.utcnow()) for user in users)
+            db.commit()
+        findings = scan()
+
+    failed = next(f for f in findings if f["mission_id"] == "failed_logins")
+    assert "incremental_fallback" not in failed
+    assert failed["new_rows"] == len(users)
+    with SessionLocalPrimary() as db:
+        state = db.execute(select(SentinelMissionState).where(SentinelMissionState.mission_id == "failed_logins")).scalar_one()
+        counted = db.execute(
+            select(func.count()).where(SentinelEntityCount.mission_id == "failed_logins", SentinelEntityCount.count >= 1)
+        ).scalar()
+    assert state.watermark_id == failed["incremental"]["until_id"]
+    assert counted >= len(users)
+    deep_dive = next(f for f in findings if f["mission_id"] == "failed_logins_deep_dive")
+    assert len(deep_dive["rows"]) == settings.sentinel_sample_rows
+
+    rejected = QueryRejected("QUERY_TIMEOUT", "Query exceeded the time budget.")
+    with patch.object(sentinel_engine, "run_incremental", side_effect=rejected):
+        failed = next(f for f in scan() if f["mission_id"] == "failed_logins")
+    assert failed["incremental_fallback"]["code"] == "QUERY_TIMEOUT"
+    with SessionLocalPrimary() as db:
+        assert db.get(SentinelMissionState, state.id).watermark_id == state.watermark_id
+
+
+def test_sentinel_scheduler_coalesces_change_bursts_and_skips_idle_domains(client) -> None:
+    scans = []
+
+    def fake_scan(domain):
+        scans.append(domain)
+        return {"risk_score": 0}
+
+    async def scenario():
+        scheduler = SentinelScheduler(["security", "operations", "compliance"], scan=fake_scan)
+        task = asyncio.create_task(scheduler.run())
+        await asyncio.sleep(0.5)
+        initial = sorted(scans)
+        scans.clear()
+
+        def burst():
+            for _ in range(5):
+                bump_table_versions(["transactions"])
+
+        thread = threading.Thread(target=burst)
+        thread.start()
+        thread.join()
+        await asyncio.sleep(0.5)
+        snapshot = scheduler.snapshot()
+        task.cancel()
+        return initial, sorted(scans), snapshot
+
+    settings = get_settings()
+    with (
+        patch.object(settings, "sentinel_scheduler_debounce_seconds", 0.1),
+        patch.object(settings, "sentinel_scheduler_min_interval_seconds", 0.0),
+        patch.object(settings, "sentinel_scheduler_max_interval_seconds", 60.0),
+    ):
+        initial, triggered, snapshot = asyncio.run(scenario())
+
+    assert initial == ["compliance", "operations", "security"]
+    # compliance only reads users and login_events, so a transactions burst leaves it alone
+    assert "transactions" not in snapshot["compliance"]["tables"]
+    assert triggered == ["operations", "security"]
+    assert snapshot["security"]["scans"] == 2
+
+
+def test_sentinel_scheduler_cancels_running_scans_on_shutdown(client) -> None:
+    started = threading.Event()
+
+    def slow_scan(domain):
+        started.set()
+        time.sleep(0.5)
+        return {"risk_score": 0}
+
+    async def scenario():
+        scheduler = SentinelScheduler(["security", "operations"], scan=slow_scan)
+        task = asyncio.create_task(scheduler.run())
+        while not started.is_set():
+            await asyncio.sleep(0.01)
+        during = scheduler.snapshot()
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        return during, scheduler.snapshot()
+
+    with patch.object(get_settings(), "sentinel_scheduler_concurrency", 2):
+        during, after = asyncio.run(scenario())
+
+    assert during["security"]["running"] and during["operations"]["running"]
+    assert not after["security"]["running"] and not after["operations"]["running"]
+    assert after["security"]["scans"] == after["operations"]["scans"] == 0
+
+
+def test_sentinel_incremental_scans_only_wait_for_shared_missions(client) -> None:
+    def scan(domain):
+        with SessionLocalPrimary() as db:
+            run_scan(db, domain, incremental=True)
+
+    # security and risk share failed_logins; operations has no mission in common with either
+    with sentinel_engine._locked_cursors(["failed_logins"]):
+        disjoint = threading.Thread(target=scan, args=("operations",))
+        overlapping = threading.Thread(target=scan, args=("risk",))
+        disjoint.start()
+        overlapping.start()
+        disjoint.join(timeout=10)
+        overlapping.join(timeout=0.5)
+        assert not disjoint.is_alive()
+        assert overlapping.is_alive()
+    overlapping.join(timeout=10)
+    assert not overlapping.is_alive()
+
+
+def test_sentinel_history_stores_compact_findings_and_paginates(client) -> None:
+    scans = [client.get("/api/v1/sentinel/scan?domain=operations").json()["data"] for _ in range(3)]
+
+    for scan in scans:
+        detail = client.get(f"/api/v1/sentinel/history/{scan['scan_id']}").json()["data"]
+        assert [f["mission_id"] for f in detail["findings"]] == [f["mission_id"] for f in scan["findings"]]
+        for stored, original in zip(detail["findings"], scan["findings"]):
+            assert stored.get("risk") == original.get("risk")
+            if "rows" in original:
+                assert len(stored["rows"]) == min(len(original["rows"]), get_settings().sentinel_history_rows)
+
+    with SessionLocalPrimary() as db:
+        record = db.execute(select(ScanHistory).where(ScanHistory.scan_id == scans[-1]["scan_id"])).scalar_one()
+        assert "findings" not in record.result_json
+        encodings = db.execute(
+            select(ScanFinding.encoding).where(ScanFinding.scan_id == scans[-1]["scan_id"])
+        ).scalars().all()
+        # Unchanged samples are stored as references to the domain's last full copy
+        assert "delta" in encodings
+
+    with SessionLocalPrimary() as db:
+        page, _cursor = list_history(db, limit=2)
+        assert all("result_json" in inspect(h).unloaded for h in page)
+
+    first = client.get("/api/v1/sentinel/history?limit=2").json()["data"]
+    assert len(first["history"]) == 2
+    second = client.get(f"/api/v1/sentinel/history?limit=2&before={first['next_cursor']}").json()["data"]
+    first_ids = {h["scan_id"] for h in first["history"]}
+    assert second["history"] and not first_ids & {h["scan_id"] for h in second["history"]}
+
+
+def test_sentinel_stream_shares_running_scans_and_resumes_by_event_id(client) -> None:
+    release = threading.Event()
+    calls = []
+
+    def fake_stream(db, domain, columnar=False, incremental=False):
+        calls.append(domain)
+        yield "status", {"status": "started", "domain": domain}
+        release.wait(5)
+        yield "mission", {"mission_id": "failed_logins", "status": "completed"}
+        yield "complete", {"scan_id": "abc", "domain": domain}
+
+    broadcaster = ScanBroadcaster()
+    with patch("app.services.sentinel.broadcast.run_scan_stream", side_effect=fake_stream):
+        first = broadcaster.join("security")
+        second = broadcaster.join("security")
+        assert first is second
+
+        follower = first.follow(heartbeat=0.05)
+        assert next(follower).startswith(f"id: {first.id}:0\nevent: status".encode())
+        # Nothing new while the scan is busy, so the client gets a comment line to keep the connection open
+        assert next(follower) == b": keep-alive\n\n"
+        release.set()
+        rest = list(follower)
+        assert [frame.split(b"\n")[1] for frame in rest] == [b"event: mission", b"event: complete"]
+
+        resumed, after = broadcaster.resume(f"{first.id}:1")
+        assert resumed is first
+        replay = list(resumed.follow(after))
+        assert len(replay) == 1 and b"event: complete" in replay[0]
+        assert calls == ["security"]
+
+        # A finished scan is not reused; the next client starts a fresh one
+        assert broadcaster.join("security") is not first
+
+
+def test_sentinel_correlates_failed_login_followed_by_flagged_transaction(client) -> None:
+    now = datetime.utcnow()
+    with SessionLocalPrimary() as db:
+        users = [User(name="Correlated", email=f"{uuid.uuid4().hex}@example.com") for _ in range(2)]
+        db.add_all(users)
+        db.flush()
+        quick, slow = users[0].id, users[1].id
+        db.add_all([
+            LoginEvent(user_id=quick, ip_address="10.7.7.7", success=0, created_at=now - timedelta(minutes=10)),
+            Transaction(user_id=quick, amount=900.0, status="flagged", created_at=now - timedelta(minutes=5)),
+            LoginEvent(user_id=slow, ip_address="10.7.7.8", success=0, created_at=now - timedelta(hours=3)),
+            Transaction(user_id=slow, amount=50.0, status="flagged", created_at=now - timedelta(minutes=1)),
+        ])
+        db.commit()
+
+    with patch.object(get_settings(), "sentinel_correlation_batch_size", 1), SessionLocalPrimary() as db:
+        correlation = correlate_failed_then_flagged(db, window_minutes=30)
+    entities = {entity["user_id"]: entity for entity in correlation["entities"]}
+    assert correlation["batches"] >= 2
+    assert entities[quick]["correlated"] == 1
+    assert entities[quick]["min_gap_minutes"] == 5.0
+    assert slow not in entities
+
+    data = client.get("/api/v1/sentinel/scan?domain=security").json()["data"]
+    finding = next(f for f in data["findings"] if f["mission_id"] == "correlation_failed_flagged")
+    assert finding["row_count"] == len(entities)
+    assert finding["risk"] > 0
+    assert all(row["correlated"] >= 1 for row in finding["rows"])